@@ -0,0 +1,205 @@
+"""Content-addressed cache of NLP results, shared by threads, processes and restarts.
+
+Entries are keyed by a hash of the text and of everything the result depends
+on: the model name and version, its load options and, for merged spans, the
+trait dictionary version (see nlp_utils.cache_key). A new model or dictionary
+therefore never serves stale results; old entries simply age out.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID
+"""
+_INDEX = "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+
+# Only record a read if the entry's access time is older than this, so hot
+# entries do not turn every cache hit into a write. Hits on the in-memory
+# layer are recorded the same way, so entries that stay hot in memory are
+# not evicted from disk.
+_TOUCH_INTERVAL = 60.0
+# Run eviction once every this many writes
+_EVICT_EVERY = 1000
+
+
+def make_key(*parts: str) -> str:
+    """sha256 hex digest of the given key parts."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class AnnotationCache:
+    """SQLite (WAL mode) store of JSON results with an in-process LRU in front.
+
+    Values are kept serialized, both on disk and in memory, and every get()
+    decodes a new copy. Callers may modify what they get back without
+    affecting the cache or other requests. get_raw()/put_raw() read and
+    write the serialized JSON text directly, for callers that already have it.
+
+    Args:
+        path: SQLite file shared by all processes; None keeps entries in memory only.
+        max_entries: Least recently used entries beyond this are evicted from disk.
+        memory_entries: Size of the per-process LRU in front of the disk store.
+    """
+
+    def __init__(self, path: Optional[str], max_entries: Optional[int] = None,
+                 memory_entries: int = 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self._writes = 0
+        # key -> (serialized value, access time last recorded on disk)
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path:
+            with self._conn() as conn:
+                conn.execute(_SCHEMA)
+                conn.execute(_INDEX)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Close this thread's connection; the next call opens a new one."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _remember(self, key: str, data: str, accessed: float) -> None:
+        with self._lock:
+            self._memory[key] = (data, accessed)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, str]:
+        """Return {key: serialized value} for the keys that are cached."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, str] = {}
+        now = time.time()
+        stale = []
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None:
+                    data, accessed = entry
+                    self._memory.move_to_end(key)
+                    found[key] = data
+                    if self.path and now - accessed > _TOUCH_INTERVAL:
+                        self._memory[key] = (data, now)
+                        stale.append((now, key))
+            self.memory_hits += len(found)
+
+        missing = [k for k in keys if k not in found]
+        if missing and self.path:
+            conn = self._conn()
+            for i in range(0, len(missing), 500):  # stay below SQLite's parameter limit
+                chunk = missing[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT key, data, accessed FROM results WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall()
+                for key, data, accessed in rows:
+                    found[key] = data
+                    if now - accessed > _TOUCH_INTERVAL:
+                        stale.append((now, key))
+                        accessed = now
+                    self._remember(key, data, accessed)
+        if stale:
+            with self._conn() as conn:
+                conn.executemany("UPDATE results SET accessed = ? WHERE key = ?", stale)
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Return {key: value} for the keys that are cached."""
+        return {key: json.loads(data) for key, data in self._lookup(keys).items()}
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a copy of the cached value, or None."""
+        return self.get_many([key]).get(key)
+
+    def get_raw(self, key: str) -> Optional[str]:
+        """Return the cached value as the JSON text it is stored as, or None."""
+        return self._lookup([key]).get(key)
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]) -> None:
+        """Store (key, value) pairs; values must be JSON serializable."""
+        self._store([(key, json.dumps(value)) for key, value in items])
+
+    def put_raw(self, key: str, data: str) -> None:
+        """Store a value that is already serialized as JSON text, without encoding it again."""
+        self._store([(key, data)])
+
+    def _store(self, rows: List[Tuple[str, str]]) -> None:
+        if not rows:
+            return
+        now = time.time()
+        for key, data in rows:
+            self._remember(key, data, now)
+        if not self.path:
+            return
+        with self._conn() as conn:
+            conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                             [(key, data, now) for key, data in rows])
+        with self._lock:
+            before = self._writes
+            self._writes += len(rows)
+            evict = before // _EVICT_EVERY != self._writes // _EVICT_EVERY
+        if evict:
+            self.evict()
+
+    def put(self, key: str, value: Any) -> None:
+        self.put_many([(key, value)])
+
+    def __len__(self) -> int:
+        if not self.path:
+            return len(self._memory)
+        return self._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop the least recently used entries beyond max_entries."""
+        if not self.path or not self.max_entries:
+            return 0
+        with self._conn() as conn:
+            return conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of this process (hits include memory_hits)."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
@@ -0,0 +1,234 @@
+"""Persistent store of precomputed annotations for the local corpus.
+
+Annotations (merged model + dictionary spans and entity statistics) are
+keyed by PMID, NER pipeline version (model name, installed version and
+pipeline options, see nlp_utils.pipeline_version) and trait dictionary
+version, and each row records a hash of the title and abstract it was made
+from. A new model, pipeline mode, dictionary or paper text therefore never
+serves stale results. Build the store ahead of time with:
+
+    python annotation_store.py build --n-process 4
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from annotation_cache import make_key
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (
+    pmid TEXT NOT NULL,
+    pipeline TEXT NOT NULL,
+    dict_version TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    title_spans TEXT NOT NULL,
+    abstract_spans TEXT NOT NULL,
+    entity_statistics TEXT NOT NULL,
+    PRIMARY KEY (pmid, pipeline, dict_version)
+) WITHOUT ROWID
+"""
+
+
+def text_hash(paper: Dict) -> str:
+    """Hash of the title and abstract a paper's annotations are made from."""
+    return make_key(paper.get("Title", ""), paper.get("Abstract", ""))
+
+
+class AnnotationStore:
+    """SQLite-backed annotation store; safe to share between threads and processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(annotations)")]
+            if columns and "text_hash" not in columns:
+                # Stores from before text hashes cannot be checked against the papers
+                print(f"Dropping annotations in an old format from {path}; rebuild the store")
+                conn.execute("DROP TABLE annotations")
+            conn.execute(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Close this thread's connection; the next call opens a new one."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def get(self, pmid: str, pipeline: str, dict_version: str, paper_hash: str) -> Optional[Dict]:
+        """Return the stored annotations for a paper, or None.
+
+        Args:
+            pmid: PubMed ID.
+            pipeline: nlp_utils.pipeline_version("spans") of the running process.
+            dict_version: Trait dictionary version.
+            paper_hash: text_hash() of the paper as it is now; annotations
+                made from another title or abstract are not returned.
+        """
+        row = self._conn().execute(
+            "SELECT title_spans, abstract_spans, entity_statistics FROM annotations "
+            "WHERE pmid = ? AND pipeline = ? AND dict_version = ? AND text_hash = ?",
+            (pmid, pipeline, dict_version, paper_hash)).fetchone()
+        if row is None:
+            return None
+        return {
+            "title_spans": json.loads(row[0]),
+            "abstract_spans": json.loads(row[1]),
+            "entity_statistics": json.loads(row[2]),
+        }
+
+    def text_hashes(self, pipeline: str, dict_version: str) -> Dict[str, str]:
+        """Return PMID -> text hash of the papers annotated for a pipeline/dictionary version."""
+        rows = self._conn().execute(
+            "SELECT pmid, text_hash FROM annotations WHERE pipeline = ? AND dict_version = ?",
+            (pipeline, dict_version))
+        return dict(rows)
+
+    def statistics(self, pipeline: str, dict_version: str,
+                   batch_size: int = 1000) -> Iterator[Tuple[str, Dict]]:
+        """Yield (pmid, entity_statistics) for every paper of a pipeline/dictionary version."""
+        cur = self._conn().execute(
+            "SELECT pmid, entity_statistics FROM annotations WHERE pipeline = ? AND dict_version = ?",
+            (pipeline, dict_version))
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return
+            for pmid, stats in rows:
+                yield pmid, json.loads(stats)
+
+    def put_many(self, pipeline: str, dict_version: str,
+                 rows: Iterable[Tuple[str, str, List[Dict], List[Dict], Dict]]) -> int:
+        """Insert or replace (pmid, text_hash, title_spans, abstract_spans, entity_statistics) rows."""
+        data = [
+            (pmid, pipeline, dict_version, paper_hash, json.dumps(title_spans),
+             json.dumps(abstract_spans), json.dumps(stats))
+            for pmid, paper_hash, title_spans, abstract_spans, stats in rows
+        ]
+        with self._conn() as conn:
+            conn.executemany("INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?)", data)
+        return len(data)
+
+    def delete_stale(self, pipeline: str, dict_version: str) -> int:
+        """Remove annotations made with any other pipeline or dictionary version."""
+        with self._conn() as conn:
+            cur = conn.execute(
+                "DELETE FROM annotations WHERE pipeline != ? OR dict_version != ?",
+                (pipeline, dict_version))
+        return cur.rowcount
+
+
+def annotate_corpus(store: AnnotationStore, papers: Iterable[Dict], matcher,
+                    batch_size: int = 64, n_process: int = 1, chunk_size: int = 512,
+                    force: bool = False) -> int:
+    """Annotate papers and write them to the store in chunks.
+
+    Papers already in the store for the current pipeline and dictionary
+    version, with an unchanged title and abstract, are skipped unless force is
+    set, so an interrupted run can be resumed.
+
+    Returns:
+        int: Number of papers annotated.
+    """
+    import nlp_utils  # spaCy is only needed when annotating
+
+    pipeline = nlp_utils.pipeline_version("spans")
+    done = {} if force else store.text_hashes(pipeline, matcher.version)
+    total = 0
+
+    def flush(chunk):
+        texts = []
+        for paper in chunk:
+            texts.extend([paper.get("Title", ""), paper.get("Abstract", "")])
+        spans = nlp_utils.annotate_batch(texts, matcher=matcher,
+                                         batch_size=batch_size, n_process=n_process)
+        rows = []
+        for i, paper in enumerate(chunk):
+            title_spans, abstract_spans = spans[2 * i], spans[2 * i + 1]
+            stats = nlp_utils.entity_statistics(title_spans + abstract_spans)
+            rows.append((paper["PMID"], text_hash(paper), title_spans, abstract_spans, stats))
+        return store.put_many(pipeline, matcher.version, rows)
+
+    chunk = []
+    for paper in papers:
+        if "PMID" not in paper or done.get(paper["PMID"]) == text_hash(paper):
+            continue
+        chunk.append(paper)
+        if len(chunk) >= chunk_size:
+            total += flush(chunk)
+            print(f"Annotated {total} papers")
+            chunk = []
+    if chunk:
+        total += flush(chunk)
+    return total
+
+
+if __name__ == "__main__":
+    from trait_matcher import load_matcher
+
+    parser = argparse.ArgumentParser(description="Pre-annotate the local corpus")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="annotate the local corpus into the store")
+    build.add_argument("--data", default="QTL_text.json")
+    build.add_argument("--papers-db", default="papers.db", help="local paper store filled by ingest.py")
+    build.add_argument("--from-queue", action="store_true",
+                       help="annotate only papers queued by `ingest.py --queue-annotation`")
+    build.add_argument("--dictionary", default="Trait dictionary.txt")
+    build.add_argument("--index", default="trait_index.bin")
+    build.add_argument("--db", default="annotations.db")
+    build.add_argument("--batch-size", type=int, default=64)
+    build.add_argument("--n-process", type=int, default=os.cpu_count() or 1)
+    build.add_argument("--chunk-size", type=int, default=512)
+    build.add_argument("--force", action="store_true", help="re-annotate papers already stored")
+    build.add_argument("--prune", action="store_true",
+                       help="delete annotations from other pipeline/dictionary versions")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        trait_matcher = load_matcher(args.dictionary, args.index or None)
+        annotation_store = AnnotationStore(args.db)
+        t0 = time.perf_counter()
+
+        if args.from_queue:
+            from paper_store import PaperStore
+            paper_store = PaperStore(args.papers_db)
+            n = 0
+            while True:
+                queued = paper_store.queued(args.chunk_size)
+                if not queued:
+                    break
+                n += annotate_corpus(annotation_store, queued, trait_matcher,
+                                     batch_size=args.batch_size, n_process=args.n_process,
+                                     chunk_size=args.chunk_size, force=True)
+                paper_store.dequeue(p["PMID"] for p in queued)
+        else:
+            # The paper store holds the converted JSON corpus plus ingested papers
+            if os.path.exists(args.papers_db):
+                from paper_store import PaperStore
+                corpus = (p for _, p in PaperStore(args.papers_db).items())
+            else:
+                with open(args.data, "r", encoding="utf-8") as f:
+                    corpus = json.load(f)
+            n = annotate_corpus(annotation_store, corpus, trait_matcher,
+                                batch_size=args.batch_size, n_process=args.n_process,
+                                chunk_size=args.chunk_size, force=args.force)
+        print(f"Annotated {n} papers in {time.perf_counter() - t0:.1f}s "
+              f"(dictionary version {trait_matcher.version})")
+        if args.prune:
+            import nlp_utils
+            removed = annotation_store.delete_stale(nlp_utils.pipeline_version("spans"), trait_matcher.version)
+            print(f"Removed {removed} stale annotations")
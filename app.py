@@ -2,10 +2,27 @@ import json
 import os
 import re
 import html
-from typing import List, Dict
+import hmac
+import functools
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
+from typing import List, Dict, Optional
+import metrics
+import profiling
 import nlp_utils
-from flask import Flask, render_template, jsonify, request, send_from_directory
-from pubmed_utils import fetch_pubmed_paper, search_pubmed, configure as configure_pubmed, save_cache
+import export
+from trait_matcher import TraitMatcher, load_matcher
+from annotation_store import AnnotationStore, text_hash
+from annotation_cache import make_key as make_cache_key
+from search_index import SearchIndex, load_index as load_search_index
+from paper_store import PaperStore
+from inference import InferenceService, InferenceBusy, InferenceTimeout
+from flask import Flask, Response, render_template, jsonify, request, send_from_directory, send_file, g, has_request_context
+from pubmed_utils import fetch_pubmed_paper, fetch_pubmed_papers, search_pubmed, search_pubmed_ids, iter_pubmed_papers, configure as configure_pubmed, close_client, get_cache as get_pubmed_cache
 import urllib.parse # Make sure this import is present
 
 app = Flask(__name__)
@@ -20,72 +37,355 @@ if os.path.exists(CONFIG_PATH):
 else:
     CONFIG = {}
 
+NLP_CONFIG = CONFIG.get("nlp", {})
+# Source JSON of the local corpus, converted once into the paper store below
 QTL_JSON_PATH  = CONFIG.get("data_paths", {}).get("qtl_json", "QTL_text.json")
 TRAIT_DICT_PATH = CONFIG.get("data_paths", {}).get("trait_dictionary", "Trait dictionary.txt")
-
-# Configure PubMed utilities
-configure_pubmed(CONFIG)
+# Prebuilt, memory-mapped trait index shared by all worker processes ("" = build in memory)
+TRAIT_INDEX_PATH = CONFIG.get("data_paths", {}).get("trait_index", "trait_index.bin")
+# Local paper store: the converted QTL_text.json plus papers added by ingest.py
+PAPER_DB_PATH = CONFIG.get("data_paths", {}).get("paper_db", "papers.db")
+# Prebuilt, memory-mapped search index over the paper store ("" = build in memory)
+SEARCH_INDEX_PATH = CONFIG.get("data_paths", {}).get("search_index", "search_index.bin")
+# Precomputed annotations for the local corpus (see annotation_store.py)
+ANNOTATION_DB_PATH = CONFIG.get("data_paths", {}).get("annotation_db", "annotations.db")
+# Entity co-occurrence counts over the local corpus (see cooccurrence.py)
+COOCCURRENCE_PATH = CONFIG.get("data_paths", {}).get("cooccurrence", "cooccurrence.npz")
+# Entity postings lists for faceted search (see entity_index.py)
+ENTITY_INDEX_PATH = CONFIG.get("data_paths", {}).get("entity_index", "entity_index.npz")
+# Largest page size accepted by /search
+MAX_SEARCH_LIMIT = CONFIG.get("search", {}).get("max_limit", 200)
+# Seconds /search waits for PubMed before answering with the results it has
+SEARCH_DEADLINE = CONFIG.get("search", {}).get("deadline", 8.0)
+# Most PMIDs one /export request may name (query and corpus exports need the admin token)
+EXPORT_MAX_PMIDS = CONFIG.get("export", {}).get("max_pmids", 1000)
+# Seconds between checks of the dictionary file for changes (0 disables the watcher)
+DICT_WATCH_INTERVAL = CONFIG.get("trait_dictionary", {}).get("watch_interval", 0)
+# Token for /admin/* endpoints; admin endpoints are disabled when empty
+ADMIN_TOKEN = os.getenv("TRAITVIZ_ADMIN_TOKEN") or CONFIG.get("admin", {}).get("token", "")
+# Micro-batching worker processes for NER/parsing (see inference.py)
+INFERENCE_CONFIG = CONFIG.get("inference", {})
+# /metrics endpoint and Server-Timing response headers
+METRICS_CONFIG = CONFIG.get("metrics", {})
+# Opt-in per-request profiling for admins (see profiling.py)
+PROFILING_CONFIG = CONFIG.get("profiling", {})
+# Set by gunicorn.conf.py when the app is loaded in the master before forking workers
+PREFORK = os.getenv("TRAITVIZ_PREFORK") == "1"
+# Set by gunicorn.conf.py, with or without preloading. gunicorn's worker processes then take
+# the place of the inference pool; a pool per worker would hold workers x pool model copies.
+GUNICORN = os.getenv("TRAITVIZ_GUNICORN") == "1"
 
 # --- Data Loading ---
-qtl_data: Dict[str, Dict] = {}
-trait_list: List[str] = []
+paper_store: PaperStore = None
+trait_matcher = TraitMatcher([])
+annotation_store = None
+cooccurrence_index = None
+entity_index = None
+search_index = SearchIndex()
+_trait_reload_lock = threading.Lock()
+# Runs PubMed searches next to the local search; a search that misses the deadline finishes here
+_pubmed_search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pubmed-search")
+
+def load_traits(load_indexes: bool = True) -> TraitMatcher:
+    """(Re)loads the trait dictionary and swaps in the matcher for its current version.
+
+    The swap is a single reference assignment, so requests already in flight
+    finish with the matcher they started with. When the version changes, the
+    indexes built from precomputed annotations are loaded again, since they
+    only apply to one dictionary version.
+    """
+    global trait_matcher
+    if not os.path.exists(TRAIT_DICT_PATH):
+        return trait_matcher
+    with _trait_reload_lock:
+        matcher = load_matcher(TRAIT_DICT_PATH, TRAIT_INDEX_PATH or None)
+        changed = matcher.version != trait_matcher.version
+        if changed:
+            print(f"Loaded trait dictionary version {matcher.version} ({len(matcher)} traits)")
+        trait_matcher = matcher
+        nlp_utils.set_trait_dictionary(TRAIT_DICT_PATH, matcher.version)
+    if changed and load_indexes:
+        load_annotation_indexes()
+    return trait_matcher
+
+def _built_for_current_versions(index, path: str) -> bool:
+    """Whether an index was built from annotations of the current NER pipeline and dictionary."""
+    expected = (nlp_utils.pipeline_version("spans"), trait_matcher.version)
+    if (index.model, index.dict_version) == expected:
+        return True
+    print(f"Not using {path}: it was built for another NER pipeline or trait dictionary "
+          f"version (dictionary {index.dict_version or 'unknown'}, current {trait_matcher.version}); "
+          f"rebuild it")
+    return False
+
+def load_annotation_indexes():
+    """Loads the indexes built from the annotation store, if they match the current versions.
+
+    An index built for another pipeline or dictionary version is not used
+    (the endpoints answer 503 until it is rebuilt), like a stale search index
+    is not. Each index is swapped in with a single assignment.
+    """
+    global cooccurrence_index, entity_index
+    index = None
+    if COOCCURRENCE_PATH and os.path.exists(COOCCURRENCE_PATH):
+        from cooccurrence import CooccurrenceIndex  # scipy is only needed when the index exists
+        index = CooccurrenceIndex.load(COOCCURRENCE_PATH)
+        if _built_for_current_versions(index, COOCCURRENCE_PATH):
+            print(f"Loaded co-occurrence index of {len(index)} entities")
+        else:
+            index = None
+    cooccurrence_index = index
+
+    index = None
+    if ENTITY_INDEX_PATH and os.path.exists(ENTITY_INDEX_PATH):
+        from entity_index import EntityIndex
+        index = EntityIndex.load(ENTITY_INDEX_PATH)
+        if _built_for_current_versions(index, ENTITY_INDEX_PATH):
+            print(f"Loaded entity index of {len(index)} papers")
+        else:
+            index = None
+    entity_index = index
 
 def load_data():
     """Loads QTL data and trait dictionary from files."""
-    global qtl_data, trait_list
-    if os.path.exists(QTL_JSON_PATH):
-        with open(QTL_JSON_PATH, "r", encoding="utf-8") as f:
-            qtl_data_list = json.load(f)
-        qtl_data = {item["PMID"]: item for item in qtl_data_list if "PMID" in item}
-    if os.path.exists(TRAIT_DICT_PATH):
-        with open(TRAIT_DICT_PATH, "r", encoding="utf-8") as f:
-            trait_list = [ln.strip() for ln in f if ln.strip()]
-# Load data when the application starts
-load_data()
-
-
-from nlp_utils import render_displacy
+    global paper_store, annotation_store, search_index
+    paper_store = PaperStore(PAPER_DB_PATH)
+    # One-time conversion of the JSON corpus; afterwards papers are read from disk on demand
+    if os.path.exists(QTL_JSON_PATH) and len(paper_store) == 0:
+        count = paper_store.import_json(QTL_JSON_PATH)
+        print(f"Converted {count} papers from {QTL_JSON_PATH} into {PAPER_DB_PATH}")
+    search_index = load_search_index(SEARCH_INDEX_PATH or None, paper_store)
+    if ANNOTATION_DB_PATH and os.path.exists(ANNOTATION_DB_PATH):
+        annotation_store = AnnotationStore(ANNOTATION_DB_PATH)
+    # The dictionary version is needed to check the annotation indexes
+    load_traits(load_indexes=False)
+    load_annotation_indexes()
+
+def _watch_trait_dictionary(interval: float):
+    """Polls the dictionary file and reloads the matcher when it changes."""
+    def mtime():
+        try:
+            return os.stat(TRAIT_DICT_PATH).st_mtime_ns
+        except OSError:
+            return None
+
+    last_mtime = mtime()
+    while True:
+        time.sleep(interval)
+        current = mtime()
+        if current is None or current == last_mtime:
+            continue
+        last_mtime = current
+        try:
+            load_traits()
+        except Exception as e:
+            print(f"Error reloading trait dictionary: {e}")
+
+def start_dictionary_watcher():
+    """Starts the dictionary watcher thread, if configured."""
+    if DICT_WATCH_INTERVAL:
+        threading.Thread(target=_watch_trait_dictionary, args=(DICT_WATCH_INTERVAL,),
+                         name="trait-dictionary-watcher", daemon=True).start()
+
+def init_app():
+    """Loads the data and models and starts the background threads of this process."""
+    # Configure PubMed utilities
+    configure_pubmed(CONFIG)
+    # Configure the shared NER/parse result cache
+    nlp_utils.configure(CONFIG)
+    load_data()
+    if INFERENCE_CONFIG.get("enabled", False) and GUNICORN:
+        print("inference.enabled is ignored under gunicorn: each worker process runs spaCy itself")
+    # Models load on first use unless warmup is enabled (always, in the prefork master)
+    if NLP_CONFIG.get("warmup", False) or PREFORK:
+        nlp_utils.warmup()
+    # The prefork master starts no threads; each worker starts its own (see after_fork)
+    if not PREFORK:
+        start_dictionary_watcher()
+
+# Spawned inference workers re-import this file as __mp_main__ when it is run as a
+# script (python app.py). They only run spaCy, so they skip the data, models and threads.
+if __name__ != "__mp_main__":
+    init_app()
+
+# --- Prefork Serving (gunicorn.conf.py) ---
+def before_fork():
+    """Closes what the gunicorn master must not share with its workers.
+
+    SQLite connections and pooled HTTP connections cannot be used from two
+    processes, so they are closed here and each worker opens its own on
+    first use. Everything loaded above stays shared copy-on-write.
+    """
+    close_client()
+    for store in (paper_store, annotation_store, get_pubmed_cache(), nlp_utils.annotation_cache()):
+        if store is not None:
+            store.close()
+
+def after_fork():
+    """Starts a worker's background threads, which do not survive the fork."""
+    start_dictionary_watcher()
+
+# --- Inference Workers ---
+inference_service: InferenceService = None
+_inference_lock = threading.Lock()
+
+def get_inference_service() -> InferenceService:
+    """Returns the shared inference service, or None to run spaCy in the request thread.
+
+    The service starts on first use. If its workers cannot start (for example
+    when a model is missing), requests fall back to running spaCy in the
+    request thread (see InferenceService.broken). Under gunicorn there is no
+    service: its worker processes already run spaCy in parallel.
+    """
+    global inference_service
+    if not INFERENCE_CONFIG.get("enabled", False) or GUNICORN:
+        return None
+    if inference_service is None:
+        with _inference_lock:
+            if inference_service is None:
+                inference_service = InferenceService(
+                    workers=INFERENCE_CONFIG.get("workers", 2),
+                    max_batch=INFERENCE_CONFIG.get("max_batch", 16),
+                    max_wait_ms=INFERENCE_CONFIG.get("max_wait_ms", 5),
+                    max_queue=INFERENCE_CONFIG.get("max_queue", 256),
+                    timeout=INFERENCE_CONFIG.get("timeout", 30))
+                atexit.register(inference_service.shutdown)
+    return inference_service
+
+@app.errorhandler(InferenceBusy)
+def inference_busy(e):
+    response = jsonify({"error": f"Server busy, please retry: {e}"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+@app.errorhandler(InferenceTimeout)
+def inference_timeout(e):
+    return jsonify({"error": str(e)}), 504
+
+# --- Metrics ---
+REQUEST_SECONDS = metrics.histogram("traitviz_request_seconds", "Request latency by route",
+                                    ["route", "method", "status"])
+STAGE_SECONDS = metrics.histogram("traitviz_stage_seconds", "Time spent in each stage of a request",
+                                  ["route", "stage"])
+
+def _route_label() -> str:
+    """The matched URL rule, so path parameters do not create new label values."""
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+def record_stage(route: str, stage: str, seconds: float, timings: Dict[str, float]) -> None:
+    """Records the time spent in one stage of a request, for the histogram and Server-Timing."""
+    STAGE_SECONDS.observe(seconds, route=route, stage=stage)
+    timings[stage] = timings.get(stage, 0.0) + seconds
+
+def finish_request(route: str, method: str, status: int, elapsed: float,
+                   timings: Dict[str, float]) -> Optional[str]:
+    """Records a finished request; returns its Server-Timing header value (None if disabled).
+
+    Used by the Flask hooks below and by the async routes in asgi.py.
+    """
+    REQUEST_SECONDS.observe(elapsed, route=route, method=method, status=status)
+    if not METRICS_CONFIG.get("server_timing", True):
+        return None
+    entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={elapsed * 1000:.2f}")
+    return ", ".join(entries)
+
+@contextmanager
+def timed(stage: str):
+    """Times a block as one stage of the current request (histogram + Server-Timing)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context():
+            record_stage(_route_label(), stage, time.perf_counter() - start,
+                         g.setdefault("stage_timings", {}))
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.get("request_start", time.perf_counter())
+    server_timing = finish_request(_route_label(), request.method, response.status_code,
+                                   elapsed, g.get("stage_timings", {}))
+    if server_timing is not None:
+        response.headers["Server-Timing"] = server_timing
+    return response
+
+def _collect_metrics():
+    """Cache counters, model load stats and inference queue state for /metrics."""
+    pubmed_cache = get_pubmed_cache()
+    if pubmed_cache is not None:
+        yield ("traitviz_pubmed_cache_hits_total", "counter", "PubMed cache hits", [({}, pubmed_cache.hits)])
+        yield ("traitviz_pubmed_cache_misses_total", "counter", "PubMed cache misses", [({}, pubmed_cache.misses)])
+    cache = nlp_utils.annotation_cache()
+    if cache is not None:
+        stats = cache.stats()
+        yield ("traitviz_annotation_cache_hits_total", "counter", "Annotation cache hits",
+               [({"layer": "memory"}, stats["memory_hits"]),
+                ({"layer": "disk"}, stats["hits"] - stats["memory_hits"])])
+        yield ("traitviz_annotation_cache_misses_total", "counter", "Annotation cache misses",
+               [({}, stats["misses"])])
+    model_stats = nlp_utils.model_stats()
+    yield ("traitviz_model_load_seconds", "gauge", "Time taken to load each spaCy model",
+           [({"model": name}, s["load_seconds"]) for name, s in model_stats.items()])
+    yield ("traitviz_model_rss_megabytes", "gauge", "Resident memory added by loading each model",
+           [({"model": name}, s["rss_mb"]) for name, s in model_stats.items()])
+    yield ("traitviz_trait_dictionary_traits", "gauge", "Traits in the loaded dictionary",
+           [({"version": trait_matcher.version}, len(trait_matcher))])
+    if inference_service is not None:
+        stats = inference_service.stats()
+        yield ("traitviz_inference_queued", "gauge", "Texts waiting for an inference worker",
+               [({}, stats["queued"])])
+        yield ("traitviz_inference_requests_total", "counter", "Texts sent to inference workers",
+               [({}, stats["requests"])])
+        yield ("traitviz_inference_batches_total", "counter", "Batches sent to inference workers",
+               [({}, stats["batches"])])
+
+metrics.register_collector(_collect_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics of this worker process."""
+    if not METRICS_CONFIG.get("enabled", True):
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def _is_admin_request() -> bool:
+    """Checks the X-Admin-Token header against the configured admin token."""
+    supplied = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(supplied, ADMIN_TOKEN)
+
+
+from nlp_utils import render_dependencies, deduplicate
 
 @app.route('/displacy', methods=['POST'])
 def displacy_endpoint():
+    """displaCy SVG for a sentence (prefer /parse, which also returns the parse)."""
     data = request.json
     sentence = data.get("text", "").strip()
     if not sentence:
         return jsonify({"error": "Text required"}), 400
     try:
-        html = render_displacy(sentence)
+        # Rendered from the cached parse, so /parse_sentence + /displacy parse only once
+        parse_data = get_sentence_dependencies(re.sub(r'\s+', ' ', sentence))
+        if parse_data.get("error"):
+            return jsonify({"error": parse_data["error"]}), 500
+        with timed("render"):
+            html = render_dependencies(parse_data)
         return jsonify({"html": html})
+    except (InferenceBusy, InferenceTimeout):
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-# ---------- dictionary matcher ----------
-def dict_matches(text: str) -> List[Dict]:
-    matches = []
-    for trait in trait_list:
-        pattern = rf"\b{re.escape(trait)}\b"
-        for m in re.finditer(pattern, text, flags=re.IGNORECASE):
-            matches.append({
-                "start": m.start(),
-                "end": m.end(),
-                "label": "TRAIT",
-                "term": m.group(0),
-                "source": "dictionary"
-            })
-    return matches
-
 # ---------- helpers ----------
-def deduplicate(matches: List[Dict]) -> List[Dict]:
-    """Remove overlaps; keep longer span then earlier span."""
-    matches.sort(key=lambda d: (d["start"], -(d["end"]-d["start"])))
-    out, last_end = [], -1
-    for m in matches:
-        if m["start"] >= last_end:
-            out.append(m)
-            last_end = m["end"]
-    return out
-
 COLOR_MAP = CONFIG.get("visualization", {}).get("entity_colors", {})
+# Part of every /visualize ETag; bump when the response format (or how it is cached) changes
+VISUALIZE_FORMAT = "2"
 
 def span_html(text: str, spans: List[Dict]) -> str:
     if not spans:
@@ -119,58 +419,113 @@ def span_html(text: str, spans: List[Dict]) -> str:
         cur = sp["end"]
     buf.append(html.escape(text[cur:]))
     return "".join(buf)
+# --- Request Profiling ---
+_profile_store = None
+
+def get_profile_store() -> "profiling.ProfileStore":
+    global _profile_store
+    if _profile_store is None:
+        _profile_store = profiling.ProfileStore(PROFILING_CONFIG.get("directory", "profiles"),
+                                                PROFILING_CONFIG.get("max_files", 50))
+    return _profile_store
+
+def profiled(view):
+    """Lets an admin run one request of this route under a profiler.
+
+    Add ?profile=sample (or cprofile) or an X-Profile header, together with
+    X-Admin-Token. The normal response is returned with an X-Profile header
+    naming the stored profile; fetch it from /admin/profiles/<name>.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = request.args.get("profile") or request.headers.get("X-Profile")
+        if not mode:
+            return view(*args, **kwargs)
+        if not PROFILING_CONFIG.get("enabled", False) or not _is_admin_request():
+            return jsonify({"error": "Profiling requires admin access and profiling.enabled"}), 403
+        mode = "sample" if mode in ("1", "true") else mode
+        if mode not in profiling.MODES:
+            return jsonify({"error": f"Unknown profile mode: {mode}"}), 400
+
+        result, data, extension = profiling.profile_call(
+            lambda: app.make_response(view(*args, **kwargs)), mode,
+            PROFILING_CONFIG.get("interval_ms", 2))
+        label = "-".join([request.endpoint] + [str(v) for v in kwargs.values()])
+        name = get_profile_store().save(label, data, extension)
+        result.headers["X-Profile"] = name
+        return result
+    return wrapper
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Stored request profiles, newest first."""
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify({"profiles": get_profile_store().list()})
+
+@app.route('/admin/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    """Downloads one stored profile."""
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    path = get_profile_store().path(name)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(os.path.abspath(path), mimetype="application/octet-stream",
+                     as_attachment=True, download_name=name)
+
 # --- Trait Finding Logic ---
-def find_traits(text: str, trait_list: list[str]) -> list[dict]:
+def find_traits(text: str, matcher: TraitMatcher = None) -> list[dict]:
     """Finds occurrences of traits in the text using dictionary matching."""
-    if not text or not trait_list:
+    if not text:
         return []
+    if matcher is None:
+        matcher = trait_matcher
+    return matcher.find(text)
 
-    all_matches = []
-    for trait in trait_list:
-        try:
-            if not trait:
-                continue
-            # Use word boundaries for exact matching, case-insensitive
-            pattern = r'(?<!\w)' + re.escape(trait) + r'(?!\w)'
-            for match in re.finditer(pattern, text, re.IGNORECASE):
-                all_matches.append({
-                    'start': match.start(),
-                    'end': match.end(),
-                    'label': 'TRAIT',
-                    'term': match.group(0),
-                    'source': 'dictionary'
-                })
-        except re.error as e:
-            print(f"Regex error for trait '{trait}': {e}")
-            continue
 
-    if not all_matches:
-        return []
+def build_visualization(pmid: str, paper: Dict, combined_title: List[Dict],
+                        combined_abs: List[Dict], source: str, entity_stats: Dict = None) -> Dict:
+    """Builds the /visualize response body from a paper and its merged spans."""
+    title, abstract = paper.get("Title", ""), paper.get("Abstract", "")
 
-    # Sort matches primarily by start index, secondarily by end index (longer matches first)
-    all_matches.sort(key=lambda x: (x['start'], -x['end']))
+    # Statistics may come precomputed from the annotation store
+    if entity_stats is None:
+        with timed("statistics"):
+            entity_stats = nlp_utils.entity_statistics(combined_title + combined_abs)
 
-    # Filter out overlapping matches, keeping the longest one that starts first
-    filtered_matches = []
-    last_match_end = -1
+    # Format author information
+    author_display = ""
+    if paper.get("Authors"):
+        authors = paper.get("Authors", [])
+        author_names = [author.get("name", "") for author in authors]
+        author_display = ", ".join(author_names)
 
-    for match in all_matches:
-        # Only add if the current match starts after or at the end of the last added match
-        if match['start'] >= last_match_end:
-            filtered_matches.append(match)
-            last_match_end = match['end']
-        # Optional: If you prefer keeping the longest match even if it overlaps slightly later
-        # elif match['end'] > last_match_end:
-        #    # Check if this match is significantly longer and replaces the previous one
-        #    # This logic can become complex, stick to non-overlapping for simplicity first
-        #    pass
+    with timed("span_html"):
+        viz_title_html = span_html(title, combined_title)
+        viz_abstract_html = span_html(abstract, combined_abs)
 
-    return filtered_matches
+    return {
+        "pmid": pmid,
+        "title": title,
+        "abstract": abstract,
+        "journal": paper.get("Journal", "N/A"),
+        "authors": paper.get("Authors", []),  # Full author data
+        "author_display": author_display,    # Formatted author string
+        "publication_date": paper.get("PublicationDate", ""),
+        "source": source,
+        "viz_title_html": viz_title_html,
+        "viz_abstract_html": viz_abstract_html,
+        "entity_statistics": entity_stats
+    }
 
 
 # --- Dependency Parsing ---
 def get_sentence_dependencies(text):
     """Get dependency parse for a sentence using spaCy"""
+    service = get_inference_service()
+    if service is not None:
+        return service.dependencies(text)
     return nlp_utils.get_dependencies(text)
 
 # --- Flask Routes ---
@@ -186,85 +541,222 @@ def landing_page():
 def visualizer_app():
     """Serves the main annotation visualizer page (visualizer.html)."""
     # Pass necessary counts to the template
-    return render_template("visualizer.html", num_papers=len(qtl_data), num_traits=len(trait_list))
+    return render_template("visualizer.html", num_papers=len(paper_store), num_traits=len(trait_matcher))
 
 @app.route('/static/<path:path>')
 def serve_static(path):
     return send_from_directory('static', path)
 
+def visualize_etag(pmid: str, paper: Dict, source: str, matcher: TraitMatcher) -> str:
+    """Strong ETag of a /visualize response.
+
+    It covers everything the response depends on: the paper content, the NER
+    model, the trait dictionary version and the entity colors.
+    """
+    return make_cache_key("visualize", VISUALIZE_FORMAT, pmid, source,
+                          json.dumps(paper, sort_keys=True), nlp_utils.pipeline_version("spans"),
+                          matcher.version, json.dumps(COLOR_MAP, sort_keys=True))
+
 @app.route("/visualize", methods=["POST"])
+@profiled
 def visualize():
     pmid = request.form.get("pmid", "").strip()
     if not pmid:
         return jsonify({"error": "PMID required"}), 400
-
-    paper = qtl_data.get(pmid) or fetch_pubmed_paper(pmid)
+    return visualize_response(pmid)
+
+@app.route("/visualize/<pmid>", methods=["GET"])
+@profiled
+def visualize_get(pmid):
+    """Cacheable variant of /visualize; supports If-None-Match."""
+    return visualize_response(pmid.strip())
+
+def visualize_response(pmid: str):
+    """Builds the /visualize response, answering repeat views from the response cache."""
+    with timed("paper_store"):
+        paper = paper_store.get(pmid)
+    source = "local" if paper is not None else "pubmed"
+    if paper is None:
+        with timed("pubmed_fetch"):
+            paper = fetch_pubmed_paper(pmid)
     if paper is None:
         return jsonify({"error": f"PMID {pmid} not found"}), 404
 
+    # Use one dictionary version for the whole request, even if it is reloaded meanwhile
+    matcher = trait_matcher
+    etag = visualize_etag(pmid, paper, source, matcher)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        # The ETag changes with the dictionary or model, so old entries are never served
+        cache = nlp_utils.annotation_cache()
+        with timed("response_cache"):
+            body = cache.get_raw(etag) if cache is not None else None
+        if body is None:
+            data = visualize_paper(pmid, paper, source, matcher)
+            with timed("serialize"):
+                body = app.json.dumps(data)
+            if cache is not None:
+                cache.put_raw(etag, body)
+        response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    # Clients may keep the response but must revalidate, since a dictionary reload changes it
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def visualize_paper(pmid: str, paper: Dict, source: str, matcher: TraitMatcher) -> Dict:
+    """Annotates one paper and returns the /visualize response data."""
     title, abstract = paper.get("Title", ""), paper.get("Abstract", "")
 
-    # Process annotations using both NER and dictionary matching
-    title_ner_matches = nlp_utils.ner(title)
-    title_dict_matches = find_traits(title, trait_list) # Use find_traits here
-    combined_title = deduplicate(title_ner_matches + title_dict_matches)
-
-    abstract_ner_matches = nlp_utils.ner(abstract)
-    abstract_dict_matches = find_traits(abstract, trait_list) # Use find_traits here
-    combined_abs = deduplicate(abstract_ner_matches + abstract_dict_matches)
-
-    # Generate statistics for each entity type
-    entity_stats = {}
-    for entity in combined_title + combined_abs:
-        label = entity["label"]
-        source = entity.get("source", "model") # Get source
-        term = entity["term"].lower()
-
-        if label not in entity_stats:
-            entity_stats[label] = {"count": 0, "terms": {}, "sources": {"model": 0, "dictionary": 0}}
-
-        entity_stats[label]["count"] += 1
-        entity_stats[label]["sources"][source] += 1 # Increment source count
-
-        if term not in entity_stats[label]["terms"]:
-            entity_stats[label]["terms"][term] = {"count": 0, "sources": {"model": 0, "dictionary": 0}}
-
-        entity_stats[label]["terms"][term]["count"] += 1
-        entity_stats[label]["terms"][term]["sources"][source] += 1 # Increment term source count
-
-    # Format author information
-    author_display = ""
-    if paper.get("Authors"):
-        authors = paper.get("Authors", [])
-        author_names = [author.get("name", "") for author in authors]
-        author_display = ", ".join(author_names)
+    # Local papers are served from the precomputed store when it has this pipeline/dictionary
+    # version and was annotated from the same title and abstract
+    if source == "local" and annotation_store is not None:
+        with timed("annotation_store"):
+            stored = annotation_store.get(pmid, nlp_utils.pipeline_version("spans"), matcher.version,
+                                          text_hash(paper))
+        if stored is not None:
+            return build_visualization(pmid, paper, stored["title_spans"], stored["abstract_spans"],
+                                       source, stored["entity_statistics"])
 
-    # Convert term dictionaries to sorted lists
-    for label in entity_stats:
-        terms_dict = entity_stats[label]["terms"]
-        # Sort by frequency, then alphabetically
-        entity_stats[label]["terms"] = [
-            {"term": term, "count": details["count"], "sources": details["sources"]} # Include sources
-            for term, details in sorted(
-                terms_dict.items(),
-                key=lambda x: (-x[1]["count"], x[0]) # Sort by count desc, then term asc
-            )
-        ]
+    # Process annotations using both NER and dictionary matching
+    service = get_inference_service()
+    if service is None and nlp_utils.dictionary_in_pipeline():
+        # One nlp.pipe pass finds model entities and dictionary traits together
+        with timed("annotate"):
+            combined_title, combined_abs = nlp_utils.annotate_batch([title, abstract], matcher=matcher)
+        return build_visualization(pmid, paper, combined_title, combined_abs, source)
+
+    with timed("ner"):
+        if service is not None:
+            # Title and abstract are queued together and can share a batch
+            title_ner_matches, abstract_ner_matches = service.map("ner", [title, abstract])
+        else:
+            title_ner_matches = nlp_utils.ner(title)
+            abstract_ner_matches = nlp_utils.ner(abstract)
+
+    with timed("find_traits"):
+        title_dict_matches = find_traits(title, matcher)
+        abstract_dict_matches = find_traits(abstract, matcher)
+
+    with timed("deduplicate"):
+        combined_title = deduplicate(title_ner_matches + title_dict_matches)
+        combined_abs = deduplicate(abstract_ner_matches + abstract_dict_matches)
+
+    return build_visualization(pmid, paper, combined_title, combined_abs, source)
+
+
+@app.route("/visualize_batch", methods=["POST"])
+def visualize_batch():
+    """Annotates many PMIDs and/or raw documents in one nlp.pipe pass.
+
+    JSON body: {"pmids": [...], "documents": [{"id", "title", "abstract"} or "text", ...],
+    "batch_size": int}. Each result has the same shape as /visualize. The number of
+    processes comes from the nlp config only, so a request cannot fork extra workers.
+    """
+    data = request.get_json(silent=True) or {}
+    pmids = [str(p).strip() for p in data.get("pmids", []) if str(p).strip()]
+    documents = data.get("documents", [])
+    if not pmids and not documents:
+        return jsonify({"error": "pmids or documents required"}), 400
+
+    max_documents = NLP_CONFIG.get("max_batch_documents", 1000)
+    if len(pmids) + len(documents) > max_documents:
+        return jsonify({"error": f"At most {max_documents} documents per batch"}), 400
 
+    try:
+        batch_size = int(data.get("batch_size", NLP_CONFIG.get("batch_size", 64)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "batch_size must be an integer"}), 400
+    batch_size = max(1, batch_size)
+    n_process = max(1, min(int(NLP_CONFIG.get("n_process", 1)), os.cpu_count() or 1))
+
+    # (id, paper, source) for every document we could resolve
+    items, errors = [], []
+    with timed("paper_store"):
+        local = {pmid: paper_store.get(pmid) for pmid in pmids}
+    missing = [pmid for pmid, paper in local.items() if paper is None]
+    fetched = {}
+    if missing:
+        # One efetch request per chunk of PMIDs instead of one per paper
+        with timed("pubmed_fetch"):
+            fetched = fetch_pubmed_papers(missing)
+    for pmid in pmids:
+        paper, source = local[pmid], "local"
+        if paper is None:
+            paper, source = fetched.get(pmid), "pubmed"
+        if paper is None:
+            errors.append({"pmid": pmid, "error": f"PMID {pmid} not found"})
+            continue
+        items.append((pmid, paper, source))
+    for i, doc in enumerate(documents):
+        if isinstance(doc, str):
+            doc = {"abstract": doc}
+        if not isinstance(doc, dict):
+            errors.append({"index": i, "error": "Document must be a string or an object"})
+            continue
+        doc_id = str(doc.get("id", f"doc-{i}"))
+        paper = {"Title": doc.get("title", ""), "Abstract": doc.get("abstract", doc.get("text", ""))}
+        items.append((doc_id, paper, "text"))
+
+    # Titles and abstracts go through the pipeline together: [t0, a0, t1, a1, ...]
+    texts = []
+    for _, paper, _ in items:
+        texts.extend([paper.get("Title", ""), paper.get("Abstract", "")])
+    with timed("annotate_batch"):
+        spans = nlp_utils.annotate_batch(texts, matcher=trait_matcher,
+                                         batch_size=batch_size, n_process=n_process)
+
+    results = [
+        build_visualization(doc_id, paper, spans[2 * i], spans[2 * i + 1], source)
+        for i, (doc_id, paper, source) in enumerate(items)
+    ]
+    return jsonify({"results": results, "errors": errors, "count": len(results)})
+
+
+@app.route("/export", methods=["POST"])
+def export_papers():
+    """Streams annotations for many papers as JSONL, BioC XML or a BRAT tar archive.
+
+    JSON body: one of {"pmids": [...]}, {"query": "..."} (every local search
+    result) or {"corpus": true}, plus "format" ("jsonl", "bioc" or "brat")
+    and "gzip" (bool). Papers are annotated and sent in chunks, reusing
+    precomputed annotations for local papers (see export.py).
+
+    Query and corpus exports can cover the whole corpus and need the admin
+    token; a PMID list may name at most export.max_pmids papers.
+    """
+    data = request.get_json(silent=True) or {}
+    fmt = data.get("format", "jsonl")
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(export.FORMATS)}"}), 400
+    compress = bool(data.get("gzip", False))
+
+    if data.get("pmids"):
+        if not isinstance(data["pmids"], list):
+            return jsonify({"error": "pmids must be a list"}), 400
+        pmids = [str(p).strip() for p in data["pmids"] if str(p).strip()]
+        if len(pmids) > EXPORT_MAX_PMIDS:
+            return jsonify({"error": f"At most {EXPORT_MAX_PMIDS} PMIDs per export"}), 413
+        papers = export.iter_papers(pmids, paper_store)
+    elif (data.get("query") or data.get("corpus")) and not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    elif data.get("query"):
+        with timed("local_search"):
+            hits, _ = search_index.search(str(data["query"]), limit=max(1, len(search_index)))
+        papers = export.iter_papers((pmid for pmid, _ in hits), paper_store, fetch_remote=False)
+    elif data.get("corpus"):
+        papers = ((pmid, paper, "local") for pmid, paper in paper_store.items())
+    else:
+        return jsonify({"error": "pmids, query or corpus required"}), 400
+
+    records = export.annotate_papers(papers, trait_matcher, annotation_store,
+                                     batch_size=NLP_CONFIG.get("batch_size", 64),
+                                     n_process=NLP_CONFIG.get("n_process", 1))
+    return Response(export.encode(records, fmt, compress),
+                    mimetype="application/gzip" if compress else export.MEDIA_TYPES[fmt],
+                    headers={"Content-Disposition": f'attachment; filename="{export.filename(fmt, compress)}"',
+                             "X-Accel-Buffering": "no"})
 
-    return jsonify({
-        "pmid": pmid,
-        "title": title,
-        "abstract": abstract,
-        "journal": paper.get("Journal", "N/A"),
-        "authors": paper.get("Authors", []),  # Full author data
-        "author_display": author_display,    # Formatted author string
-        "publication_date": paper.get("PublicationDate", ""),
-        "source": "local" if pmid in qtl_data else "pubmed",
-        "viz_title_html": span_html(title, combined_title),
-        "viz_abstract_html": span_html(abstract, combined_abs),
-        "entity_statistics": entity_stats
-    })
 
 @app.route('/get_entity_info', methods=['POST'])
 def get_entity_info():
@@ -315,30 +807,151 @@ def get_entity_info():
     return jsonify(entity_info)
 
 
-@app.route('/parse_sentence', methods=['POST'])
-def parse_sentence():
-    """Get dependency parsing for a sentence"""
-    data = request.json
+@app.route('/admin/reload_dictionary', methods=['POST'])
+def reload_dictionary():
+    """Rebuilds the trait index from the dictionary file and swaps it in without a restart."""
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+
+    previous_version = trait_matcher.version
+    try:
+        matcher = load_traits()
+    except Exception as e:
+        app.logger.error(f"Error reloading trait dictionary: {e}")
+        return jsonify({"error": f"Reload failed: {e}"}), 500
+
+    return jsonify({
+        "previous_version": previous_version,
+        "version": matcher.version,
+        "num_traits": len(matcher),
+        "reloaded": matcher.version != previous_version
+    })
+
+
+@app.route('/entity_search', methods=['GET'])
+def entity_search():
+    """Finds local papers by the entities they mention, with facet counts.
+
+    Query parameters:
+    - entity (repeatable): "LABEL:term", e.g. "GENE_OR_GENE_PRODUCT:lep", or a
+      bare term, which matches it under any label
+    - op: "and" (default; papers mentioning every entity) or "or"
+    - label (repeatable): papers must also mention some entity with this label
+    - offset, limit: pagination (newest PMID first)
+    - facets: top terms per label to count over all matches (default 10, 0 for none)
+    """
+    if entity_index is None:
+        return jsonify({"error": "Entity index not built for the current NER pipeline and "
+                                 "dictionary (python entity_index.py build)"}), 503
+    entities = [e.strip() for e in request.args.getlist('entity') if e.strip()]
+    labels = [l.strip() for l in request.args.getlist('label') if l.strip()]
+    op = request.args.get('op', 'and').lower()
+    if op not in ('and', 'or'):
+        return jsonify({"error": "op must be and or or"}), 400
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(max(1, int(request.args.get('limit', 50))), MAX_SEARCH_LIMIT)
+        facet_terms = min(max(0, int(request.args.get('facets', 10))), 100)
+    except ValueError:
+        return jsonify({"error": "offset, limit and facets must be integers"}), 400
+
+    with timed("entity_search"):
+        found = entity_index.search(entities, op, labels, offset, limit, facet_terms)
+    results = []
+    with timed("paper_store"):
+        for pmid in found["pmids"]:
+            paper = paper_store.get(pmid, {})
+            results.append({
+                'pmid': pmid,
+                'title': paper.get('Title', 'No title'),
+                'journal': paper.get('Journal', 'No journal info'),
+                'source': 'local'
+            })
+    return jsonify({
+        'results': results,
+        'count': len(results),
+        'total': found["total"],
+        'offset': offset,
+        'limit': limit,
+        'facets': found["facets"],
+    })
+
+
+@app.route('/cooccurrence', methods=['GET'])
+def cooccurrence():
+    """Top-k entities that co-occur with a term across the local corpus.
+
+    Query parameters: term (required), label (defaults to the term's most
+    frequent label), k (default 10), score ("pmi", "npmi" or "count") and
+    min_count (minimum number of shared papers, default 3).
+    """
+    if cooccurrence_index is None:
+        return jsonify({"error": "Co-occurrence index not built for the current NER pipeline and "
+                                 "dictionary (python cooccurrence.py build)"}), 503
+    term = request.args.get('term', '').strip()
+    if not term:
+        return jsonify({"error": "term required"}), 400
+    score = request.args.get('score', 'pmi')
+    if score not in ('count', 'pmi', 'npmi'):
+        return jsonify({"error": "score must be pmi, npmi or count"}), 400
+    try:
+        k = min(max(1, int(request.args.get('k', 10))), 1000)
+        min_count = max(1, int(request.args.get('min_count', 3)))
+    except ValueError:
+        return jsonify({"error": "k and min_count must be integers"}), 400
+
+    with timed("cooccurrence"):
+        result = cooccurrence_index.neighbors(term, request.args.get('label') or None, k, score, min_count)
+    if result is None:
+        return jsonify({"error": f"No co-occurrence data for '{term}'"}), 404
+    result["papers"] = cooccurrence_index.n_papers
+    return jsonify(result)
+
+
+@app.route('/admin/cache_stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters of this worker's annotation and PubMed caches."""
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+
+    cache = nlp_utils.annotation_cache()
+    pubmed_cache = get_pubmed_cache()
+    return jsonify({
+        "pid": os.getpid(),
+        "annotation_cache": dict(cache.stats(), entries=len(cache)) if cache is not None else None,
+        "pubmed_cache": {"hits": pubmed_cache.hits, "misses": pubmed_cache.misses,
+                         "entries": len(pubmed_cache)} if pubmed_cache is not None else None,
+        "inference": inference_service.stats() if inference_service is not None else None
+    })
+
+
+def read_sentence(data) -> tuple:
+    """Validates a {"text": ...} request body; returns (cleaned sentence, None) or (None, error response)."""
     if not data or 'text' not in data:
-        return jsonify({"error": "Sentence text required"}), 400
+        return None, (jsonify({"error": "Sentence text required"}), 400)
 
     sentence = data['text'].strip()
     if not sentence:
-        return jsonify({"error": "Empty sentence"}), 400
+        return None, (jsonify({"error": "Empty sentence"}), 400)
+
+    # Ensure text is clean before parsing
+    cleaned_sentence = re.sub(r'\s+', ' ', sentence).strip()
+    if len(cleaned_sentence) > 1000: # Add a length limit for safety/performance
+        return None, (jsonify({"error": "Sentence too long for parsing."}), 400)
+    return cleaned_sentence, None
+
+@app.route('/parse_sentence', methods=['POST'])
+@profiled
+def parse_sentence():
+    """Get dependency parsing for a sentence"""
+    sentence, error = read_sentence(request.json)
+    if error:
+        return error
 
     # Get dependency parse
     try:
-        # Ensure text is clean before parsing
-        cleaned_sentence = re.sub(r'\s+', ' ', sentence).strip()
-        if len(cleaned_sentence) > 1000: # Add a length limit for safety/performance
-             return jsonify({"error": "Sentence too long for parsing."}), 400
-
-        parse_data = get_sentence_dependencies(cleaned_sentence)
-        # --- DEBUGGING: Log the data being sent to the frontend ---
-        import logging
-        app.logger.setLevel(logging.DEBUG) # Ensure debug messages are shown
-        app.logger.debug(f"Parse data for frontend: {json.dumps(parse_data, indent=2)}")
-        # --- END DEBUGGING ---
+        with timed("dependencies"):
+            parse_data = get_sentence_dependencies(sentence)
 
         # Check if parsing returned an error structure
         if parse_data.get("error"):
@@ -350,99 +963,273 @@ def parse_sentence():
 
         return jsonify(parse_data)
 
+    except (InferenceBusy, InferenceTimeout):
+        raise  # answered with 503/504 by the error handlers
     except Exception as e:
         # Log the exception for debugging
         app.logger.error(f"Error parsing sentence '{sentence[:50]}...': {str(e)}")
         return jsonify({"error": f"An unexpected error occurred during sentence parsing: {str(e)}"}), 500
 
+@app.route('/parse', methods=['POST'])
+@profiled
+def parse():
+    """Parses a sentence once and returns both the parse and its displaCy SVG.
+
+    The response is the /parse_sentence result (tokens, arcs, text) plus
+    "html", the SVG that /displacy would return. The parse comes from the
+    annotation cache when the sentence has been parsed before. Send
+    {"svg": false} to leave out "html", e.g. when the client draws the
+    arcs itself.
+    """
+    data = request.json
+    sentence, error = read_sentence(data)
+    if error:
+        return error
 
-@app.route('/search', methods=['POST'])
-def search():
-    """Searches for papers by keyword."""
-    if not request.form or 'term' not in request.form:
-        return jsonify({'error': 'Missing search term in request form.'}), 400
+    try:
+        with timed("dependencies"):
+            parse_data = get_sentence_dependencies(sentence)
+        if parse_data.get("error"):
+            return jsonify(parse_data), 200  # same convention as /parse_sentence
 
-    search_term = request.form.get('term').strip()
-    search_scope = request.form.get('scope', 'local')  # Options: local, pubmed, both
-    start_date = request.form.get('start_date') # Get start date (YYYY-MM-DD)
-    end_date = request.form.get('end_date')     # Get end date (YYYY-MM-DD)
+        if data.get("svg", True):
+            with timed("render"):
+                parse_data = dict(parse_data, html=render_dependencies(parse_data))
+        return jsonify(parse_data)
 
+    except (InferenceBusy, InferenceTimeout):
+        raise
+    except Exception as e:
+        app.logger.error(f"Error parsing sentence '{sentence[:50]}...': {str(e)}")
+        return jsonify({"error": f"An unexpected error occurred during sentence parsing: {str(e)}"}), 500
+
+
+def parse_search_form(form) -> tuple:
+    """Validates /search form fields; returns (params, None) or (None, error message)."""
+    if not form or 'term' not in form:
+        return None, 'Missing search term in request form.'
+
+    search_term = form.get('term').strip()
     if not search_term:
-        return jsonify({'error': 'Search term cannot be empty.'}), 400
+        return None, 'Search term cannot be empty.'
 
-    # First search local data
-    local_results = []
-    if search_scope in ['local', 'both']:
-        search_term_lower = search_term.lower()
-        for pmid, paper in qtl_data.items():
-            title = paper.get('Title', '').lower()
-            abstract = paper.get('Abstract', '').lower()
-            # More robust search: check if term is a whole word or substring
-            # Using 'in' for substring matching. For whole word, use regex: rf'\b{re.escape(search_term_lower)}\b'
-            if search_term_lower in title or search_term_lower in abstract:
-                local_results.append({
-                    'pmid': pmid,
-                    'title': paper.get('Title', 'No title'),
-                    'journal': paper.get('Journal', 'No journal info'),
-                    'source': 'local'
-                })
-
-    # Then search PubMed if requested
-    pubmed_results = []
-    if search_scope in ['pubmed', 'both']:
-        try:
-            max_results = CONFIG.get('pubmed_api', {}).get('max_search_results', 10)
-            # Pass dates to search_pubmed (implementation needed in pubmed_utils.py)
-            papers = search_pubmed(
-                search_term,
-                max_results=max_results,
-                start_date=start_date,
-                end_date=end_date
-            )
-            for paper in papers:
-                 # Avoid adding duplicates if already found locally
-                 if not any(r['pmid'] == paper.get('PMID', '') for r in local_results):
-                    pubmed_results.append({
-                        'pmid': paper.get('PMID', ''),
-                        'title': paper.get('Title', 'No title'),
-                        'journal': paper.get('Journal', 'No journal info'),
-                        'source': 'pubmed'
-                    })
-        except Exception as e:
-            # Log the error for debugging
-            app.logger.error(f"Error searching PubMed for term '{search_term}': {e}")
-            # Optionally inform the user about the PubMed search failure
-            # return jsonify({'error': f'PubMed search failed: {e}. Only local results shown.'}), 500
-            # Or just continue with local results silently
+    # Pagination over the ranked local results (default page matches the old 50-result cap)
+    try:
+        offset = max(0, int(form.get('offset', 0)))
+        limit = min(max(1, int(form.get('limit', 50))), MAX_SEARCH_LIMIT)
+    except ValueError:
+        return None, 'offset and limit must be integers.'
+
+    return {
+        'term': search_term,
+        'scope': form.get('scope', 'local'),  # Options: local, pubmed, both
+        'start_date': form.get('start_date'),  # YYYY-MM-DD
+        'end_date': form.get('end_date'),      # YYYY-MM-DD
+        'offset': offset,
+        'limit': limit,
+    }, None
+
+def wants_local_search(params: Dict) -> bool:
+    return params['scope'] in ['local', 'both']
+
+def wants_pubmed_search(params: Dict) -> bool:
+    # First page only; PubMed results are not paginated
+    return params['scope'] in ['pubmed', 'both'] and params['offset'] == 0
+
+def pubmed_search_args(params: Dict) -> Dict:
+    """Keyword arguments for search_pubmed/search_pubmed_async."""
+    return {
+        'max_results': CONFIG.get('pubmed_api', {}).get('max_search_results', 10),
+        'start_date': params['start_date'],
+        'end_date': params['end_date'],
+    }
 
-    # Combine results (local first, then PubMed)
-    all_results = local_results + pubmed_results
+def local_search(term: str, offset: int, limit: int) -> tuple:
+    """Searches the local inverted index (terms ANDed, "quoted phrases", BM25 ranking).
 
-    # Limit total results if necessary (e.g., to 50 total)
-    max_total_results = 50
-    if len(all_results) > max_total_results:
-        all_results = all_results[:max_total_results]
+    Returns:
+        tuple: (one page of result dicts, total number of local matches)
+    """
+    hits, total_local = search_index.search(term, offset=offset, limit=limit)
+    local_results = []
+    for pmid, score in hits:
+        paper = paper_store.get(pmid, {})
+        local_results.append({
+            'pmid': pmid,
+            'title': paper.get('Title', 'No title'),
+            'journal': paper.get('Journal', 'No journal info'),
+            'source': 'local',
+            'score': round(score, 4)
+        })
+    return local_results, total_local
+
+def pubmed_result(paper: Dict) -> Dict:
+    """A /search result entry for a PubMed paper."""
+    return {
+        'pmid': paper.get('PMID', ''),
+        'title': paper.get('Title', 'No title'),
+        'journal': paper.get('Journal', 'No journal info'),
+        'source': 'pubmed'
+    }
 
+def search_payload(params: Dict, local_results: List[Dict], total_local: int,
+                   papers: List[Dict], timed_out: List[str]) -> Dict:
+    """Builds the /search response from local results and PubMed papers."""
+    pubmed_results = []
+    for paper in papers:
+        # Avoid adding duplicates if already found locally
+        if not any(r['pmid'] == paper.get('PMID', '') for r in local_results):
+            pubmed_results.append(pubmed_result(paper))
 
-    return jsonify({
+    # Combine results (local first, then PubMed), limited to the page size
+    all_results = (local_results + pubmed_results)[:params['limit']]
+
+    return {
         'results': all_results,
         'count': len(all_results),
         'local_count': len(local_results),
         'pubmed_count': len(pubmed_results),
-        'query': search_term, # Return the original query
-        'scope': search_scope # Return the scope used
-    })
+        'total_local': total_local, # All local matches, for pagination
+        'offset': params['offset'],
+        'limit': params['limit'],
+        'query': params['term'], # Return the original query
+        'scope': params['scope'], # Return the scope used
+        'partial': bool(timed_out), # True if a source missed the search deadline
+        'timed_out': timed_out
+    }
 
+@app.route('/search', methods=['POST'])
+@profiled
+def search():
+    """Searches for papers by keyword.
+
+    The PubMed search runs in the background while the local index is searched.
+    If it has not finished by the search deadline, the local results are
+    returned with partial set.
+    """
+    params, error = parse_search_form(request.form)
+    if error:
+        return jsonify({'error': error}), 400
+    deadline = time.monotonic() + SEARCH_DEADLINE
+
+    remote = None
+    if wants_pubmed_search(params):
+        remote = _pubmed_search_pool.submit(search_pubmed, params['term'], **pubmed_search_args(params))
+
+    local_results, total_local = [], 0
+    if wants_local_search(params):
+        with timed("local_search"):
+            local_results, total_local = local_search(params['term'], params['offset'], params['limit'])
+
+    papers, timed_out = [], []
+    if remote is not None:
+        with timed("pubmed_search"):
+            try:
+                papers = remote.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FuturesTimeoutError:
+                app.logger.warning(f"PubMed search for '{params['term']}' missed the {SEARCH_DEADLINE}s deadline")
+                timed_out.append('pubmed')
+            except Exception as e:
+                # Continue with local results only
+                app.logger.error(f"Error searching PubMed for term '{params['term']}': {e}")
+
+    return jsonify(search_payload(params, local_results, total_local, papers, timed_out))
+
+
+def stream_frame(frame: Dict, sse: bool) -> str:
+    """Encodes one /search/stream frame as an NDJSON line or a Server-Sent Event."""
+    data = json.dumps(frame)
+    if sse:
+        return f"event: {frame['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+@app.route('/search/stream', methods=['POST'])
+def search_stream():
+    """Streams search results as they are found.
+
+    Takes the same form fields as /search. The response is NDJSON, one JSON
+    object per line, or Server-Sent Events if the request accepts
+    text/event-stream. Frames, in order:
+    - {"type": "local", "results": [...], "total_local": n}, as soon as the
+      local index has been searched
+    - {"type": "pubmed", "result": {...}} for each PubMed paper, as soon as it
+      is found in the cache or received from efetch
+    - {"type": "summary", ...} with the other /search fields (count,
+      local_count, pubmed_count, partial, ...)
+    """
+    params, error = parse_search_form(request.form)
+    if error:
+        return jsonify({'error': error}), 400
+    sse = request.accept_mimetypes.best_match(
+        ['application/x-ndjson', 'text/event-stream']) == 'text/event-stream'
+    deadline = time.monotonic() + SEARCH_DEADLINE
+
+    # PubMed papers are fetched in the background and handed over through a queue
+    papers = None
+    stop = threading.Event()
+    if wants_pubmed_search(params):
+        papers = queue.Queue()
+        term, args = params['term'], pubmed_search_args(params)
+
+        def fetch_papers():
+            try:
+                for paper in iter_pubmed_papers(search_pubmed_ids(term, **args), stop):
+                    papers.put(paper)
+                    if stop.is_set():
+                        break
+            except Exception as e:
+                app.logger.error(f"Error searching PubMed for term '{term}': {e}")
+            finally:
+                papers.put(None)
+
+        _pubmed_search_pool.submit(fetch_papers)
+
+    local_results, total_local = [], 0
+    if wants_local_search(params):
+        with timed("local_search"):
+            local_results, total_local = local_search(params['term'], params['offset'], params['limit'])
+
+    def generate():
+        try:
+            yield stream_frame({'type': 'local', 'results': local_results, 'total_local': total_local}, sse)
+            received, timed_out = [], []
+            sent = len(local_results)
+            seen = {r['pmid'] for r in local_results}
+            while papers is not None:
+                try:
+                    paper = papers.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    app.logger.warning(f"PubMed search for '{params['term']}' missed the {SEARCH_DEADLINE}s deadline")
+                    timed_out.append('pubmed')
+                    break
+                if paper is None:
+                    break
+                received.append(paper)
+                result = pubmed_result(paper)
+                if result['pmid'] not in seen and sent < params['limit']:
+                    seen.add(result['pmid'])
+                    sent += 1
+                    yield stream_frame({'type': 'pubmed', 'result': result}, sse)
+
+            # Same totals as /search would have returned
+            summary = search_payload(params, local_results, total_local, received, timed_out)
+            del summary['results']
+            yield stream_frame(dict(type='summary', **summary), sse)
+        finally:
+            stop.set()  # client gone or deadline passed: no further efetch requests
+
+    return Response(generate(), mimetype='text/event-stream' if sse else 'application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # --- Main Execution ---
 if __name__ == '__main__':
-    import os, atexit
+    import os
     port  = int(os.getenv("PORT", 5000))         # 👈 new
     host  = os.getenv("HOST", "0.0.0.0")         # optional
     debug = CONFIG.get("server", {}).get("debug", False)
 
     print(f"Starting server on http://{host}:{port} (debug={debug})")
-    # Make sure cache is saved on exit if modified
-    atexit.register(save_cache)
+    # Close pooled PubMed connections on exit (cache entries are written as they arrive)
+    atexit.register(close_client)
     app.run(host=host, port=port, debug=debug)
     
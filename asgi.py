@@ -0,0 +1,187 @@
+"""ASGI entry point in which PubMed I/O does not block server workers.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+/search runs on the event loop. The local index search runs in a thread and
+the PubMed search with the async client, concurrently. Whatever has not
+finished by the search deadline is left out, and the response has "partial"
+set. For /visualize, GET /visualize/<pmid> and /visualize_batch, papers that
+are not in the local store are first fetched asynchronously into the PubMed
+cache. Concurrent lookups share efetch requests. The request then goes to
+the Flask view, which finds the paper in the cache.
+
+Every other route, and the CPU-bound annotation work, runs in the Flask app
+through a2wsgi's WSGIMiddleware, on a pool of threads (asgi.wsgi_threads).
+One process can therefore keep hundreds of PubMed lookups waiting while it
+serves local requests.
+"""
+import asyncio
+import io
+import re
+import time
+from typing import Dict, List, Optional
+from urllib.parse import unquote
+
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from werkzeug.wrappers import Request
+
+import app as webapp
+import pubmed_utils
+
+ASGI_CONFIG = webapp.CONFIG.get("asgi", {})
+# Runs Flask views (everything that is not PubMed I/O) on its own thread pool
+_flask = WSGIMiddleware(webapp.app, workers=ASGI_CONFIG.get("wsgi_threads", 16))
+_VISUALIZE_GET = re.compile(r"^/visualize/([^/]+)$")
+
+
+# --- ASGI <-> WSGI plumbing ---
+async def _read_body(receive) -> bytes:
+    body = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        body.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(body)
+
+
+def _request(scope: Dict, body: bytes) -> Request:
+    """Werkzeug request for an ASGI HTTP scope whose body has been read."""
+    return Request(build_environ(scope, io.BytesIO(body)))
+
+
+async def call_flask(scope: Dict, body: bytes, send) -> None:
+    """Run the Flask app for this request, streaming its response."""
+    async def receive():
+        # The body was read here already; hand it to the middleware in one message
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    await _flask(scope, receive, send)
+
+
+async def send_json(send, payload: Dict, status: int = 200, headers: Optional[List] = None) -> None:
+    body = webapp.app.json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# --- async routes ---
+async def search(scope: Dict, body: bytes, send) -> None:
+    """/search with the local and PubMed searches running concurrently under a deadline."""
+    started = time.perf_counter()
+    request = _request(scope, body)
+    if request.args.get("profile") or request.headers.get("X-Profile"):
+        return await call_flask(scope, body, send)  # profiled requests take the synchronous path
+
+    timings = {}
+
+    async def respond(payload, status):
+        # Same request metrics and Server-Timing header as the Flask routes
+        server_timing = webapp.finish_request("/search", "POST", status,
+                                              time.perf_counter() - started, timings)
+        headers = [(b"server-timing", server_timing.encode("latin1"))] if server_timing else []
+        await send_json(send, payload, status, headers)
+
+    params, error = webapp.parse_search_form(request.form)
+    if error:
+        return await respond({"error": error}, 400)
+
+    async def timed_task(stage, coro):
+        t0 = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            webapp.record_stage("/search", stage, time.perf_counter() - t0, timings)
+
+    tasks = {}
+    if webapp.wants_local_search(params):
+        tasks["local_search"] = asyncio.ensure_future(timed_task("local_search", asyncio.to_thread(
+            webapp.local_search, params["term"], params["offset"], params["limit"])))
+    if webapp.wants_pubmed_search(params):
+        tasks["pubmed_search"] = asyncio.ensure_future(timed_task("pubmed_search", (
+            pubmed_utils.search_pubmed_async(params["term"], **webapp.pubmed_search_args(params)))))
+
+    done, pending = (await asyncio.wait(tasks.values(), timeout=webapp.SEARCH_DEADLINE)
+                     if tasks else (set(), set()))
+    for task in pending:
+        task.cancel()
+
+    results, timed_out = {}, []
+    for stage, task in tasks.items():
+        if task in pending:
+            timed_out.append("local" if stage == "local_search" else "pubmed")
+            print(f"{stage} for '{params['term']}' missed the {webapp.SEARCH_DEADLINE}s deadline")
+        elif task.exception() is not None:
+            print(f"Error in {stage} for '{params['term']}': {task.exception()}")
+        else:
+            results[stage] = task.result()
+
+    local_results, total_local = results.get("local_search", ([], 0))
+    payload = webapp.search_payload(params, local_results, total_local,
+                                    results.get("pubmed_search", []), timed_out)
+    await respond(payload, 200)
+
+
+async def prefetch_papers(pmids: List[str]) -> None:
+    """Fetch papers missing from the local store into the PubMed cache, without blocking."""
+    if pubmed_utils.get_cache() is None:
+        return  # nowhere to keep them; the Flask view will fetch them itself
+    # Paper store lookups are SQLite queries; keep them off the event loop
+    remote = await asyncio.to_thread(
+        lambda: [pmid for pmid in pmids if pmid and pmid not in webapp.paper_store])
+    if remote:
+        await pubmed_utils.fetch_pubmed_papers_async(remote)
+
+
+def _requested_pmids(scope: Dict, body: bytes) -> List[str]:
+    """PMIDs named by a /visualize, GET /visualize/<pmid> or /visualize_batch request."""
+    match = _VISUALIZE_GET.match(scope["path"])
+    if match and scope["method"] == "GET":
+        return [unquote(match.group(1)).strip()]
+    request = _request(scope, body)
+    if scope["path"] == "/visualize" and scope["method"] == "POST":
+        return [request.form.get("pmid", "").strip()]
+    if scope["path"] == "/visualize_batch" and scope["method"] == "POST":
+        data = request.get_json(silent=True) or {}
+        pmids = data.get("pmids", []) if isinstance(data, dict) else []
+        return [str(p).strip() for p in pmids if str(p).strip()]
+    return []
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await pubmed_utils.close_async_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return  # websockets are not used
+
+    body = await _read_body(receive)
+    if scope["path"] == "/search" and scope["method"] == "POST":
+        return await search(scope, body, send)
+
+    pmids = _requested_pmids(scope, body)
+    if pmids:
+        try:
+            await prefetch_papers(pmids)
+        except Exception as e:
+            print(f"Error prefetching papers {pmids[:5]}: {e}")
+    await call_flask(scope, body, send)
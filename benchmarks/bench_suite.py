@@ -0,0 +1,312 @@
+"""Offline benchmark suite for the annotation and search hot paths.
+
+Usage:
+    python benchmarks/bench_suite.py --stub-model                 # run and print
+    python benchmarks/bench_suite.py --stub-model --save-baseline # store benchmarks/baseline.json
+    python benchmarks/bench_suite.py --stub-model --compare       # exit 1 on regression
+
+Stages: trait matching (1k, 5k and all traits), deduplicate, span_html, NER,
+dependency parsing and local search. Inputs are generated with a fixed seed
+from the trait dictionary and filler words, at several abstract sizes; pass
+--corpus QTL_text.json to sample real abstracts instead. With --stub-model,
+NER and parsing use a blank spaCy pipeline (entity ruler, trivial parser)
+instead of the scispaCy/en_core_web_sm models, so the suite runs without
+model downloads.
+
+Each stage is run --repeat times and the fastest run is kept. It reports
+throughput, latency percentiles (p50/p95/p99) and the peak memory traced by
+tracemalloc during one extra pass. --compare fails when
+a stage's p50 latency or peak memory exceeds the baseline by more than
+--threshold (default 20%).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from search_index import SearchIndex  # noqa: E402
+from trait_matcher import TraitMatcher, read_traits  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+FILLER = ("the of and in was were QTL mice rats strain chromosome locus gene "
+          "significant (P < 0.05) , ; associated with 5% increase F2 cross IGF1 "
+          "liver expression cattle pigs chickens marker interval").split()
+TEXT_SIZES = (50, 220, 800)  # words per abstract
+DICT_SIZES = (1000, 5000, None)  # None = the full dictionary
+SEARCH_SIZES = (1000, 10000)  # documents in the search index
+# (label, term) patterns of the stub entity ruler
+STUB_ENTITIES = [("GENE_OR_GENE_PRODUCT", "IGF1"), ("ORGANISM", "mice"), ("ORGANISM", "rats"),
+                 ("ORGANISM", "cattle"), ("ORGAN", "liver"), ("ORGANISM", "chickens")]
+
+
+# --- inputs ---
+def make_texts(traits: List[str], words: int, count: int, seed: int) -> List[str]:
+    """Synthetic abstracts with about 8% trait mentions."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        out = []
+        while len(out) < words:
+            out.extend(rng.choice(traits).split() if rng.random() < 0.08 else [rng.choice(FILLER)])
+        texts.append(" ".join(out[:words]))
+    return texts
+
+
+def sample_texts(corpus_path: str, words: int, count: int, seed: int) -> List[str]:
+    """Abstracts from a QTL_text.json-style file, cut or concatenated to `words` words."""
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        pool = [p["Abstract"].split() for p in json.load(f) if p.get("Abstract")]
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        out = []
+        while len(out) < words:
+            out.extend(rng.choice(pool))
+        texts.append(" ".join(out[:words]))
+    return texts
+
+
+def install_stub_models() -> None:
+    """Register blank spaCy pipelines under the model names nlp_utils loads."""
+    import spacy
+    from spacy.language import Language
+    import nlp_utils
+
+    @Language.component("bench_stub_parser")
+    def stub_parser(doc):
+        # Attach every token to the first token of its doc
+        for token in doc[1:]:
+            token.head = doc[0]
+            token.dep_ = "dep"
+        if len(doc):
+            doc[0].dep_ = "ROOT"
+        return doc
+
+    ner = spacy.blank("en")
+    ruler = ner.add_pipe("entity_ruler")
+    ruler.add_patterns([{"label": label, "pattern": term} for label, term in STUB_ENTITIES])
+    parser = spacy.blank("en")
+    parser.add_pipe("bench_stub_parser", name="parser")
+    nlp_utils._nlp_cache[nlp_utils.get_model_name()] = ner
+    nlp_utils._nlp_cache[nlp_utils.PARSER_MODEL] = parser
+
+
+def import_app():
+    """Import app.py from an empty working directory, so it starts without data files."""
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="bench_app_"))
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    # Measure the uncached code paths
+    app.nlp_utils.configure({"annotation_cache": {"enabled": False}})
+    return app
+
+
+# --- measurement ---
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def measure(fn: Callable, inputs: List, min_time: float, min_iters: int) -> Dict[str, float]:
+    """Call fn on inputs in turn until both min_time and min_iters are reached."""
+    for item in inputs[:3]:
+        fn(item)  # warm up caches and lazy imports
+    latencies = []
+    start = time.perf_counter()
+    i = 0
+    while i < min_iters or time.perf_counter() - start < min_time:
+        item = inputs[i % len(inputs)]
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+        i += 1
+    total = sum(latencies)
+
+    # Peak memory from a separate pass; tracing slows the calls down
+    tracemalloc.start()
+    for item in inputs[:20]:
+        fn(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "iterations": len(latencies),
+        "ops_per_s": round(len(latencies) / total, 1) if total else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+# --- suite ---
+def run_suite(args) -> Dict[str, Dict[str, float]]:
+    traits = read_traits(args.dictionary)
+    rng = random.Random(args.seed)
+    shuffled = traits[:]
+    rng.shuffle(shuffled)
+
+    def texts(words: int) -> List[str]:
+        if args.corpus:
+            return sample_texts(args.corpus, words, args.texts, args.seed)
+        return make_texts(traits, words, args.texts, args.seed)
+
+    inputs = {words: texts(words) for words in TEXT_SIZES}
+    full_matcher = TraitMatcher(traits)
+    results: Dict[str, Dict[str, float]] = {}
+
+    def wanted(name: str) -> bool:
+        return not args.stages or any(name.startswith(s) for s in args.stages)
+
+    def stage(name: str, fn: Callable, items: List) -> None:
+        if not wanted(name):
+            return
+        # Keep the fastest of several runs; it is the least disturbed by other load
+        runs = [measure(fn, items, args.min_time, args.min_iters) for _ in range(args.repeat)]
+        r = results[name] = min(runs, key=lambda run: run["p50_ms"])
+        print(f"{name:<42} {r['ops_per_s']:>10.1f}/s  p50 {r['p50_ms']:>9.3f} ms  "
+              f"p95 {r['p95_ms']:>9.3f} ms  p99 {r['p99_ms']:>9.3f} ms  peak {r['peak_kb']:>9.1f} KB")
+
+    # Trait matching at each dictionary size
+    for size in DICT_SIZES:
+        matcher = full_matcher if size is None else TraitMatcher(shuffled[:size])
+        label = "all" if size is None else size
+        for words in TEXT_SIZES:
+            stage(f"find_traits[dict={label},words={words}]", matcher.find, inputs[words])
+
+    # NLP stages: stubbed, real models, or skipped when the models are missing
+    import nlp_utils
+    if args.stub_model:
+        install_stub_models()
+    try:
+        nlp_utils.warmup()
+        nlp_available = True
+    except (OSError, ImportError) as e:
+        print(f"Skipping NER/parsing stages: {e} (use --stub-model)")
+        nlp_available = False
+
+    if nlp_available:
+        for words in TEXT_SIZES:
+            stage(f"ner[words={words}]", nlp_utils.ner, inputs[words])
+        for words in TEXT_SIZES[:2]:
+            stage(f"get_dependencies[words={words}]", nlp_utils._parse_dependencies, inputs[words])
+
+    # Merging and rendering, on model + dictionary spans of the same texts
+    app = import_app()
+    for words in TEXT_SIZES:
+        spans = [(text, (nlp_utils.ner(text) if nlp_available else []) + full_matcher.find(text))
+                 for text in inputs[words]]
+        stage(f"deduplicate[words={words}]", lambda item: nlp_utils.deduplicate(item[1]), spans)
+        merged = [(text, nlp_utils.deduplicate(s)) for text, s in spans]
+        stage(f"span_html[words={words}]", lambda item: app.span_html(*item), merged)
+
+    # Local search over synthetic corpora
+    queries = ["body weight", "QTL", '"fat mass" mice', "liver expression cattle", "nonexistentterm"]
+    for n_docs in SEARCH_SIZES:
+        if not wanted(f"search[docs={n_docs}]"):
+            continue  # skip building the index
+        docs = make_texts(traits, 120, n_docs, args.seed + n_docs)
+        index = SearchIndex.build((str(i), {"Title": doc[:80], "Abstract": doc})
+                                  for i, doc in enumerate(docs))
+        stage(f"search[docs={n_docs}]", lambda q: index.search(q, 0, 50), queries)
+    return results
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Return a description of every stage that regressed beyond threshold."""
+    regressions = []
+    print(f"\n{'stage':<42} {'p50 base':>10} {'p50 now':>10} {'change':>8}   {'peak change':>11}")
+    for name, now in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<42} {'(new)':>10}")
+            continue
+        change = now["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        mem_change = now["peak_kb"] / base["peak_kb"] - 1 if base["peak_kb"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(f"{name}: p50 {base['p50_ms']} -> {now['p50_ms']} ms ({change:+.0%})")
+            flag = "  REGRESSION"
+        if mem_change > threshold:
+            regressions.append(f"{name}: peak {base['peak_kb']} -> {now['peak_kb']} KB ({mem_change:+.0%})")
+            flag = "  REGRESSION"
+        print(f"{name:<42} {base['p50_ms']:>10.3f} {now['p50_ms']:>10.3f} {change:>+8.0%}   "
+              f"{mem_change:>+11.0%}{flag}")
+    return regressions
+
+
+def environment(args) -> Dict[str, str]:
+    """What the numbers depend on besides the code."""
+    import nlp_utils
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": str(os.cpu_count()),
+        "models": "stub" if args.stub_model else f"{nlp_utils.get_model_name()},{nlp_utils.PARSER_MODEL}",
+        "corpus": os.path.basename(args.corpus) if args.corpus else "synthetic",
+        "seed": str(args.seed),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dictionary", default=os.path.join(ROOT, "Trait dictionary.txt"))
+    parser.add_argument("--corpus", help="sample abstracts from this QTL_text.json-style file")
+    parser.add_argument("--stub-model", action="store_true",
+                        help="use blank spaCy pipelines instead of the real models")
+    parser.add_argument("--stages", nargs="*", help="only run stages whose name starts with one of these")
+    parser.add_argument("--texts", type=int, default=50, help="distinct abstracts per size")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds per stage")
+    parser.add_argument("--min-iters", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, metavar="PATH")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, metavar="PATH")
+    parser.add_argument("--threshold", type=float, default=0.20,
+                        help="allowed slowdown / memory growth before --compare fails")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args)
+    report = {"environment": environment(args), "results": results}
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Wrote {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != report["environment"]:
+            print("Warning: baseline was recorded in a different environment:")
+            for key, value in baseline.get("environment", {}).items():
+                if report["environment"].get(key) != value:
+                    print(f"  {key}: {value} -> {report['environment'].get(key)}")
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Per-abstract benchmark: old per-trait regex loop vs. TraitMatcher.
+
+Usage:
+    python benchmarks/bench_trait_matching.py [--abstracts 20] [--long 1000 10000 50000]
+
+Abstracts are sampled from QTL_text.json when it exists, otherwise they are
+generated from the trait dictionary and some filler text. The script also
+checks that both implementations return exactly the same spans.
+
+The long-text case times TraitMatcher alone on generated texts of --long
+words. Matching is a single pass, so the time per 1k words should stay
+flat as the texts grow; the script fails if it grows more than 3x.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from trait_matcher import TraitMatcher  # noqa: E402
+
+FILLER = ("the of and in was were QTL mice rats strain chromosome locus "
+          "significant (P < 0.05) , ; associated with 5% increase F2 cross").split()
+
+
+def legacy_find_traits(text, trait_list):
+    """The original app.find_traits implementation (one regex per trait)."""
+    all_matches = []
+    for trait in trait_list:
+        pattern = r'(?<!\w)' + re.escape(trait) + r'(?!\w)'
+        for match in re.finditer(pattern, text, re.IGNORECASE):
+            all_matches.append({
+                'start': match.start(),
+                'end': match.end(),
+                'label': 'TRAIT',
+                'term': match.group(0),
+                'source': 'dictionary'
+            })
+    all_matches.sort(key=lambda x: (x['start'], -x['end']))
+    filtered_matches, last_match_end = [], -1
+    for match in all_matches:
+        if match['start'] >= last_match_end:
+            filtered_matches.append(match)
+            last_match_end = match['end']
+    return filtered_matches
+
+
+def generate_text(words, trait_list, rng):
+    out = []
+    while len(out) < words:
+        out.append(rng.choice(trait_list) if rng.random() < 0.08 else rng.choice(FILLER))
+    return " ".join(out)
+
+
+def load_abstracts(count, trait_list, seed=0):
+    qtl_path = os.path.join(ROOT, "QTL_text.json")
+    if os.path.exists(qtl_path):
+        with open(qtl_path, "r", encoding="utf-8") as f:
+            papers = json.load(f)
+        texts = [p.get("Abstract", "") for p in papers if p.get("Abstract")]
+        random.Random(seed).shuffle(texts)
+        return texts[:count]
+
+    rng = random.Random(seed)
+    return [generate_text(220, trait_list, rng) for _ in range(count)]
+
+
+def bench_long_texts(matcher, trait_list, sizes, seed=0):
+    """Time the matcher on long texts; returns ms per 1k words for each size."""
+    rng = random.Random(seed)
+    per_kword = []
+    for words in sizes:
+        text = generate_text(words, trait_list, rng)
+        t0 = time.perf_counter()
+        matcher.find(text)
+        elapsed = time.perf_counter() - t0
+        per_kword.append(elapsed * 1000 / (words / 1000))
+        print(f"long text  : {words:>7} words {elapsed * 1000:10.1f} ms "
+              f"({per_kword[-1]:.2f} ms per 1k words)")
+    return per_kword
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--abstracts", type=int, default=20)
+    parser.add_argument("--dictionary", default=os.path.join(ROOT, "Trait dictionary.txt"))
+    parser.add_argument("--long", type=int, nargs="*", default=[1000, 10000, 50000],
+                        help="word counts of the long-text case")
+    args = parser.parse_args()
+
+    with open(args.dictionary, "r", encoding="utf-8") as f:
+        trait_list = [ln.strip() for ln in f if ln.strip()]
+
+    t0 = time.perf_counter()
+    matcher = TraitMatcher(trait_list)
+    build_s = time.perf_counter() - t0
+
+    abstracts = load_abstracts(args.abstracts, trait_list)
+
+    legacy_s = matcher_s = 0.0
+    for text in abstracts:
+        t0 = time.perf_counter()
+        expected = legacy_find_traits(text, trait_list)
+        t1 = time.perf_counter()
+        got = matcher.find(text)
+        t2 = time.perf_counter()
+        legacy_s += t1 - t0
+        matcher_s += t2 - t1
+        if got != expected:
+            print("MISMATCH on abstract:", text[:80])
+            return 1
+
+    n = len(abstracts)
+    print(f"traits: {len(trait_list)}  abstracts: {n}  matcher build: {build_s * 1000:.1f} ms")
+    print(f"regex loop : {legacy_s / n * 1000:10.2f} ms/abstract")
+    print(f"TraitMatcher: {matcher_s / n * 1000:10.3f} ms/abstract")
+    print(f"speedup    : {legacy_s / matcher_s:10.0f}x")
+
+    if args.long:
+        per_kword = bench_long_texts(matcher, trait_list, args.long)
+        if per_kword[-1] > 3 * per_kword[0]:
+            print("Matching time grows faster than the text length")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
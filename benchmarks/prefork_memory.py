@@ -0,0 +1,172 @@
+"""Per-worker memory of the gunicorn server, with and without loading in the master.
+
+Usage:
+    python benchmarks/prefork_memory.py                  # both modes, server.workers workers
+    python benchmarks/prefork_memory.py --workers 8 --requests 500
+
+For each mode the script starts `gunicorn -c gunicorn.conf.py` on a local
+port and waits until every worker is up. It records each worker's memory,
+sends --requests /visualize, /parse and /search requests, and records the
+memory again. Run it from the directory that holds config.json and the data
+files.
+
+Modes:
+- no-preload: every worker imports the app and loads its own data and models
+  (TRAITVIZ_PRELOAD=0)
+- preload: the master loads everything and freezes it out of the GC before forking
+
+RSS counts shared pages in every process that maps them, so summing it
+over workers overstates the total. PSS divides each shared page between
+the processes that map it, so the PSS column adds up to the real total.
+USS is the memory private to one worker. On Linux these come from
+/proc/<pid>/smaps_rollup (via psutil).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import httpx
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MB = 1024 * 1024
+
+
+def load_config() -> Dict:
+    if os.path.exists("config.json"):
+        with open("config.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def sample_pmids(config: Dict, count: int) -> List[str]:
+    """The first `count` PMIDs of the local paper store."""
+    from paper_store import PaperStore
+    path = config.get("data_paths", {}).get("paper_db", "papers.db")
+    if not os.path.exists(path):
+        return []
+    pmids = []
+    for pmid, _ in PaperStore(path).items():
+        pmids.append(pmid)
+        if len(pmids) >= count:
+            break
+    return pmids
+
+
+def memory(proc: psutil.Process) -> Dict[str, float]:
+    info = proc.memory_full_info()
+    return {"rss": info.rss / MB, "pss": getattr(info, "pss", 0) / MB, "uss": info.uss / MB}
+
+
+def wait_until_ready(master: psutil.Process, url: str, workers: int, timeout: float) -> List[psutil.Process]:
+    """Wait for all workers to answer and their memory to settle; returns the workers."""
+    deadline = time.monotonic() + timeout
+    last_total = None
+    while time.monotonic() < deadline:
+        if master.status() == psutil.STATUS_ZOMBIE or not master.is_running():
+            raise RuntimeError("gunicorn exited during startup")
+        children = master.children()
+        try:
+            up = httpx.get(url + "/", timeout=5).status_code == 200
+        except httpx.HTTPError:
+            up = False
+        if up and len(children) == workers:
+            # Workers that load the app themselves finish at different times
+            total = sum(memory(p)["rss"] for p in children)
+            if last_total is not None and abs(total - last_total) < 1:
+                return children
+            last_total = total
+        time.sleep(1)
+    raise TimeoutError(f"server not ready after {timeout}s")
+
+
+def send_load(url: str, pmids: List[str], terms: List[str], requests: int, concurrency: int) -> int:
+    """Send /visualize, /parse and /search requests spread over the workers; returns the failures."""
+    def one(i):
+        term = terms[i % len(terms)]
+        try:
+            if pmids and i % 4 < 2:
+                r = httpx.get(f"{url}/visualize/{pmids[i % len(pmids)]}", timeout=120)
+            elif i % 4 == 2:
+                r = httpx.post(f"{url}/parse", timeout=120,
+                               json={"text": f"{term} was associated with marker {i} in mice."})
+            else:
+                r = httpx.post(f"{url}/search", timeout=120, data={"term": term, "scope": "local"})
+            return r.status_code >= 500
+        except httpx.HTTPError:
+            return True
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return sum(pool.map(one, range(requests)))
+
+
+def run_mode(mode: str, args, pmids: List[str]) -> Dict:
+    url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, TRAITVIZ_PRELOAD="1" if mode == "preload" else "0")
+    cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+           "--pythonpath", ROOT, "--bind", f"127.0.0.1:{args.port}", "--workers", str(args.workers)]
+    server = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL,
+                              stderr=None if args.verbose else subprocess.DEVNULL)
+    try:
+        master = psutil.Process(server.pid)
+        t0 = time.perf_counter()
+        workers = wait_until_ready(master, url, args.workers, args.timeout)
+        startup = time.perf_counter() - t0
+        before = {p.pid: memory(p) for p in workers}
+        failures = send_load(url, pmids, args.terms, args.requests, args.concurrency)
+        after = {p.pid: memory(p) for p in workers if p.is_running()}
+        return {"mode": mode, "startup": startup, "master": memory(master),
+                "before": before, "after": after, "failures": failures}
+    finally:
+        server.terminate()
+        try:
+            server.wait(30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def print_report(result: Dict) -> None:
+    print(f"\n{result['mode']} (ready in {result['startup']:.1f}s, "
+          f"{result['failures']} failed requests)")
+    print(f"{'worker':>8} {'RSS before':>11} {'RSS after':>10} {'PSS before':>11} "
+          f"{'PSS after':>10} {'USS before':>11} {'USS after':>10}")
+    for pid, before in result["before"].items():
+        after = result["after"].get(pid, {"rss": 0, "pss": 0, "uss": 0})
+        print(f"{pid:>8} {before['rss']:>11.1f} {after['rss']:>10.1f} {before['pss']:>11.1f} "
+              f"{after['pss']:>10.1f} {before['uss']:>11.1f} {after['uss']:>10.1f}")
+    total = sum(m["pss"] for m in result["after"].values()) + result["master"]["pss"]
+    print(f"master RSS {result['master']['rss']:.1f} MB; total PSS after load "
+          f"(master + workers) {total:.1f} MB")
+
+
+def main():
+    config = load_config()
+    server = config.get("server", {})
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workers", type=int, default=server.get("workers", 4))
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--requests", type=int, default=200, help="requests sent between the two samples")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pmids", type=int, default=50, help="local papers to visualize")
+    parser.add_argument("--terms", nargs="+", default=["QTL", "body weight", "milk yield"])
+    parser.add_argument("--modes", nargs="+", choices=("no-preload", "preload"),
+                        default=["no-preload", "preload"])
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for startup")
+    parser.add_argument("--verbose", action="store_true", help="show the server log")
+    args = parser.parse_args()
+
+    pmids = sample_pmids(config, args.pmids)
+    print(f"{args.workers} workers, {args.requests} requests over {len(pmids)} PMIDs; memory in MB")
+    for mode in args.modes:
+        print_report(run_mode(mode, args, pmids))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Local stub of the NCBI E-utilities (esearch/efetch) for offline runs.
+
+Usage:
+    python benchmarks/stub_eutils.py [--port 8765] [--fail-every 0] [--latency 0.05]
+
+Then point the app at it with "pubmed_api": {"base_url": "http://127.0.0.1:8765/"}.
+esearch returns PMIDs 1..retmax, efetch returns a synthetic article for every
+requested PMID. With --fail-every N, every Nth request answers 429 (odd) or
+503 (even) to exercise the client's retry/backoff path.
+"""
+import argparse
+import itertools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+ARTICLE = """<PubmedArticle><MedlineCitation Status="MEDLINE" Owner="NLM">
+<PMID Version="1">{pmid}</PMID><Article PubModel="Print">
+<Journal><JournalIssue CitedMedium="Internet"><Volume>{vol}</Volume><Issue>1</Issue>
+<PubDate><Year>2020</Year><Month>Jan</Month></PubDate></JournalIssue>
+<Title>Stub Journal of Animal Genetics</Title></Journal>
+<ArticleTitle>Body weight QTL mapping in stub cohort {pmid}</ArticleTitle>
+<Pagination><MedlinePgn>1-10</MedlinePgn></Pagination>
+<Abstract><AbstractText Label="BACKGROUND">Body weight and fat mass were measured in F2 mice &amp; rats.</AbstractText>
+<AbstractText Label="RESULTS">A QTL for blood pressure was found on chromosome {vol}.</AbstractText></Abstract>
+<AuthorList><Author><LastName>Doe</LastName><ForeName>Jane</ForeName>
+<AffiliationInfo><Affiliation>Stub University</Affiliation></AffiliationInfo></Author></AuthorList>
+</Article></MedlineCitation></PubmedArticle>"""
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    fail_every = 0
+    latency = 0.0
+    counter = itertools.count(1)
+    lock = threading.Lock()
+    # (time.monotonic(), path) of every request received, for tests
+    requests = []
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.lock:
+            n = next(self.counter)
+            self.requests.append((time.monotonic(), self.path))
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_every and n % self.fail_every == 0:
+            if n // self.fail_every % 2:
+                return self._send(429, headers={"Retry-After": "0.1"})
+            return self._send(503)
+
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path.endswith("esearch.fcgi"):
+            retmax = int(params.get("retmax", 20))
+            ids = "".join(f"<Id>{i}</Id>" for i in range(1, retmax + 1))
+            body = (f"<eSearchResult><Count>{retmax}</Count><RetMax>{retmax}</RetMax>"
+                    f"<IdList>{ids}</IdList></eSearchResult>")
+        elif url.path.endswith("efetch.fcgi"):
+            pmids = [p for p in params.get("id", "").split(",") if p.strip()]
+            articles = "".join(ARTICLE.format(pmid=escape(p), vol=len(p)) for p in pmids)
+            body = f'<?xml version="1.0" ?><PubmedArticleSet>{articles}</PubmedArticleSet>'
+        else:
+            return self._send(404)
+        self._send(200, body.encode("utf-8"))
+
+
+def serve(port=8765, fail_every=0, latency=0.0):
+    """Start the stub server in a background thread and return it.
+
+    Port 0 picks a free port (see server.server_address). The request
+    counter and log start over with every call.
+    """
+    StubHandler.fail_every = fail_every
+    StubHandler.latency = latency
+    StubHandler.counter = itertools.count(1)
+    StubHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    print(f"Stub E-utilities on http://127.0.0.1:{args.port}/")
+    serve(args.port, args.fail_every, args.latency)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,256 @@
+"""Corpus-wide entity co-occurrence counts and association scores.
+
+A build step reads the precomputed annotations of the local corpus (see
+annotation_store.py) into a sparse PMID x entity incidence matrix X, where
+an entity is a (label, lowercased term) pair from the model or the trait
+dictionary. X^T X then gives, for every pair of entities, the number of
+papers that mention both. The result is saved to a .npz file:
+
+    python cooccurrence.py build --min-df 2
+
+Queries read one row of the co-occurrence matrix and score it with
+vectorized numpy operations, so top-k neighbours take milliseconds:
+
+    index = CooccurrenceIndex.load("cooccurrence.npz")
+    index.neighbors("obesity", label="TRAIT", k=10, score="pmi")
+
+Scores:
+- count: number of papers mentioning both entities
+- pmi: log(P(a, b) / (P(a) P(b))), with probabilities estimated over papers
+- npmi: pmi normalised to [-1, 1] by -log P(a, b)
+"""
+import argparse
+import os
+import tempfile
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from entity_index import entity_key, paper_entities
+
+SCORES = ("count", "pmi", "npmi")
+FORMAT_VERSION = 1
+
+
+class CooccurrenceIndex:
+    """Symmetric entity x entity co-occurrence counts and per-entity paper counts.
+
+    Attributes:
+        counts: CSR matrix; counts[i, j] is the number of papers mentioning
+            both entities (the diagonal holds each entity's paper count).
+        df: Paper count per entity.
+        entities: Entity keys ("LABEL:term"), in matrix order.
+        n_papers: Number of annotated papers the counts were taken from.
+    """
+
+    def __init__(self, counts: sparse.csr_matrix, df: np.ndarray, entities: List[str],
+                 n_papers: int, model: str = "", dict_version: str = ""):
+        self.counts = counts
+        self.df = df
+        self.entities = entities
+        self.n_papers = n_papers
+        self.model = model
+        self.dict_version = dict_version
+        self._ids = {key: i for i, key in enumerate(entities)}
+        # term -> entity ids with that term under any label
+        self._by_term: Dict[str, List[int]] = {}
+        for i, key in enumerate(entities):
+            self._by_term.setdefault(key.split(":", 1)[1], []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    @classmethod
+    def build(cls, papers: Iterable[Tuple[str, Dict]], min_df: int = 1,
+              model: str = "", dict_version: str = "") -> "CooccurrenceIndex":
+        """Build from (pmid, entity_statistics) pairs, as stored by AnnotationStore.
+
+        Args:
+            papers: Annotated papers; only the entity_statistics labels and terms are used.
+            min_df: Entities found in fewer papers are left out before the
+                matrix product, which keeps it small on large corpora.
+        """
+        ids: Dict[str, int] = {}
+        # CSR arrays of the incidence matrix, grown without per-paper Python lists
+        indices = array("i")
+        indptr = array("q", [0])
+        for _, stats in papers:
+            row = {ids.setdefault(key, len(ids)) for key in paper_entities(stats)}
+            indices.extend(sorted(row))
+            indptr.append(len(indices))
+
+        n_papers = len(indptr) - 1
+        entities = [None] * len(ids)
+        for key, i in ids.items():
+            entities[i] = key
+        x = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), np.frombuffer(indices, dtype=np.int32),
+             np.frombuffer(indptr, dtype=np.int64)),
+            shape=(n_papers, len(entities)))
+
+        df = np.asarray(x.sum(axis=0)).ravel().astype(np.int32)
+        keep = np.flatnonzero(df >= min_df)
+        x = x[:, keep]
+        counts = (x.T @ x).tocsr()
+        counts.sort_indices()
+        return cls(counts, df[keep], [entities[i] for i in keep], n_papers, model, dict_version)
+
+    # --- persistence ---
+    def save(self, path: str) -> None:
+        """Write the index to a .npz file (atomically, via a temporary file)."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, format_version=FORMAT_VERSION,
+                         data=self.counts.data, indices=self.counts.indices,
+                         indptr=self.counts.indptr, df=self.df,
+                         entities=np.array(self.entities, dtype=object).astype(str),
+                         n_papers=self.n_papers, model=self.model,
+                         dict_version=self.dict_version)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "CooccurrenceIndex":
+        with np.load(path, allow_pickle=False) as f:
+            if int(f["format_version"]) != FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {int(f['format_version'])}, "
+                                 f"expected {FORMAT_VERSION}; rebuild it")
+            n = len(f["df"])
+            counts = sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=(n, n))
+            return cls(counts, f["df"], f["entities"].tolist(), int(f["n_papers"]),
+                       str(f["model"]), str(f["dict_version"]))
+
+    # --- queries ---
+    def lookup(self, term: str, label: Optional[str] = None) -> Optional[int]:
+        """Entity id for a term; without a label, the label under which the term is most frequent."""
+        if label:
+            return self._ids.get(entity_key(label, term))
+        candidates = self._by_term.get(term.lower())
+        if not candidates:
+            return None
+        return max(candidates, key=lambda i: self.df[i])
+
+    def scores(self, i: int, score: str = "pmi") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Neighbours of entity i with their co-occurrence counts and scores.
+
+        Returns:
+            tuple: (neighbour ids, counts, scores), excluding i itself.
+        """
+        if score not in SCORES:
+            raise ValueError(f"Unknown score '{score}'; expected one of {', '.join(SCORES)}")
+        start, end = self.counts.indptr[i], self.counts.indptr[i + 1]
+        neighbours = self.counts.indices[start:end]
+        counts = self.counts.data[start:end]
+        not_self = neighbours != i
+        neighbours, counts = neighbours[not_self], counts[not_self]
+
+        if score == "count":
+            return neighbours, counts, counts.astype(np.float64)
+        n = float(self.n_papers)
+        joint = counts / n
+        pmi = np.log(joint) - np.log(self.df[i] / n) - np.log(self.df[neighbours] / n)
+        if score == "npmi":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                # Pairs that occur in every paper have P(a, b) = 1 and are perfectly associated
+                pmi = np.where(joint < 1.0, pmi / -np.log(joint), 1.0)
+        return neighbours, counts, pmi
+
+    def neighbors(self, term: str, label: Optional[str] = None, k: int = 10,
+                  score: str = "pmi", min_count: int = 1) -> Optional[Dict]:
+        """Top-k entities co-occurring with a term.
+
+        Args:
+            term: Entity term (case-insensitive).
+            label: Entity label; if omitted, the most frequent label for the term.
+            k: Number of neighbours to return.
+            score: "count", "pmi" or "npmi".
+            min_count: Ignore pairs seen together in fewer papers; PMI is
+                unreliable for rare pairs.
+
+        Returns:
+            dict: The entity and its neighbours, or None if the term is unknown.
+        """
+        i = self.lookup(term, label)
+        if i is None:
+            return None
+        neighbours, counts, values = self.scores(i, score)
+        if min_count > 1:
+            mask = counts >= min_count
+            neighbours, counts, values = neighbours[mask], counts[mask], values[mask]
+
+        if k < len(values):
+            top = np.argpartition(-values, k)[:k]
+        else:
+            top = np.arange(len(values))
+        # Highest score first, ties broken by count
+        top = top[np.lexsort((-counts[top], -values[top]))]
+
+        def entity(j):
+            label_j, term_j = self.entities[j].split(":", 1)
+            return {"label": label_j, "term": term_j, "papers": int(self.df[j])}
+
+        return {
+            "entity": entity(i),
+            "score": score,
+            "neighbors": [dict(entity(j), count=int(counts[t]), score=round(float(values[t]), 4))
+                          for t, j in zip(top, neighbours[top])],
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "papers": self.n_papers,
+            "entities": len(self.entities),
+            "pairs": int((self.counts.nnz - len(self.entities)) // 2),
+            "model": self.model,
+            "dict_version": self.dict_version,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the entity co-occurrence index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build from the precomputed annotations")
+    build.add_argument("--db", default="annotations.db", help="annotation store (annotation_store.py build)")
+    build.add_argument("--dictionary", default="Trait dictionary.txt")
+    build.add_argument("--index", default="trait_index.bin")
+    build.add_argument("--output", default="cooccurrence.npz")
+    build.add_argument("--min-df", type=int, default=2, help="leave out entities found in fewer papers")
+    query = sub.add_parser("query", help="print the top neighbours of a term")
+    query.add_argument("term")
+    query.add_argument("--label")
+    query.add_argument("--input", default="cooccurrence.npz")
+    query.add_argument("-k", type=int, default=10)
+    query.add_argument("--score", choices=SCORES, default="pmi")
+    query.add_argument("--min-count", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from annotation_store import AnnotationStore
+        from nlp_utils import pipeline_version
+        from trait_matcher import load_matcher
+
+        # Annotations are selected for the current NER pipeline and dictionary version
+        dict_version = load_matcher(args.dictionary, args.index or None).version
+        pipeline = pipeline_version("spans")
+        t0 = time.perf_counter()
+        index = CooccurrenceIndex.build(AnnotationStore(args.db).statistics(pipeline, dict_version),
+                                        min_df=args.min_df, model=pipeline, dict_version=dict_version)
+        index.save(args.output)
+        stats = index.stats()
+        print(f"Built co-occurrence index of {stats['entities']} entities and {stats['pairs']} pairs "
+              f"from {stats['papers']} papers in {time.perf_counter() - t0:.1f}s -> {args.output}")
+    elif args.command == "query":
+        index = CooccurrenceIndex.load(args.input)
+        result = index.neighbors(args.term, args.label, args.k, args.score, args.min_count)
+        if result is None:
+            print(f"Unknown entity: {args.term}")
+        else:
+            for n in result["neighbors"]:
+                print(f"{n['score']:>8} {n['count']:>6}  {n['label']}:{n['term']}")
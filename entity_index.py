@@ -0,0 +1,308 @@
+"""Entity postings lists for faceted search over the annotated local corpus.
+
+Every paper gets a document number, newest PMID first. Every entity (a
+label and lowercased term, as in entity_statistics) gets a sorted array of
+the papers that mention it. Queries combine postings with sorted-array
+intersections and unions. Facet counts are bincounts over a forward
+paper -> entities index. No paper text is read at query time. Build from
+the annotation store with:
+
+    python entity_index.py build
+
+On disk (entity_index.npz), postings are delta-encoded and compressed.
+"""
+import argparse
+import os
+import tempfile
+import time
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def entity_key(label: str, term: str) -> str:
+    return f"{label}:{term.lower()}"
+
+
+def paper_entities(stats: Dict) -> Iterator[str]:
+    """Entity keys of a paper's entity_statistics (each once)."""
+    for label, label_stats in stats.items():
+        for term in label_stats.get("terms", []):
+            yield entity_key(label, term["term"])
+
+
+def _union(n_docs: int, lists: Iterable[np.ndarray]) -> np.ndarray:
+    """Sorted union of document lists, via a mask rather than a sort."""
+    mask = np.zeros(n_docs, dtype=bool)
+    for docs in lists:
+        mask[docs] = True
+    return np.flatnonzero(mask).astype(np.uint32)
+
+
+def _pmid_order(pmid: str) -> int:
+    try:
+        return int(pmid)
+    except ValueError:
+        return -1
+
+
+def _gather(offsets: np.ndarray, values: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenated CSR rows, and the length of each row."""
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    total = int(lengths.sum())
+    # Position of each output element in values: its row start plus its offset within the row
+    shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return values[shift + np.arange(total)], lengths
+
+
+class EntityIndex:
+    """Forward (paper -> entities) and inverted (entity -> papers) index.
+
+    Args:
+        pmids: PMID per document number.
+        entities: Entity keys ("LABEL:term") per entity id.
+        doc_offsets, doc_entities: CSR forward index; entity ids of each paper, sorted.
+        post_offsets, post_docs: CSR postings; document numbers of each entity, sorted.
+    """
+
+    def __init__(self, pmids: Sequence[str], entities: List[str], doc_offsets: np.ndarray,
+                 doc_entities: np.ndarray, post_offsets: np.ndarray, post_docs: np.ndarray,
+                 model: str = "", dict_version: str = ""):
+        self.pmids = list(pmids)
+        self.entities = entities
+        self.doc_offsets = doc_offsets
+        self.doc_entities = doc_entities
+        self.post_offsets = post_offsets
+        self.post_docs = post_docs
+        self.model = model
+        self.dict_version = dict_version
+
+        self._ids = {key: i for i, key in enumerate(entities)}
+        self._by_term: Dict[str, List[int]] = {}
+        label_ids: Dict[str, int] = {}
+        entity_labels = np.empty(len(entities), dtype=np.int32)
+        for i, key in enumerate(entities):
+            label, term = key.split(":", 1)
+            self._by_term.setdefault(term, []).append(i)
+            entity_labels[i] = label_ids.setdefault(label, len(label_ids))
+        self.labels = list(label_ids)
+        self.entity_labels = entity_labels
+        self.df = np.diff(post_offsets)
+        self._label_entities = [np.flatnonzero(entity_labels == l) for l in range(len(self.labels))]
+        self._label_docs: Dict[int, np.ndarray] = {}
+        self._all_facets = None
+
+    def __len__(self) -> int:
+        return len(self.pmids)
+
+    @classmethod
+    def build(cls, papers: Iterable[Tuple[str, Dict]], model: str = "",
+              dict_version: str = "") -> "EntityIndex":
+        """Build from (pmid, entity_statistics) pairs, as stored by AnnotationStore."""
+        ids: Dict[str, int] = {}
+        pmids: List[str] = []
+        indices = array("i")
+        indptr = array("q", [0])
+        for pmid, stats in papers:
+            row = {ids.setdefault(key, len(ids)) for key in paper_entities(stats)}
+            pmids.append(pmid)
+            indices.extend(sorted(row))
+            indptr.append(len(indices))
+        entities = [None] * len(ids)
+        for key, i in ids.items():
+            entities[i] = key
+
+        indices = np.frombuffer(indices, dtype=np.int32)
+        indptr = np.frombuffer(indptr, dtype=np.int64)
+        # Renumber documents newest PMID first, so pages of sorted postings come newest first
+        order = np.argsort([-_pmid_order(p) for p in pmids], kind="stable")
+        doc_entities, lengths = _gather(indptr, indices, order)
+        doc_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+
+        # Invert: a stable sort by entity keeps each entity's documents in ascending order
+        docs = np.repeat(np.arange(len(pmids), dtype=np.uint32), lengths)
+        by_entity = np.argsort(doc_entities, kind="stable")
+        post_docs = docs[by_entity]
+        post_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(doc_entities, minlength=len(entities))))).astype(np.int64)
+        return cls([pmids[i] for i in order], entities, doc_offsets, doc_entities,
+                   post_offsets, post_docs, model, dict_version)
+
+    # --- persistence ---
+    def save(self, path: str) -> None:
+        """Write the index to a compressed .npz file (atomically, via a temporary file)."""
+        # Delta-encode each postings list; small gaps compress far better than document numbers
+        deltas = np.diff(self.post_docs.astype(np.int64), prepend=0)
+        starts = self.post_offsets[:-1][self.df > 0]
+        deltas[starts] = self.post_docs[starts]
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, format_version=FORMAT_VERSION,
+                                    pmids=np.array(self.pmids, dtype=str),
+                                    entities=np.array(self.entities, dtype=str),
+                                    doc_offsets=self.doc_offsets, doc_entities=self.doc_entities,
+                                    post_offsets=self.post_offsets,
+                                    post_deltas=deltas.astype(np.uint32),
+                                    model=self.model, dict_version=self.dict_version)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "EntityIndex":
+        with np.load(path, allow_pickle=False) as f:
+            if int(f["format_version"]) != FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {int(f['format_version'])}, "
+                                 f"expected {FORMAT_VERSION}; rebuild it")
+            post_offsets = f["post_offsets"]
+            deltas = f["post_deltas"].astype(np.int64)
+            # Undo the delta encoding: a running sum, minus its value just before each list starts
+            running = np.cumsum(deltas)
+            before = np.concatenate(([0], running))[post_offsets[:-1]]
+            post_docs = (running - np.repeat(before, np.diff(post_offsets))).astype(np.uint32)
+            return cls(f["pmids"].tolist(), f["entities"].tolist(), f["doc_offsets"],
+                       f["doc_entities"], post_offsets, post_docs,
+                       str(f["model"]), str(f["dict_version"]))
+
+    # --- queries ---
+    def postings(self, i: int) -> np.ndarray:
+        return self.post_docs[self.post_offsets[i]:self.post_offsets[i + 1]]
+
+    def lookup(self, entity: str) -> List[int]:
+        """Entity ids for "LABEL:term", or for a bare term under every label."""
+        label, sep, term = entity.partition(":")
+        if sep and label in self.labels:
+            i = self._ids.get(entity_key(label, term))
+            return [] if i is None else [i]
+        return list(self._by_term.get(entity.lower(), []))
+
+    def label_docs(self, label: str) -> np.ndarray:
+        """Papers that mention any entity of a label."""
+        if label not in self.labels:
+            return np.empty(0, dtype=np.uint32)
+        l = self.labels.index(label)
+        docs = self._label_docs.get(l)
+        if docs is None:
+            docs = _gather(self.post_offsets, self.post_docs, self._label_entities[l])[0]
+            docs = self._label_docs[l] = _union(len(self.pmids), [docs])
+        return docs
+
+    def match(self, entities: Sequence[str] = (), op: str = "and",
+              labels: Sequence[str] = ()) -> Optional[np.ndarray]:
+        """Sorted document numbers of papers matching a query.
+
+        Args:
+            entities: "LABEL:term" or bare terms; a bare term matches it under any label.
+            op: "and" (papers mentioning every entity) or "or" (any of them).
+            labels: Papers must also mention some entity of each of these labels.
+
+        Returns:
+            np.ndarray: Document numbers, or None for "all papers" (no constraints).
+        """
+        sets = []
+        for entity in entities:
+            ids = self.lookup(entity)
+            if len(ids) == 1:
+                sets.append(self.postings(ids[0]))
+            else:
+                sets.append(_union(len(self.pmids), (self.postings(i) for i in ids)))
+
+        if op == "or" and sets:
+            result = _union(len(self.pmids), sets)
+            sets = []
+        else:
+            result = None
+        sets.extend(self.label_docs(label) for label in labels)
+        # Intersect shortest first: every step is bounded by the smallest list so far
+        for docs in sorted(sets, key=len):
+            result = docs if result is None else np.intersect1d(result, docs, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
+
+    def facets(self, docs: Optional[np.ndarray], top: int = 10) -> Dict[str, Dict]:
+        """Papers per label and the top terms per label among the given papers (None: all)."""
+        if docs is None and self._all_facets is not None and self._all_facets[0] == top:
+            return self._all_facets[1]
+        if docs is None:
+            ents = self.doc_entities
+        else:
+            ents = _gather(self.doc_offsets, self.doc_entities, docs)[0]
+        counts = np.bincount(ents, minlength=len(self.entities))
+        # Papers per label: members of the result among the label's papers
+        if docs is None:
+            label_papers = [len(self.label_docs(label)) for label in self.labels]
+        else:
+            mask = np.zeros(len(self.pmids), dtype=bool)
+            mask[docs] = True
+            label_papers = [int(np.count_nonzero(mask[self.label_docs(label)])) for label in self.labels]
+
+        result = {}
+        for l, label in enumerate(self.labels):
+            if label_papers[l] == 0:
+                continue
+            ids = self._label_entities[l]
+            c = counts[ids]
+            best = np.argpartition(-c, top)[:top] if top < len(ids) else np.arange(len(ids))
+            best = best[np.lexsort((ids[best], -c[best]))]
+            result[label] = {
+                "papers": int(label_papers[l]),
+                "terms": [{"term": self.entities[ids[b]].split(":", 1)[1], "count": int(c[b])}
+                          for b in best if c[b] > 0],
+            }
+        if docs is None:
+            self._all_facets = (top, result)
+        return result
+
+    def search(self, entities: Sequence[str] = (), op: str = "and", labels: Sequence[str] = (),
+               offset: int = 0, limit: int = 50, facet_terms: int = 10) -> Dict:
+        """One page of matching PMIDs (newest first), the total, and facet counts."""
+        docs = self.match(entities, op, labels)
+        total = len(self.pmids) if docs is None else len(docs)
+        page = range(offset, min(offset + limit, total)) if docs is None else docs[offset:offset + limit]
+        return {
+            "pmids": [self.pmids[d] for d in page],
+            "total": int(total),
+            "facets": self.facets(docs, facet_terms) if facet_terms else {},
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "papers": len(self.pmids),
+            "entities": len(self.entities),
+            "postings": int(len(self.post_docs)),
+            "model": self.model,
+            "dict_version": self.dict_version,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the entity postings index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build from the precomputed annotations")
+    build.add_argument("--db", default="annotations.db", help="annotation store (annotation_store.py build)")
+    build.add_argument("--dictionary", default="Trait dictionary.txt")
+    build.add_argument("--index", default="trait_index.bin")
+    build.add_argument("--output", default="entity_index.npz")
+    args = parser.parse_args()
+
+    from annotation_store import AnnotationStore
+    from nlp_utils import pipeline_version
+    from trait_matcher import load_matcher
+
+    dict_version = load_matcher(args.dictionary, args.index or None).version
+    pipeline = pipeline_version("spans")
+    t0 = time.perf_counter()
+    index = EntityIndex.build(AnnotationStore(args.db).statistics(pipeline, dict_version),
+                              model=pipeline, dict_version=dict_version)
+    index.save(args.output)
+    stats = index.stats()
+    print(f"Indexed {stats['postings']} postings of {stats['entities']} entities in "
+          f"{stats['papers']} papers in {time.perf_counter() - t0:.1f}s -> {args.output}")
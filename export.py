@@ -0,0 +1,300 @@
+"""Streaming export of annotated papers as JSONL, BioC XML or BRAT standoff.
+
+Papers come from a PMID list, a local search or the whole local corpus.
+They are annotated in chunks, and each chunk is written out before the next
+one is read, so memory stays constant however many papers are exported.
+Local papers with precomputed annotations (see annotation_store.py) are
+not annotated again.
+
+    python export.py --corpus --format bioc --gzip --output corpus.xml.gz
+    python export.py --query "body weight" --format brat --output body_weight.tar
+    python export.py --pmids-file pmids.txt > papers.jsonl
+
+The same export is served by POST /export.
+
+Formats:
+- jsonl: one JSON object per paper, with the paper fields, title_spans,
+  abstract_spans and entity_statistics
+- bioc: a BioC XML collection. Each paper has a title passage and an
+  abstract passage, and offsets are relative to "title\\nabstract".
+- brat: a tar archive with <pmid>.txt ("title\\nabstract") and <pmid>.ann
+  for every paper, and an annotation.conf listing the entity labels
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+from xml.sax.saxutils import escape
+
+import nlp_utils
+from annotation_store import text_hash
+
+FORMATS = ("jsonl", "bioc", "brat")
+MEDIA_TYPES = {"jsonl": "application/x-ndjson", "bioc": "application/xml", "brat": "application/x-tar"}
+EXTENSIONS = {"jsonl": ".jsonl", "bioc": ".xml", "brat": ".tar"}
+
+
+# --- papers ---
+def iter_papers(pmids: Iterable[str], paper_store, fetch_remote: bool = True,
+                chunk_size: int = 1000) -> Iterator[Tuple[str, Dict, str]]:
+    """Yield (pmid, paper, source) for PMIDs from the local store, then from PubMed.
+
+    PMIDs are resolved chunk_size at a time. Papers that are not in the local
+    store are fetched with iter_pubmed_papers (through the PubMed cache) if
+    fetch_remote is set, and skipped otherwise.
+    """
+    def resolve(chunk):
+        missing = []
+        for pmid in chunk:
+            paper = paper_store.get(pmid) if paper_store is not None else None
+            if paper is not None:
+                yield pmid, paper, "local"
+            else:
+                missing.append(pmid)
+        if missing and fetch_remote:
+            from pubmed_utils import iter_pubmed_papers
+            for paper in iter_pubmed_papers(missing):
+                yield paper["PMID"], paper, "pubmed"
+
+    chunk = []
+    for pmid in pmids:
+        chunk.append(pmid)
+        if len(chunk) >= chunk_size:
+            yield from resolve(chunk)
+            chunk = []
+    if chunk:
+        yield from resolve(chunk)
+
+
+def annotate_papers(papers: Iterable[Tuple[str, Dict, str]], matcher, annotation_store=None,
+                    chunk_size: int = 256, batch_size: int = 64, n_process: int = 1) -> Iterator[Dict]:
+    """Annotate papers chunk by chunk and yield one export record per paper.
+
+    Args:
+        papers: (pmid, paper, source) tuples, as from iter_papers.
+        matcher: TraitMatcher for dictionary matches; its version selects
+            the precomputed annotations.
+        annotation_store: Precomputed annotations for local papers, or None.
+        chunk_size: Papers annotated together in one annotate_batch call.
+
+    Yields:
+        dict: The paper fields, title_spans, abstract_spans and entity_statistics.
+    """
+    pipeline = nlp_utils.pipeline_version("spans")
+
+    def flush(chunk):
+        stored = [annotation_store.get(pmid, pipeline, matcher.version, text_hash(paper))
+                  if annotation_store is not None and source == "local" else None
+                  for pmid, paper, source in chunk]
+        texts = []
+        for (_, paper, _), annotations in zip(chunk, stored):
+            if annotations is None:
+                texts.extend([paper.get("Title", ""), paper.get("Abstract", "")])
+        spans = iter(nlp_utils.annotate_batch(texts, matcher=matcher, batch_size=batch_size,
+                                              n_process=n_process) if texts else [])
+        for (pmid, paper, source), annotations in zip(chunk, stored):
+            if annotations is None:
+                title_spans, abstract_spans = next(spans), next(spans)
+                annotations = {"title_spans": title_spans, "abstract_spans": abstract_spans,
+                               "entity_statistics": nlp_utils.entity_statistics(title_spans + abstract_spans)}
+            yield dict({
+                "pmid": pmid,
+                "source": source,
+                "title": paper.get("Title", ""),
+                "abstract": paper.get("Abstract", ""),
+                "journal": paper.get("Journal", ""),
+                "publication_date": paper.get("PublicationDate", ""),
+            }, **annotations)
+
+    chunk = []
+    for item in papers:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield from flush(chunk)
+            chunk = []
+    if chunk:
+        yield from flush(chunk)
+
+
+# --- formats ---
+def _entities(record: Dict) -> Iterator[Tuple[int, int, Dict]]:
+    """(start, end, span) of every entity, with offsets into "title\\nabstract"."""
+    for span in record["title_spans"]:
+        yield span["start"], span["end"], span
+    offset = len(record["title"]) + 1
+    for span in record["abstract_spans"]:
+        yield span["start"] + offset, span["end"] + offset, span
+
+
+def to_jsonl(records: Iterable[Dict]) -> Iterator[str]:
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def to_bioc(records: Iterable[Dict]) -> Iterator[str]:
+    """A BioC collection, one <document> per yielded string."""
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE collection SYSTEM "BioC.dtd">\n'
+           f"<collection><source>PubMed</source><date>{time.strftime('%Y%m%d')}</date>"
+           f"<key>traitviz.key</key>\n")
+    for record in records:
+        parts = [f"<document><id>{escape(record['pmid'])}</id>"]
+        annotation_id = 0
+        offset = 0
+        for kind, spans in (("title", record["title_spans"]), ("abstract", record["abstract_spans"])):
+            text = record[kind]
+            parts.append(f'<passage><infon key="type">{kind}</infon>'
+                         f"<offset>{offset}</offset><text>{escape(text)}</text>")
+            for span in spans:
+                annotation_id += 1
+                parts.append(
+                    f'<annotation id="{annotation_id}"><infon key="type">{escape(span["label"])}</infon>'
+                    f'<infon key="source">{span.get("source", "model")}</infon>'
+                    f'<location offset="{offset + span["start"]}" length="{span["end"] - span["start"]}"/>'
+                    f"<text>{escape(text[span['start']:span['end']])}</text></annotation>")
+            parts.append("</passage>")
+            offset += len(text) + 1
+        parts.append("</document>\n")
+        yield "".join(parts)
+    yield "</collection>\n"
+
+
+def brat_document(record: Dict) -> Tuple[str, str]:
+    """The .txt and .ann contents of a record in BRAT standoff format."""
+    text = f"{record['title']}\n{record['abstract']}"
+    lines = []
+    for n, (start, end, span) in enumerate(_entities(record), 1):
+        lines.append(f"T{n}\t{span['label']} {start} {end}\t{text[start:end].replace(chr(10), ' ')}")
+        lines.append(f"#{n}\tAnnotatorNotes T{n}\t{span.get('source', 'model')}")
+    return text, "".join(line + "\n" for line in lines)
+
+
+class _Sink:
+    """Write-only file object that hands what tarfile writes to a generator."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def to_brat(records: Iterable[Dict]) -> Iterator[bytes]:
+    """A tar archive of BRAT .txt/.ann pairs, streamed one document at a time."""
+    sink = _Sink()
+    tar = tarfile.open(fileobj=sink, mode="w|")
+    mtime = int(time.time())
+    labels = set()
+
+    def add(name, data):
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime = len(data), mtime
+        tar.addfile(info, io.BytesIO(data))
+
+    for record in records:
+        text, ann = brat_document(record)
+        labels.update(span["label"] for _, _, span in _entities(record))
+        add(f"{record['pmid']}.txt", text.encode("utf-8"))
+        add(f"{record['pmid']}.ann", ann.encode("utf-8"))
+        yield sink.drain()
+    conf = "[entities]\n" + "".join(f"{label}\n" for label in sorted(labels))
+    add("annotation.conf", (conf + "\n[relations]\n\n[events]\n\n[attributes]\n").encode("utf-8"))
+    tar.close()
+    yield sink.drain()
+
+
+WRITERS = {"jsonl": to_jsonl, "bioc": to_bioc, "brat": to_brat}
+
+
+def encode(records: Iterable[Dict], fmt: str = "jsonl", compress: bool = False) -> Iterator[bytes]:
+    """Serialize records to byte chunks, gzip-compressed if compress is set."""
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown format '{fmt}'; expected one of {', '.join(FORMATS)}")
+    chunks: Iterator[Union[str, bytes]] = WRITERS[fmt](records)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # 31: gzip header
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def filename(fmt: str, compress: bool = False) -> str:
+    return f"export{EXTENSIONS[fmt]}{'.gz' if compress else ''}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export annotated papers")
+    selection = parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument("--pmids-file", help="file with one PMID per line ('-' for stdin)")
+    selection.add_argument("--query", help="export every local search result for this query")
+    selection.add_argument("--corpus", action="store_true", help="export the whole local corpus")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("--output", help="output file (default: stdout)")
+    parser.add_argument("--no-fetch", action="store_true", help="skip PMIDs that are not in the local store")
+    parser.add_argument("--papers-db", default="papers.db")
+    parser.add_argument("--search-index", default="search_index.bin", help="index used by --query")
+    parser.add_argument("--db", default="annotations.db", help="precomputed annotations (annotation_store.py build)")
+    parser.add_argument("--dictionary", default="Trait dictionary.txt")
+    parser.add_argument("--index", default="trait_index.bin")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--n-process", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    args = parser.parse_args()
+
+    from annotation_store import AnnotationStore
+    from paper_store import PaperStore
+    from trait_matcher import load_matcher
+
+    paper_store = PaperStore(args.papers_db)
+    if args.corpus:
+        papers = ((pmid, paper, "local") for pmid, paper in paper_store.items())
+    elif args.query:
+        from search_index import load_index
+        index = load_index(args.search_index or None, paper_store)
+        hits, _ = index.search(args.query, limit=max(1, len(index)))
+        papers = iter_papers((pmid for pmid, _ in hits), paper_store, fetch_remote=False)
+    else:
+        source = sys.stdin if args.pmids_file == "-" else open(args.pmids_file, "r", encoding="utf-8")
+        pmids = (line.strip() for line in source if line.strip())
+        papers = iter_papers(pmids, paper_store, fetch_remote=not args.no_fetch)
+
+    matcher = load_matcher(args.dictionary, args.index or None)
+    annotation_store = AnnotationStore(args.db) if os.path.exists(args.db) else None
+    count = 0
+
+    def counted(records):
+        global count
+        for record in records:
+            count += 1
+            yield record
+
+    records = counted(annotate_papers(papers, matcher, annotation_store, chunk_size=args.chunk_size,
+                                      batch_size=args.batch_size, n_process=args.n_process))
+    t0 = time.perf_counter()
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        # Log messages (model loading, PubMed errors) go to stderr, since the export may go to stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            for chunk in encode(records, args.format, args.gzip):
+                out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    print(f"Exported {count} papers as {args.format} in {time.perf_counter() - t0:.1f}s",
+          file=sys.stderr)
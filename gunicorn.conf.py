@@ -0,0 +1,67 @@
+"""Production server: a gunicorn master that loads everything once, then forks workers.
+
+    gunicorn -c gunicorn.conf.py
+
+With server.preload (the default) the master imports app.py before forking.
+The import loads the paper store and search index, the trait matcher,
+the entity and co-occurrence indexes and the spaCy models. Workers then
+share those pages copy-on-write instead of each loading its own copy.
+
+Pages stay shared only while nothing writes to them. The cyclic garbage
+collector writes to every object it visits. The master therefore runs
+with the collector disabled and calls gc.freeze() before each fork, which
+moves everything loaded so far into a permanent generation that
+collections in the workers skip. Workers re-enable the collector.
+
+Workers serve requests on server.threads threads each (gthread workers).
+CPU-bound annotation holds the GIL, so add workers rather than threads
+for NER throughput. Threads mostly help requests that wait on PubMed.
+
+The workers are the only process pool: app.py does not start inference
+workers (inference.enabled) under gunicorn, since every worker would start
+its own pool with its own copies of the models.
+"""
+import gc
+import json
+import os
+
+CONFIG_PATH = "config.json"
+if os.path.exists(CONFIG_PATH):
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        SERVER_CONFIG = json.load(f).get("server", {})
+else:
+    SERVER_CONFIG = {}
+
+wsgi_app = "app:app"
+bind = f"{os.getenv('HOST', SERVER_CONFIG.get('host', '0.0.0.0'))}:{os.getenv('PORT', SERVER_CONFIG.get('port', 5000))}"
+workers = int(os.getenv("WEB_CONCURRENCY", SERVER_CONFIG.get("workers", 4)))
+threads = SERVER_CONFIG.get("threads", 4)
+worker_class = "gthread"
+timeout = SERVER_CONFIG.get("timeout", 60)
+# Recycle workers after this many requests (0 = never); the jitter staggers restarts
+max_requests = SERVER_CONFIG.get("max_requests", 0)
+max_requests_jitter = max_requests // 10
+# TRAITVIZ_PRELOAD=0 makes every worker load the app itself (see benchmarks/prefork_memory.py)
+preload_app = os.getenv("TRAITVIZ_PRELOAD", "1" if SERVER_CONFIG.get("preload", True) else "0") != "0"
+
+# Tells app.py not to start a pool of inference workers in each gunicorn worker
+os.environ["TRAITVIZ_GUNICORN"] = "1"
+
+if preload_app:
+    # Tells app.py to load the models and start no threads; runs before the app is imported
+    os.environ["TRAITVIZ_PREFORK"] = "1"
+    gc.disable()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        import app as webapp
+        webapp.before_fork()
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+        import app as webapp
+        webapp.after_fork()
@@ -0,0 +1,228 @@
+"""Micro-batching inference service for NER and dependency parsing.
+
+Request threads do not run spaCy themselves. They put each text on a bounded
+queue and wait. A dispatcher thread collects concurrent requests for up to
+max_wait_ms (or until max_batch texts are waiting), groups them by kind, and
+sends each group as one nlp.pipe batch to a pool of worker processes. Each
+worker loads the models once. This keeps inference off the GIL of the web
+process and lets concurrent requests share batches.
+
+If the workers cannot start (the initializer fails when a model is missing)
+the pool breaks for good. The service then runs every request in the
+calling thread instead, as if it were disabled.
+
+The service is meant for a single web process (python app.py or uvicorn
+asgi:app). Under gunicorn, app.py does not start it (see app.GUNICORN):
+each gunicorn worker would otherwise start its own pool.
+
+    service = InferenceService(workers=4)
+    entities = service.ner("Body weight QTL on chromosome 2")
+"""
+import concurrent.futures
+import functools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List
+
+import nlp_utils
+
+# Batch functions run in the worker processes, by request kind
+_BATCH_FUNCTIONS = {
+    "ner": nlp_utils.ner_batch,
+    "dependencies": nlp_utils.dependencies_batch,
+}
+
+
+class InferenceBusy(Exception):
+    """The request queue is full; the caller should retry later."""
+
+
+class InferenceTimeout(Exception):
+    """A request was not answered within the service timeout."""
+
+
+def _run_batch(kind: str, texts: List[str]) -> List[Any]:
+    """Worker-side entry point: run one batch of a single kind."""
+    return _BATCH_FUNCTIONS[kind](texts, batch_size=len(texts))
+
+
+class InferenceService:
+    """Process pool fed by a micro-batching request queue.
+
+    Args:
+        workers: Number of worker processes; each holds its own copy of the models.
+        max_batch: Largest number of texts sent to a worker at once.
+        max_wait_ms: How long the dispatcher waits for more requests before
+            sending a batch that is not full.
+        max_queue: Requests waiting beyond this make new requests fail with
+            InferenceBusy instead of queueing without bound.
+        timeout: Seconds a caller waits for its result before InferenceTimeout.
+    """
+
+    def __init__(self, workers: int = 2, max_batch: int = 16, max_wait_ms: float = 5,
+                 max_queue: int = 256, timeout: float = 30):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self.requests = 0
+        self.batches = 0
+        # Set when the pool breaks; requests then run in the calling thread
+        self.broken = False
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        # spawn: workers must not inherit the web process's threads and sockets
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=nlp_utils.warmup)
+        # At most two batches per worker in flight; the rest waits in the queue,
+        # where it can still be merged into larger batches
+        self._slots = threading.BoundedSemaphore(2 * workers)
+        self._stopped = threading.Event()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="inference-dispatcher",
+                                            daemon=True)
+        self._dispatcher.start()
+
+    # --- client side ---
+    def submit(self, kind: str, text: str) -> concurrent.futures.Future:
+        """Queue one text and return a future for its result.
+
+        Raises:
+            InferenceBusy: If the queue is full or the service is shut down.
+        """
+        if kind not in _BATCH_FUNCTIONS:
+            raise ValueError(f"Unknown inference kind: {kind}")
+        if self._stopped.is_set():
+            raise InferenceBusy("Inference service is shut down")
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        try:
+            self._queue.put_nowait((kind, text, future))
+        except queue.Full:
+            raise InferenceBusy(f"Inference queue is full ({self._queue.maxsize} requests waiting)")
+        return future
+
+    def map(self, kind: str, texts: List[str]) -> List[Any]:
+        """Run several texts of one kind; they may share a batch with each other.
+
+        Texts found in the annotation cache are answered without a worker round trip.
+        """
+        return nlp_utils.cached_batch(kind, texts, functools.partial(self._run, kind))
+
+    def _run(self, kind: str, texts: List[str]) -> List[Any]:
+        if self.broken:
+            return _run_batch(kind, texts)
+        futures = [self.submit(kind, text) for text in texts]
+        deadline = time.monotonic() + self.timeout
+        try:
+            return [f.result(timeout=max(0.0, deadline - time.monotonic())) for f in futures]
+        except concurrent.futures.TimeoutError:
+            for f in futures:
+                f.cancel()  # not sent to a worker yet: drop it from its batch
+            raise InferenceTimeout(f"No inference result within {self.timeout}s")
+        except BrokenProcessPool as e:
+            self._mark_broken(e)
+            return _run_batch(kind, texts)
+
+    def _mark_broken(self, error: Exception) -> None:
+        if not self.broken:
+            self.broken = True
+            print(f"Inference workers failed ({error}); running inference in the request threads")
+
+    def ner(self, text: str) -> List[Dict]:
+        """Same result as nlp_utils.ner(text)."""
+        return self.map("ner", [text])[0]
+
+    def dependencies(self, text: str) -> Dict[str, Any]:
+        """Same result as nlp_utils.get_dependencies(text)."""
+        return self.map("dependencies", [text])[0]
+
+    def stats(self) -> Dict[str, float]:
+        """Queue length and batching counters."""
+        return {
+            "workers": 0 if self.broken else self.workers,
+            "queued": self._queue.qsize(),
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        """Stop accepting requests, finish the queued ones and stop the workers."""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._queue.put(None)
+        self._dispatcher.join()
+        self._pool.shutdown(wait=True)
+
+    # --- dispatcher side ---
+    def _collect(self) -> List[tuple]:
+        """Block for one request, then gather more until the batch is full or max_wait passes."""
+        item = self._queue.get()
+        if item is None:
+            return []
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown: send what we have, then stop on the next call
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _dispatch(self) -> None:
+        while True:
+            # Wait for a free slot before collecting, so requests pile up while workers are busy
+            self._slots.acquire()
+            batch = self._collect()
+            if not batch:
+                self._slots.release()
+                return
+
+            groups: Dict[str, tuple] = {}
+            for kind, text, future in batch:
+                # Skip requests whose caller already gave up
+                if future.set_running_or_notify_cancel():
+                    texts, futures = groups.setdefault(kind, ([], []))
+                    texts.append(text)
+                    futures.append(future)
+
+            first = True
+            for kind, (texts, futures) in groups.items():
+                if not first:
+                    self._slots.acquire()
+                first = False
+                self.requests += len(texts)
+                self.batches += 1
+                try:
+                    result = self._pool.submit(_run_batch, kind, texts)
+                except Exception as e:  # pool broken or shut down
+                    self._slots.release()
+                    for f in futures:
+                        f.set_exception(e)
+                    continue
+                result.add_done_callback(
+                    lambda r, futures=futures: self._resolve(futures, r))
+            if first:
+                self._slots.release()  # every request in the batch was cancelled
+
+    def _resolve(self, futures: List[concurrent.futures.Future],
+                 result: concurrent.futures.Future) -> None:
+        """Route a finished batch back to the waiting requests."""
+        self._slots.release()
+        try:
+            values = result.result()
+        except Exception as e:
+            for f in futures:
+                f.set_exception(e)
+            return
+        for f, value in zip(futures, values):
+            f.set_result(value)
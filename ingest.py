@@ -0,0 +1,133 @@
+"""Stream PubMed baseline/update XML files from disk into the local paper store.
+
+Usage:
+    python ingest.py pubmed24n0001.xml.gz pubmed24n0002.xml.gz --db papers.db
+    python ingest.py updates/*.xml.gz --query '"quantitative trait" QTL' --queue-annotation
+
+Files are parsed incrementally, so memory use does not depend on file size.
+Progress is checkpointed per chunk; re-running the same command skips files
+that were completed and resumes a partially ingested file where it stopped.
+<DeleteCitation> entries in update files remove papers from the store.
+The local search index (search_index.py) is rebuilt at the end if the store
+has changed.
+"""
+import argparse
+import gzip
+import os
+import sys
+import xml.etree.ElementTree as ET
+from typing import Iterator, List, Optional, Set, Tuple
+
+from paper_store import PaperStore
+from pubmed_utils import parse_article
+from search_index import load_index, parse_query, tokenize
+
+# Elements directly under <PubmedArticleSet> that count as one record
+_RECORD_TAGS = ('PubmedArticle', 'PubmedBookArticle', 'DeleteCitation')
+
+
+def iter_records(path: str) -> Iterator[Tuple[str, ET.Element]]:
+    """Yield (tag, element) for each top-level record of a (gzipped) PubMed XML file.
+
+    The element is only valid until the next record is requested.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        for event, elem in context:
+            if event == 'end' and elem.tag in _RECORD_TAGS:
+                yield elem.tag, elem
+                # Drop everything parsed so far to keep memory constant
+                root.clear()
+
+
+def _matches_query(clauses: List[List[str]], paper: dict) -> bool:
+    """True if every query clause occurs, as a token sequence, in the title or abstract."""
+    tokens = tokenize(paper.get('Title', '') + ' ' + paper.get('Abstract', ''))
+    joined = ' ' + ' '.join(tokens) + ' '
+    return all(' ' + ' '.join(clause) + ' ' in joined for clause in clauses)
+
+
+def ingest_file(store: PaperStore, path: str, pmids: Optional[Set[str]] = None,
+                query: str = '', queue_annotation: bool = False,
+                chunk_size: int = 1000) -> Tuple[int, int]:
+    """Ingest one file into the store.
+
+    Returns:
+        tuple: (papers written, papers deleted) in this run
+    """
+    key = os.path.abspath(path)
+    size = os.path.getsize(path)
+    done, completed = store.file_progress(key, size)
+    if completed:
+        print(f"{path}: already ingested, skipping")
+        return 0, 0
+
+    clauses = parse_query(query) if query else []
+    papers, deleted = [], []
+    written = removed = 0
+    position = 0
+
+    for tag, elem in iter_records(path):
+        position += 1
+        if position <= done:
+            continue  # already checkpointed by a previous run
+
+        if tag == 'PubmedArticle':
+            pmid = (elem.findtext('MedlineCitation/PMID') or '').strip()
+            if pmid and (pmids is None or pmid in pmids):
+                paper = parse_article(elem)
+                if not clauses or _matches_query(clauses, paper):
+                    papers.append(paper)
+        elif tag == 'DeleteCitation':
+            deleted.extend((p.text or '').strip() for p in elem.findall('PMID'))
+
+        if position % chunk_size == 0:
+            store.save_progress(key, size, position, False, papers, deleted, queue_annotation)
+            written += len(papers)
+            removed += len(deleted)
+            papers, deleted = [], []
+
+    store.save_progress(key, size, position, True, papers, deleted, queue_annotation)
+    written += len(papers)
+    removed += len(deleted)
+    print(f"{path}: {position} records, {written} papers written, {removed} deletions")
+    return written, removed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help='PubMed baseline/update files (.xml or .xml.gz)')
+    parser.add_argument('--db', default='papers.db', help='local paper store')
+    parser.add_argument('--pmids', help='file with one PMID per line to keep')
+    parser.add_argument('--query', default='',
+                        help='keep papers whose title/abstract contain all words ("quoted phrases")')
+    parser.add_argument('--queue-annotation', action='store_true',
+                        help='queue new papers for `annotation_store.py build --from-queue`')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--search-index', default='search_index.bin',
+                        help="search index to rebuild after ingesting ('' to skip)")
+    args = parser.parse_args(argv)
+
+    pmids = None
+    if args.pmids:
+        with open(args.pmids, 'r', encoding='utf-8') as f:
+            pmids = {ln.strip() for ln in f if ln.strip()}
+
+    store = PaperStore(args.db)
+    total = 0
+    for path in args.files:
+        written, _ = ingest_file(store, path, pmids=pmids, query=args.query,
+                                 queue_annotation=args.queue_annotation,
+                                 chunk_size=args.chunk_size)
+        total += written
+    print(f"Done: {total} papers written, {len(store)} papers in {args.db}")
+    if args.search_index:
+        # Rebuilt here, so servers do not have to rebuild it when they start
+        load_index(args.search_index, store)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,143 +1,429 @@
-"""Utility wrapper that lazily loads the scispaCy pipeline exactly once."""
+"""Utility wrapper that lazily loads each spaCy pipeline exactly once."""
 import functools
+import json
 import os
-import spacy
-from typing import List, Dict, Any
+import threading
+import time
+from typing import Callable, List, Dict, Any
 
-# Cache for NLP models
+from annotation_cache import AnnotationCache, make_key
+
+# Model used for dependency parsing and displaCy rendering
+PARSER_MODEL = "en_core_web_sm"
+
+# Registry of loaded models: one shared instance per model name
 _nlp_cache = {}
+_model_stats: Dict[str, Dict[str, float]] = {}
+_model_lock = threading.Lock()
+
+# Shared cache of NER/parse results (an AnnotationCache once configured)
+_annotation_cache: AnnotationCache = None
+# Bump when the format of cached results changes
+CACHE_FORMAT = "1"
+
+# Trait dictionary folded into the NER pipeline ("nlp.dictionary_in_pipeline")
+TRAIT_COMPONENT = "trait_phrase_matcher"
+TRAIT_SPAN_KEY = "traits"
+# doc.user_data key holding the dictionary version a doc was matched with
+TRAIT_VERSION_KEY = "trait_dictionary_version"
+_dictionary_in_pipeline = False
+_trait_dictionary = (None, "")  # (path, version) the pipeline component should match
+_trait_lock = threading.Lock()  # one dictionary load into the component at a time
+
+def configure(config=None):
+    """Configure the annotation cache ("annotation_cache") and the pipeline mode ("nlp")."""
+    global _annotation_cache, _dictionary_in_pipeline
+    _dictionary_in_pipeline = bool((config or {}).get("nlp", {}).get("dictionary_in_pipeline", False))
+    settings = (config or {}).get("annotation_cache", {})
+    if not settings.get("enabled", True):
+        _annotation_cache = None
+        return
+    try:
+        _annotation_cache = AnnotationCache(settings.get("path", "annotation_cache.db") or None,
+                                            max_entries=settings.get("max_entries", 200000),
+                                            memory_entries=settings.get("memory_entries", 1024))
+    except Exception as e:
+        print(f"Error opening annotation cache: {e}")
+        _annotation_cache = None
+
+def annotation_cache() -> AnnotationCache:
+    """The configured annotation cache, or None."""
+    return _annotation_cache
+
+def get_model_name() -> str:
+    """Name of the scispaCy NER model in use."""
+    return os.getenv("SCISPACY_MODEL", "en_ner_bionlp13cg_md")
+
+def _load_options(model_name: str) -> Dict[str, Any]:
+    """spacy.load() options per model."""
+    if model_name == get_model_name():
+        # Components the entity recognizer does not need
+        return {"disable": ["tagger", "lemmatizer"]}
+    return {}
+
+def _rss_mb() -> float:
+    """Resident memory of this process in MB (0 if it cannot be determined)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1e6
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+def get_model(model_name: str):
+    """Return the shared instance of a spaCy model, loading it on first use."""
+    nlp = _nlp_cache.get(model_name)
+    if nlp is not None:
+        return nlp
+    with _model_lock:
+        if model_name not in _nlp_cache:
+            import spacy  # imported here so processes that never run NLP start fast
+            rss_before, t0 = _rss_mb(), time.perf_counter()
+            nlp = spacy.load(model_name, **_load_options(model_name))
+            # The pipeline is complete before other threads can see it; it is never changed afterwards
+            if model_name == get_model_name() and _dictionary_in_pipeline:
+                add_trait_component(nlp)
+            _nlp_cache[model_name] = nlp
+            _model_stats[model_name] = {
+                "load_seconds": round(time.perf_counter() - t0, 3),
+                "rss_mb": round(_rss_mb() - rss_before, 1),
+            }
+            print(f"Loaded spaCy model {model_name} in {_model_stats[model_name]['load_seconds']}s "
+                  f"(+{_model_stats[model_name]['rss_mb']} MB RSS)")
+        return _nlp_cache[model_name]
+
+def warmup(model_names: List[str] = None) -> Dict[str, Dict[str, float]]:
+    """Load models ahead of the first request; returns model_stats()."""
+    for name in model_names or [get_model_name(), PARSER_MODEL]:
+        get_model(name)
+    return model_stats()
+
+def model_stats() -> Dict[str, Dict[str, float]]:
+    """Load time (seconds) and resident memory added (MB) for each loaded model."""
+    return {name: dict(stats) for name, stats in _model_stats.items()}
+
+def _get_nlp():
+    """Get the shared scispaCy NER model."""
+    return get_model(get_model_name())
+
+# --- Annotation Cache ---
+@functools.lru_cache(maxsize=None)
+def _model_version(model_name: str) -> str:
+    """Installed version of a model package, without loading the model."""
+    try:
+        from importlib.metadata import version
+        return version(model_name)
+    except Exception:
+        return ""
+
+def cache_key(kind: str, text: str, dict_version: str = "") -> str:
+    """Key of a result: a hash of the text and everything the result depends on.
 
-def _get_nlp(disable=None):
-    """Get a cached spaCy model with specified components disabled."""
-    model_name = os.getenv("SCISPACY_MODEL", "en_ner_bionlp13cg_md")
-    disable_key = tuple(sorted(disable)) if disable else None
-    cache_key = (model_name, disable_key)
-    
-    if cache_key not in _nlp_cache:
-        _nlp_cache[cache_key] = spacy.load(model_name, disable=disable)
-    
-    return _nlp_cache[cache_key]
+    Args:
+        kind: "ner", "dependencies" or "spans" (NER merged with dictionary matches).
+        text: The annotated text.
+        dict_version: Trait dictionary version, for results that include dictionary matches.
+    """
+    return make_key(CACHE_FORMAT, kind, pipeline_version(kind), dict_version, text)
+
+def pipeline_version(kind: str = "ner") -> str:
+    """Model name, installed version and load options behind results of this kind."""
+    model = PARSER_MODEL if kind == "dependencies" else get_model_name()
+    parts = [model, _model_version(model), _load_options(model)]
+    if kind == "spans" and _dictionary_in_pipeline:
+        parts.append(TRAIT_COMPONENT)  # token-based dictionary matches can differ slightly
+    return json.dumps(parts, sort_keys=True)
+
+def cached_batch(kind: str, texts: List[str], compute: Callable[[List[str]], List[Any]],
+                 dict_version: str = "") -> List[Any]:
+    """Results for texts, computing only those missing from the annotation cache.
+
+    Args:
+        kind: Result kind, see cache_key().
+        texts: Texts to annotate; the result list has the same order.
+        compute: Called once with the uncached texts; returns one result per text.
+        dict_version: Trait dictionary version the results depend on, if any.
+
+    Returns:
+        list: One result per text. Each call returns new objects that the caller may modify.
+    """
+    cache = _annotation_cache
+    if cache is None:
+        return compute(texts)
+
+    keys = [cache_key(kind, text, dict_version) for text in texts]
+    found = cache.get_many(keys)
+    todo = [i for i, key in enumerate(keys) if key not in found]
+    results = [found.get(key) for key in keys]
+    if todo:
+        computed = compute([texts[i] for i in todo])
+        # Failed parses are not cached, so they are retried next time
+        cache.put_many((keys[i], value) for i, value in zip(todo, computed)
+                       if not (isinstance(value, dict) and value.get("error")))
+        for i, value in zip(todo, computed):
+            results[i] = value
+    return results
 
 # --- NER Function ---
-@functools.lru_cache(maxsize=128) # Add caching for NER results on same text
 def ner(text: str) -> List[Dict]:
     """Return list of entity dicts (start, end, label, term)."""
     if not text or not text.strip():
         return []
+    return ner_batch([text])[0]
+
+def deduplicate(matches: List[Dict]) -> List[Dict]:
+    """Remove overlaps; keep longer span then earlier span."""
+    out, last_end = [], -1
+    for m in sorted(matches, key=lambda d: (d["start"], -(d["end"]-d["start"]))):
+        if m["start"] >= last_end:
+            out.append(m)
+            last_end = m["end"]
+    return out
+
+def entity_statistics(entities: List[Dict]) -> Dict[str, Dict]:
+    """Count entities per label and per term, split by source (model/dictionary)."""
+    entity_stats = {}
+    for entity in entities:
+        label = entity["label"]
+        source = entity.get("source", "model") # Get source
+        term = entity["term"].lower()
+
+        if label not in entity_stats:
+            entity_stats[label] = {"count": 0, "terms": {}, "sources": {"model": 0, "dictionary": 0}}
+
+        entity_stats[label]["count"] += 1
+        entity_stats[label]["sources"][source] += 1 # Increment source count
+
+        if term not in entity_stats[label]["terms"]:
+            entity_stats[label]["terms"][term] = {"count": 0, "sources": {"model": 0, "dictionary": 0}}
 
-    # Use the main model, disable components not needed *specifically* for NER
-    # The parser might be needed by other functions using the same cached model instance
-    nlp = _get_nlp(disable=["tagger", "lemmatizer"]) # Keep parser enabled if needed elsewhere
-    doc = nlp(text)
+        entity_stats[label]["terms"][term]["count"] += 1
+        entity_stats[label]["terms"][term]["sources"][source] += 1 # Increment term source count
 
+    # Convert term dictionaries to sorted lists
+    for label in entity_stats:
+        terms_dict = entity_stats[label]["terms"]
+        # Sort by frequency, then alphabetically
+        entity_stats[label]["terms"] = [
+            {"term": term, "count": details["count"], "sources": details["sources"]} # Include sources
+            for term, details in sorted(
+                terms_dict.items(),
+                key=lambda x: (-x[1]["count"], x[0]) # Sort by count desc, then term asc
+            )
+        ]
+    return entity_stats
+
+# --- Dictionary Matching in the Pipeline ---
+def dictionary_in_pipeline() -> bool:
+    """Whether dictionary matching runs inside the NER pipeline."""
+    return _dictionary_in_pipeline
+
+def add_trait_component(nlp) -> None:
+    """Add the trait component (trait_component.py) to a pipeline that no thread uses yet.
+
+    The component is loaded with the current dictionary, if one is set.
+    """
+    import trait_component  # noqa: F401 -- registers the factory
+    component = nlp.add_pipe(TRAIT_COMPONENT, last=True)
+    path, version = _trait_dictionary
+    if path:
+        _load_traits(component, path, version)
+
+def _load_traits(component, path: str, version: str) -> None:
+    with _trait_lock:
+        if component.version == version:
+            return
+        from trait_matcher import read_traits
+        t0 = time.perf_counter()
+        component.set_traits(read_traits(path), version)
+        print(f"Loaded trait dictionary {version} into the NER pipeline in {time.perf_counter() - t0:.2f}s")
+
+def set_trait_dictionary(path: str, version: str) -> None:
+    """Dictionary for the pipeline component.
+
+    If the NER pipeline is already loaded, its component gets a new matcher
+    for this dictionary here, in the caller's thread. The pipeline itself
+    is not changed, so requests running it are not affected.
+    """
+    global _trait_dictionary
+    _trait_dictionary = (path, version)
+    nlp = _nlp_cache.get(get_model_name())
+    if nlp is not None and nlp.has_pipe(TRAIT_COMPONENT):
+        _load_traits(nlp.get_pipe(TRAIT_COMPONENT), path, version)
+
+def _model_spans(doc) -> List[Dict]:
     return [
         {"start": ent.start_char, "end": ent.end_char, "label": ent.label_, "term": ent.text, "source": "model"}
         for ent in doc.ents
     ]
 
+def _dictionary_spans(doc, version: str) -> List[Dict]:
+    """doc.spans["traits"] as non-overlapping span dicts, filtered like TraitMatcher.find().
+
+    Returns None if the doc was not matched with dictionary `version`.
+    """
+    if doc.user_data.get(TRAIT_VERSION_KEY) != version:
+        return None
+    return deduplicate([
+        {"start": span.start_char, "end": span.end_char, "label": "TRAIT", "term": span.text,
+         "source": "dictionary"}
+        for span in doc.spans.get(TRAIT_SPAN_KEY, [])
+    ])
+
+# --- Batch Annotation ---
+def annotate_batch(texts: List[str], matcher=None, batch_size: int = 64,
+                   n_process: int = 1) -> List[List[Dict]]:
+    """Annotate many texts with a single nlp.pipe pass.
+
+    Model entities of each text are merged with its dictionary matches (when a
+    trait matcher is given) and deduplicated, as /visualize does for one text.
+
+    Args:
+        texts: Texts to annotate; the result list has the same order.
+        matcher: Optional TraitMatcher used for dictionary matches.
+        batch_size: Number of texts per nlp.pipe batch.
+        n_process: Number of worker processes used by nlp.pipe.
+
+    Returns:
+        list: One list of span dicts per input text.
+    """
+    dict_version = matcher.version if matcher is not None else ""
+    in_pipeline = matcher is not None and _dictionary_in_pipeline
+
+    def compute(texts: List[str]) -> List[List[Dict]]:
+        results: List[List[Dict]] = [[] for _ in texts]
+        todo = [(text, i) for i, text in enumerate(texts) if text and text.strip()]
+        if not todo:
+            return results
+
+        nlp = _get_nlp()
+        for doc, i in nlp.pipe(todo, as_tuples=True, batch_size=batch_size, n_process=n_process):
+            spans = _model_spans(doc)
+            # Dictionary spans come out of the same pass when the component matched this dictionary
+            traits = _dictionary_spans(doc, dict_version) if in_pipeline else None
+            if traits is not None:
+                spans += traits
+            elif matcher is not None:
+                spans += matcher.find(doc.text)
+            results[i] = deduplicate(spans)
+        return results
+
+    return cached_batch("spans", texts, compute, dict_version)
+
 # --- Dependency Parsing Function ---
-@functools.lru_cache(maxsize=128) # Add caching for dependency results on same text
+def _dependencies_from_doc(doc) -> Dict[str, Any]:
+    """Token and arc structure of a parsed doc, as returned by get_dependencies."""
+    # Create token data relative to the *full doc* with detailed error checking
+    tokens = []
+    for i, token in enumerate(doc):
+        try:
+            # Check attributes individually to pinpoint the error
+            token_text = token.text
+            token_pos = token.pos_
+            token_tag = token.tag_
+            token_dep = token.dep_
+            # Ensure token.head exists before accessing .i
+            token_head_i = token.head.i if token.head is not None else i
+            token_is_stop = token.is_stop
+            token_lemma = token.lemma_
+
+            tokens.append({
+                "id": i,
+                "text": token_text,
+                "pos": token_pos,
+                "tag": token_tag,
+                "dep": token_dep,
+                "head": token_head_i,
+                "is_stop": token_is_stop,
+                "lemma": token_lemma
+            })
+        except AttributeError as ae:
+             print(f"AttributeError accessing token {i} ('{token.text}'): {ae}")
+             # Add placeholder on error
+             tokens.append({
+                 "id": i, "text": token.text, "pos": "X", "tag": "X",
+                 "dep": "ERROR", "head": i, "is_stop": False, "lemma": token.text
+             })
+        except Exception as token_ex: # Catch other potential errors during token processing
+             print(f"Error processing token {i} ('{token.text}'): {token_ex}")
+             tokens.append({
+                 "id": i, "text": token.text, "pos": "X", "tag": "X",
+                 "dep": "ERROR", "head": i, "is_stop": False, "lemma": token.text
+             })
+
+
+    # Create dependency arcs relative to the *full doc* with error checking
+    arcs = []
+    if not tokens: # Check if token generation failed
+         print("No tokens generated, cannot create arcs.")
+         # Return error if no tokens were created
+         return {"tokens": [], "arcs": [], "text": doc.text, "error": "Token generation failed"}
+
+    for i, token_data in enumerate(tokens):
+        try:
+            # Use .get() for safer dictionary access
+            head_idx = token_data.get('head')
+            dep_label = token_data.get('dep', 'ERROR') # Default label if 'dep' is missing
+
+            if head_idx is None:
+                print(f"Token {i} ('{token_data.get('text')}') has missing 'head' index.")
+                continue # Skip arc generation for this token
+
+            # Ensure head_idx is valid within the doc and not pointing to itself
+            if head_idx != i and 0 <= head_idx < len(tokens):
+                start_idx = min(i, head_idx)
+                end_idx = max(i, head_idx)
+                arcs.append({
+                    "start": start_idx,
+                    "end": end_idx,
+                    "label": dep_label,
+                    "dir": "left" if head_idx < i else "right"
+                })
+        except Exception as arc_ex:
+             print(f"Error creating arc for token {i} ('{token_data.get('text')}'): {arc_ex}")
+             # Continue processing other arcs
+
+    return {
+        "tokens": tokens,
+        "arcs": arcs,
+        "text": doc.text
+    }
+
+def _get_parser():
+    """Return the shared parser model, or an error message if it is unusable."""
+    try:
+        nlp_parser = get_model(PARSER_MODEL)
+    except OSError:
+        # Handle case where en_core_web_sm is not downloaded
+        return None, "Model 'en_core_web_sm' not found. Please download it (python -m spacy download en_core_web_sm)."
+    if not nlp_parser.has_pipe("parser"):
+        # This shouldn't happen with en_core_web_sm, but check just in case
+        return None, "Parser component missing in en_core_web_sm."
+    return nlp_parser, None
+
 def get_dependencies(text: str) -> Dict[str, Any]:
     """Get dependency parsing information for visualization using the main model."""
+    return cached_batch("dependencies", [text], lambda texts: [_parse_dependencies(t) for t in texts])[0]
+
+def _parse_dependencies(text: str) -> Dict[str, Any]:
+    """Uncached get_dependencies()."""
     if not text or not text.strip():
         return {"tokens": [], "arcs": [], "text": text, "error": "Empty input text"}
 
     try:
-        # --- Revert to using en_core_web_sm specifically for parsing ---
-        # This ensures a reliable parser is used, separate from the NER model.
-        # Note: This increases memory usage as two models might be loaded.
-        try:
-            # Attempt to load en_core_web_sm if not already cached for parsing
-            # We can use a simple cache key for this specific purpose
-            if "en_core_web_sm_parser" not in _nlp_cache:
-                 _nlp_cache["en_core_web_sm_parser"] = spacy.load("en_core_web_sm")
-            nlp_parser = _nlp_cache["en_core_web_sm_parser"]
-        except OSError:
-             # Handle case where en_core_web_sm is not downloaded
-             return {"tokens": [], "arcs": [], "text": text, "error": "Model 'en_core_web_sm' not found. Please download it (python -m spacy download en_core_web_sm)."}
-
-        if not nlp_parser.has_pipe("parser"):
-             # This shouldn't happen with en_core_web_sm, but check just in case
-             return {"tokens": [], "arcs": [], "text": text, "error": "Parser component missing in en_core_web_sm."}
+        # Parse with en_core_web_sm, a reliable parser separate from the NER model.
+        nlp_parser, error = _get_parser()
+        if error:
+            return {"tokens": [], "arcs": [], "text": text, "error": error}
 
         # Process the ENTIRE text directly using the dedicated parser model
         doc = nlp_parser(text)
 
-        # Create token data relative to the *full doc* with detailed error checking
-        tokens = []
-        for i, token in enumerate(doc):
-            try:
-                # Check attributes individually to pinpoint the error
-                token_text = token.text
-                token_pos = token.pos_
-                token_tag = token.tag_
-                token_dep = token.dep_
-                # Ensure token.head exists before accessing .i
-                token_head_i = token.head.i if token.head is not None else i
-                token_is_stop = token.is_stop
-                token_lemma = token.lemma_
-
-                tokens.append({
-                    "id": i,
-                    "text": token_text,
-                    "pos": token_pos,
-                    "tag": token_tag,
-                    "dep": token_dep,
-                    "head": token_head_i,
-                    "is_stop": token_is_stop,
-                    "lemma": token_lemma
-                })
-            except AttributeError as ae:
-                 print(f"AttributeError accessing token {i} ('{token.text}'): {ae}")
-                 # Add placeholder on error
-                 tokens.append({
-                     "id": i, "text": token.text, "pos": "X", "tag": "X",
-                     "dep": "ERROR", "head": i, "is_stop": False, "lemma": token.text
-                 })
-            except Exception as token_ex: # Catch other potential errors during token processing
-                 print(f"Error processing token {i} ('{token.text}'): {token_ex}")
-                 tokens.append({
-                     "id": i, "text": token.text, "pos": "X", "tag": "X",
-                     "dep": "ERROR", "head": i, "is_stop": False, "lemma": token.text
-                 })
-
-
-        # Create dependency arcs relative to the *full doc* with error checking
-        arcs = []
-        if not tokens: # Check if token generation failed
-             print("No tokens generated, cannot create arcs.")
-             # Return error if no tokens were created
-             return {"tokens": [], "arcs": [], "text": doc.text, "error": "Token generation failed"}
-
-        for i, token_data in enumerate(tokens):
-            try:
-                # Use .get() for safer dictionary access
-                head_idx = token_data.get('head')
-                dep_label = token_data.get('dep', 'ERROR') # Default label if 'dep' is missing
-
-                if head_idx is None:
-                    print(f"Token {i} ('{token_data.get('text')}') has missing 'head' index.")
-                    continue # Skip arc generation for this token
-
-                # Ensure head_idx is valid within the doc and not pointing to itself
-                if head_idx != i and 0 <= head_idx < len(tokens):
-                    start_idx = min(i, head_idx)
-                    end_idx = max(i, head_idx)
-                    arcs.append({
-                        "start": start_idx,
-                        "end": end_idx,
-                        "label": dep_label,
-                        "dir": "left" if head_idx < i else "right"
-                    })
-            except Exception as arc_ex:
-                 print(f"Error creating arc for token {i} ('{token_data.get('text')}'): {arc_ex}")
-                 # Continue processing other arcs
-
-        return {
-            "tokens": tokens,
-            "arcs": arcs,
-            "text": doc.text
-        }
+        return _dependencies_from_doc(doc)
     except Exception as e:
         # Log the error properly in a real app
         print(f"Error in dependency parsing for text '{text[:50]}...': {e}")
@@ -149,15 +435,85 @@ def get_dependencies(text: str) -> Dict[str, Any]:
         }
 
 
-import spacy
-from spacy import displacy
+# --- Batch entry points used by the inference service ---
+def ner_batch(texts: List[str], batch_size: int = 64) -> List[List[Dict]]:
+    """ner() for many texts; uncached texts go through a single nlp.pipe pass."""
+    return cached_batch("ner", texts, functools.partial(_ner_pipe, batch_size=batch_size))
+
+def _ner_pipe(texts: List[str], batch_size: int = 64) -> List[List[Dict]]:
+    results: List[List[Dict]] = [[] for _ in texts]
+    todo = [(text, i) for i, text in enumerate(texts) if text and text.strip()]
+    if not todo:
+        return results
+
+    nlp = _get_nlp()
+    for doc, i in nlp.pipe(todo, as_tuples=True, batch_size=batch_size):
+        results[i] = _model_spans(doc)
+    return results
+
+def dependencies_batch(texts: List[str], batch_size: int = 64) -> List[Dict[str, Any]]:
+    """get_dependencies() for many texts; uncached texts go through a single nlp.pipe pass."""
+    return cached_batch("dependencies", texts, functools.partial(_dependencies_pipe, batch_size=batch_size))
+
+def _dependencies_pipe(texts: List[str], batch_size: int = 64) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = [
+        {"tokens": [], "arcs": [], "text": text, "error": "Empty input text"} for text in texts
+    ]
+    todo = [(text, i) for i, text in enumerate(texts) if text and text.strip()]
+    if not todo:
+        return results
+
+    nlp_parser, error = _get_parser()
+    if error:
+        for _, i in todo:
+            results[i] = {"tokens": [], "arcs": [], "text": texts[i], "error": error}
+        return results
+    for doc, i in nlp_parser.pipe(todo, as_tuples=True, batch_size=batch_size):
+        try:
+            results[i] = _dependencies_from_doc(doc)
+        except Exception as e:
+            print(f"Error in dependency parsing for text '{texts[i][:50]}...': {e}")
+            results[i] = {"tokens": [], "arcs": [], "text": texts[i], "error": f"Parsing failed: {str(e)}"}
+    return results
+
+
+def _doc_from_parse(parse: Dict[str, Any]):
+    """Rebuild a parsed spaCy Doc from a get_dependencies() result, without running a model."""
+    from spacy.lang.en import English
+    from spacy.tokens import Doc
+    from spacy.vocab import create_vocab
+
+    tokens = parse["tokens"]
+    words = [token["text"] for token in tokens]
+    # Whitespace after each token, recovered from the text the tokens were taken from
+    text, spaces, offset = parse.get("text", ""), [], 0
+    for word in words:
+        start = text.find(word, offset)
+        offset = start + len(word) if start >= 0 else offset
+        spaces.append(start >= 0 and text[offset:offset + 1] == " ")
+    # A new vocab per call keeps the strings of rendered sentences from piling up;
+    # its English lexical attributes (is_punct) are what displaCy's collapse_punct uses
+    return Doc(create_vocab("en", English.Defaults), words=words, spaces=spaces,
+               heads=[token["head"] for token in tokens], deps=[token["dep"] for token in tokens],
+               pos=[token["pos"] for token in tokens], tags=[token["tag"] for token in tokens],
+               lemmas=[token["lemma"] for token in tokens])
+
+def render_dependencies(parse: Dict[str, Any]) -> str:
+    """displaCy SVG for a get_dependencies() result, without parsing the text again.
+
+    The Doc is rebuilt from the stored parse, so displaCy merges punctuation
+    into the preceding word (collapse_punct) as it does for a freshly parsed Doc.
+    """
+    from spacy import displacy
 
-nlp_displacy = spacy.load("en_core_web_sm")  # Use small model for browser rendering
+    return displacy.render(_doc_from_parse(parse), style="dep", page=False)
 
 def render_displacy(sentence: str) -> str:
-    doc = nlp_displacy(sentence)
-    html = displacy.render(doc, style="dep", page=False)  # SVG only, no full HTML
-    return html
+    """displaCy SVG (no full HTML page) for a sentence; the parse comes from get_dependencies()."""
+    parse = get_dependencies(sentence)
+    if parse.get("error"):
+        raise ValueError(parse["error"])
+    return render_dependencies(parse)
 
 # --- Sentence Splitting Function (Optional - Keep if used elsewhere) ---
 # If this function is needed, refactor to use _get_nlp() as well
@@ -0,0 +1,185 @@
+"""SQLite store for local papers (the same dicts as in QTL_text.json).
+
+Lookups by PMID go through the primary key index and iteration streams rows
+in batches, so neither startup time nor memory grows with the corpus. Convert
+an existing JSON corpus once with:
+
+    python paper_store.py convert QTL_text.json --db papers.db
+"""
+import argparse
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS papers (
+        id INTEGER PRIMARY KEY,
+        pmid TEXT NOT NULL UNIQUE,
+        data TEXT NOT NULL
+    )""",
+    # Progress of ingested files, so an interrupted ingestion can resume
+    """CREATE TABLE IF NOT EXISTS ingested_files (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        articles_done INTEGER NOT NULL,
+        completed INTEGER NOT NULL
+    )""",
+    # Papers waiting to be annotated into the annotation store
+    """CREATE TABLE IF NOT EXISTS annotation_queue (
+        pmid TEXT PRIMARY KEY
+    )""",
+    # Counter bumped by every change to the papers table (see version())
+    """CREATE TABLE IF NOT EXISTS store_info (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )""",
+    "INSERT OR IGNORE INTO store_info VALUES ('modifications', 0)",
+    # Triggers see every write, including upserts of existing PMIDs and deletions
+    """CREATE TRIGGER IF NOT EXISTS papers_inserted AFTER INSERT ON papers BEGIN
+        UPDATE store_info SET value = value + 1 WHERE key = 'modifications';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS papers_updated AFTER UPDATE ON papers
+    WHEN old.data IS NOT new.data OR old.pmid IS NOT new.pmid BEGIN
+        UPDATE store_info SET value = value + 1 WHERE key = 'modifications';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS papers_deleted AFTER DELETE ON papers BEGIN
+        UPDATE store_info SET value = value + 1 WHERE key = 'modifications';
+    END""",
+]
+
+
+class PaperStore:
+    """Papers keyed by PMID, with lazy iteration in insertion order."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Close this thread's connection; the next call opens a new one."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- papers ---
+    def get(self, pmid: str, default=None) -> Optional[Dict]:
+        row = self._conn().execute("SELECT data FROM papers WHERE pmid = ?", (pmid,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def __contains__(self, pmid) -> bool:
+        return self._conn().execute(
+            "SELECT 1 FROM papers WHERE pmid = ?", (pmid,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def version(self) -> str:
+        """Changes when papers are added, changed or removed; derived indexes store it.
+
+        Re-importing a paper with identical data leaves the version unchanged.
+        """
+        count, = self._conn().execute("SELECT COUNT(*) FROM papers").fetchone()
+        modifications, = self._conn().execute(
+            "SELECT value FROM store_info WHERE key = 'modifications'").fetchone()
+        return f"{count}:{modifications}"
+
+    def items(self, batch_size: int = 1000) -> Iterator[Tuple[str, Dict]]:
+        """Yield (pmid, paper) pairs without loading the whole table."""
+        last_id = 0
+        conn = self._conn()
+        while True:
+            rows = conn.execute(
+                "SELECT id, pmid, data FROM papers WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for row_id, pmid, data in rows:
+                yield pmid, json.loads(data)
+            last_id = rows[-1][0]
+
+    def _put_many(self, conn: sqlite3.Connection, papers: Iterable[Dict]) -> int:
+        data = [(paper["PMID"], json.dumps(paper)) for paper in papers]
+        conn.executemany(
+            "INSERT INTO papers (pmid, data) VALUES (?, ?) "
+            "ON CONFLICT(pmid) DO UPDATE SET data = excluded.data", data)
+        return len(data)
+
+    def put_many(self, papers: Iterable[Dict]) -> int:
+        """Insert or update papers; each must have a "PMID" key."""
+        with self._conn() as conn:
+            return self._put_many(conn, papers)
+
+    def import_json(self, json_path: str, batch_size: int = 1000) -> int:
+        """Import papers from a QTL_text.json-style list; existing PMIDs are updated."""
+        with open(json_path, "r", encoding="utf-8") as f:
+            papers = [item for item in json.load(f) if "PMID" in item]
+        with self._conn() as conn:
+            for i in range(0, len(papers), batch_size):
+                self._put_many(conn, papers[i:i + batch_size])
+        return len(papers)
+
+    # --- ingestion progress ---
+    def file_progress(self, path: str, size: int) -> Tuple[int, bool]:
+        """Return (articles already ingested, completed) for a file of this size."""
+        row = self._conn().execute(
+            "SELECT size, articles_done, completed FROM ingested_files WHERE path = ?",
+            (path,)).fetchone()
+        if row is None or row[0] != size:
+            return 0, False
+        return row[1], bool(row[2])
+
+    def save_progress(self, path: str, size: int, articles_done: int, completed: bool,
+                      papers: List[Dict] = (), deleted: List[str] = (), queue: bool = False) -> None:
+        """Write a chunk of papers and the file checkpoint in one transaction."""
+        with self._conn() as conn:
+            if papers:
+                self._put_many(conn, papers)
+                if queue:
+                    conn.executemany("INSERT OR IGNORE INTO annotation_queue VALUES (?)",
+                                     [(p["PMID"],) for p in papers])
+            if deleted:
+                conn.executemany("DELETE FROM papers WHERE pmid = ?", [(p,) for p in deleted])
+                conn.executemany("DELETE FROM annotation_queue WHERE pmid = ?", [(p,) for p in deleted])
+            conn.execute("INSERT OR REPLACE INTO ingested_files VALUES (?, ?, ?, ?)",
+                         (path, size, articles_done, int(completed)))
+
+    # --- annotation queue ---
+    def queued(self, limit: int = 1000) -> List[Dict]:
+        """Return up to `limit` queued papers."""
+        rows = self._conn().execute(
+            "SELECT p.data FROM annotation_queue q JOIN papers p ON p.pmid = q.pmid LIMIT ?",
+            (limit,)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def dequeue(self, pmids: Iterable[str]) -> None:
+        with self._conn() as conn:
+            conn.executemany("DELETE FROM annotation_queue WHERE pmid = ?", [(p,) for p in pmids])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local paper store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="import a QTL_text.json-style file")
+    convert.add_argument("json_path", nargs="?", default="QTL_text.json")
+    convert.add_argument("--db", default="papers.db")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        store = PaperStore(args.db)
+        n = store.import_json(args.json_path)
+        print(f"Imported {n} papers into {args.db} ({len(store)} papers in total)")
@@ -0,0 +1,135 @@
+"""Per-request profiling for production debugging.
+
+Two modes are available:
+- "sample" polls the request thread's stack every interval_ms from a helper
+  thread. It writes collapsed stacks (`frame;frame;frame count` per line),
+  which flamegraph.pl, speedscope and inferno read directly.
+- "cprofile" runs the request under cProfile and writes a pstats file
+  (snakeviz, flameprof, `python -m pstats`).
+
+Only the profiled request's thread is traced. Profiles are written to a
+directory that keeps the newest max_files.
+"""
+import cProfile
+import collections
+import itertools
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MODES = ("sample", "cprofile")
+_NAME_RE = re.compile(r"^[\w.-]+$")
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval: float = 0.002):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: "collections.Counter[Tuple[str, ...]]" = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    @staticmethod
+    def _label(code) -> str:
+        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        # Same frame format as py-spy; only the last space on a line separates the count
+        return label.replace(";", ":")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self) -> str:
+        """Collapsed stacks, one `root;...;leaf count` line per distinct stack."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfileStore:
+    """Directory of profile files that keeps only the newest max_files."""
+
+    def __init__(self, directory: str, max_files: int = 50):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, label: str, data: bytes, extension: str) -> str:
+        """Write a profile and return its file name."""
+        label = re.sub(r"[^\w-]+", "_", label).strip("_")[:60] or "request"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._counter)}-{label}.{extension}"
+        with self._lock:
+            with open(os.path.join(self.directory, name), "wb") as f:
+                f.write(data)
+            self._prune()
+        return name
+
+    def _prune(self) -> None:
+        files = self.list()
+        for old in files[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, old["name"]))
+            except OSError:
+                pass
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Stored profiles, newest first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append({"name": name, "size": stat.st_size, "mtime": stat.st_mtime})
+        entries.sort(key=lambda e: e["mtime"], reverse=True)
+        return entries
+
+    def path(self, name: str) -> Optional[str]:
+        """Full path of a stored profile, or None (also for names that are not plain file names)."""
+        if not _NAME_RE.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+def profile_call(fn: Callable, mode: str = "sample",
+                 interval_ms: float = 2.0) -> Tuple[Any, bytes, str]:
+    """Run fn() under a profiler.
+
+    Returns:
+        tuple: (fn's return value, profile data, file extension). If fn raises,
+        the exception propagates and no profile is returned.
+    """
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        result = profiler.runcall(fn)
+        profiler.create_stats()
+        return result, marshal.dumps(profiler.stats), "prof"
+
+    sampler = SamplingProfiler(threading.get_ident(), interval_ms / 1000.0)
+    sampler.start()
+    try:
+        result = fn()
+    finally:
+        sampler.stop()
+    return result, sampler.folded().encode("utf-8"), "folded"
@@ -0,0 +1,123 @@
+"""Bounded on-disk cache of PubMed papers, shared by threads and processes."""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    pmid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+_INDEX = "CREATE INDEX IF NOT EXISTS papers_accessed ON papers (accessed)"
+
+# Only record a read if the entry's access time is older than this, so hot
+# entries do not turn every cache hit into a write
+_TOUCH_INTERVAL = 60.0
+# Run eviction once every this many writes
+_EVICT_EVERY = 100
+
+
+class PubMedCache:
+    """SQLite (WAL mode) cache of paper dicts keyed by PMID.
+
+    Every entry is written on its own, entries expire after `ttl` seconds and
+    the least recently used entries are evicted beyond `max_entries`. Opening
+    the cache does not read its contents, so startup does not depend on its size.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute(_SCHEMA)
+            conn.execute(_INDEX)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Close this thread's connection; the next call opens a new one."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def get(self, pmid: str) -> Optional[Dict]:
+        """Return the cached paper, or None if missing or expired."""
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT data, created, accessed FROM papers WHERE pmid = ?", (pmid,)).fetchone()
+        if row is None or (self.ttl and now - row[1] > self.ttl):
+            self.misses += 1
+            return None
+        if now - row[2] > _TOUCH_INTERVAL:
+            with conn:
+                conn.execute("UPDATE papers SET accessed = ? WHERE pmid = ?", (now, pmid))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def __contains__(self, pmid: str) -> bool:
+        row = self._conn().execute("SELECT created FROM papers WHERE pmid = ?", (pmid,)).fetchone()
+        return row is not None and not (self.ttl and time.time() - row[0] > self.ttl)
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def put(self, pmid: str, paper: Dict) -> None:
+        """Store one paper."""
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?)",
+                         (pmid, json.dumps(paper), now, now))
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % _EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries and the least recently used ones beyond max_entries."""
+        removed = 0
+        with self._conn() as conn:
+            if self.ttl:
+                removed += conn.execute(
+                    "DELETE FROM papers WHERE created < ?", (time.time() - self.ttl,)).rowcount
+            if self.max_entries:
+                removed += conn.execute(
+                    "DELETE FROM papers WHERE pmid IN ("
+                    "SELECT pmid FROM papers ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)).rowcount
+        return removed
+
+    def import_json(self, json_path: str) -> int:
+        """One-time import of a legacy pubmed_cache.json file."""
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        now = time.time()
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO papers VALUES (?, ?, ?, ?)",
+                [(pmid, json.dumps(paper), now, now) for pmid, paper in entries.items()])
+        return len(entries)
@@ -1,64 +1,432 @@
 import re
-import urllib.request
-from time import sleep
+import io
+import asyncio
+import weakref
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
 import json
 import os
 from datetime import datetime
-import httpx, asyncio
+import httpx
+from pubmed_cache import PubMedCache
 
+# NCBI recommends at most ~200 UIDs per GET request
+EFETCH_BATCH_SIZE = 200
+# Status codes worth retrying: rate limited or a transient server error
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
+# E-utilities connection settings (see configure())
+_base_url = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
+_api_key = os.getenv('NCBI_API_KEY', '')
+_max_retries = 3
+_backoff = 0.5
+_timeout = 10
 
-# Cache for PubMed API results
-_pubmed_cache = {}
-_cache_file = 'pubmed_cache.json'
+# Cache for PubMed API results (a PubMedCache once configured)
+_pubmed_cache = None
+_cache_file = 'pubmed_cache.db'
+_cache_ttl = 30 * 24 * 3600
+_cache_max_entries = 100000
 _use_cache = True
-_request_delay = 0.5
 
-async def _async_fetch(url: str) -> str:
-      async with httpx.AsyncClient(timeout=10) as client:
-          resp = await client.get(url)
-          resp.raise_for_status()
-          return resp.text
+
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` requests per second on average,
+    with bursts of up to `capacity` requests."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token; return how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait, without blocking the event loop, until a request may be sent."""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+# One pooled client and one limiter shared by every PubMed call in the process
+_client = None
+_client_lock = threading.Lock()
+_rate_limiter = TokenBucket(3)
+
+def _get_client():
+    """Return the shared HTTP client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    base_url=_base_url,
+                    timeout=_timeout,
+                    limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+                )
+    return _client
+
+def close_client():
+    """Close the shared HTTP client (it is recreated on next use)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+# Async clients are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+def _get_async_client():
+    """Return the AsyncClient of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            base_url=_base_url,
+            timeout=_timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return client
+
+async def close_async_client():
+    """Close the AsyncClient of the running event loop."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def _retry_delay(response, attempt):
+    """Seconds to wait before retry number `attempt` (0-based)."""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return _backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+
+def _request_params(params):
+    params = dict(params)
+    if _api_key:
+        params['api_key'] = _api_key
+    return params
+
+def eutils_get(endpoint, params):
+    """
+    Sends a rate-limited GET request to an E-utilities endpoint, retrying
+    with exponential backoff on 429/5xx responses and connection errors.
+
+    Args:
+        endpoint (str): E-utility name, e.g. 'esearch.fcgi'
+        params (dict): Query parameters (db, term, id, ...)
+
+    Returns:
+        str: Response body
+    """
+    params = _request_params(params)
+    client = _get_client()
+    for attempt in range(_max_retries + 1):
+        _rate_limiter.acquire()
+        response = None
+        try:
+            response = client.get(endpoint, params=params)
+            if response.status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                return response.text
+            error = httpx.HTTPStatusError(
+                f"{response.status_code} from {endpoint}", request=response.request, response=response)
+        except httpx.TransportError as e:
+            error = e
+        if attempt == _max_retries:
+            raise error
+        delay = _retry_delay(response, attempt)
+        print(f"PubMed request to {endpoint} failed ({error}); retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+def eutils_stream(endpoint, params):
+    """
+    Like eutils_get(), but yields the response body in chunks as they arrive.
+    Failed requests are retried only until the first chunk has been received.
+
+    Yields:
+        bytes: Chunks of the response body
+    """
+    params = _request_params(params)
+    client = _get_client()
+    for attempt in range(_max_retries + 1):
+        _rate_limiter.acquire()
+        response = None
+        try:
+            response = client.send(client.build_request('GET', endpoint, params=params), stream=True)
+        except httpx.TransportError as e:
+            error = e
+        else:
+            if response.status_code not in RETRY_STATUS_CODES:
+                try:
+                    response.raise_for_status()
+                    yield from response.iter_bytes()
+                finally:
+                    response.close()
+                return
+            response.close()
+            error = httpx.HTTPStatusError(
+                f"{response.status_code} from {endpoint}", request=response.request, response=response)
+        if attempt == _max_retries:
+            raise error
+        delay = _retry_delay(response, attempt)
+        print(f"PubMed request to {endpoint} failed ({error}); retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+async def eutils_get_async(endpoint, params):
+    """eutils_get() for the event loop: waits for the rate limiter and retries without blocking."""
+    params = _request_params(params)
+    client = _get_async_client()
+    for attempt in range(_max_retries + 1):
+        await _rate_limiter.acquire_async()
+        response = None
+        try:
+            response = await client.get(endpoint, params=params)
+            if response.status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                return response.text
+            error = httpx.HTTPStatusError(
+                f"{response.status_code} from {endpoint}", request=response.request, response=response)
+        except httpx.TransportError as e:
+            error = e
+        if attempt == _max_retries:
+            raise error
+        delay = _retry_delay(response, attempt)
+        print(f"PubMed request to {endpoint} failed ({error}); retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
 def load_cache():
-    """Load the PubMed cache from file."""
+    """Open the on-disk PubMed cache, importing a legacy JSON cache on first use."""
     global _pubmed_cache
-    if os.path.exists(_cache_file):
+    # Older configs point cache_path at the JSON file; keep the database next to it
+    db_path = os.path.splitext(_cache_file)[0] + '.db'
+    legacy_json = os.path.splitext(_cache_file)[0] + '.json'
+    try:
+        _pubmed_cache = PubMedCache(db_path, ttl=_cache_ttl, max_entries=_cache_max_entries)
+    except Exception as e:
+        print(f"Error opening PubMed cache: {e}")
+        _pubmed_cache = None
+        return
+
+    if os.path.exists(legacy_json) and len(_pubmed_cache) == 0:
         try:
-            with open(_cache_file, 'r', encoding='utf-8') as f:
-                _pubmed_cache = json.load(f)
-            print(f"Loaded {len(_pubmed_cache)} cached PubMed entries")
+            count = _pubmed_cache.import_json(legacy_json)
+            print(f"Imported {count} entries from {legacy_json} into {db_path}")
         except Exception as e:
-            print(f"Error loading PubMed cache: {e}")
-            _pubmed_cache = {}
-    else:
-        _pubmed_cache = {}
+            print(f"Error importing legacy PubMed cache: {e}")
 
-def save_cache():
-    """Save the PubMed cache to file."""
-    if not _use_cache:
-        return
-        
-    try:
-        with open(_cache_file, 'w', encoding='utf-8') as f:
-            json.dump(_pubmed_cache, f, indent=2)
-        print(f"Saved {len(_pubmed_cache)} entries to PubMed cache")
-    except Exception as e:
-        print(f"Error saving PubMed cache: {e}")
+def get_cache():
+    """The PubMed cache in use, or None when caching is disabled."""
+    return _pubmed_cache if _use_cache else None
 
 def configure(config=None):
     """Configure the PubMed utilities with the given settings."""
-    global _cache_file, _use_cache, _request_delay
+    global _cache_file, _cache_ttl, _cache_max_entries, _use_cache, _base_url, _api_key, _max_retries, _backoff, _timeout, _rate_limiter
     
     if config and 'pubmed_api' in config:
         api_config = config['pubmed_api']
         _use_cache = api_config.get('cache_results', True)
-        _cache_file = api_config.get('cache_path', 'pubmed_cache.json')
-        _request_delay = api_config.get('request_delay', 0.5)
+        _cache_file = api_config.get('cache_path', 'pubmed_cache.db')
+        ttl_days = api_config.get('cache_ttl_days', 30)
+        _cache_ttl = ttl_days * 24 * 3600 if ttl_days else None
+        _cache_max_entries = api_config.get('cache_max_entries', 100000)
+        _base_url = api_config.get('base_url', _base_url)
+        _api_key = os.getenv('NCBI_API_KEY') or api_config.get('api_key', '')
+        _max_retries = api_config.get('max_retries', 3)
+        _backoff = api_config.get('retry_backoff', 0.5)
+        _timeout = api_config.get('timeout', 10)
+        rate = api_config.get('requests_per_second')
+    else:
+        rate = None
+
+    # NCBI allows 3 requests/second without an API key and 10 with one
+    _rate_limiter = TokenBucket(rate or (10 if _api_key else 3))
+    close_client()
     
     # Load the cache if enabled
     if _use_cache:
         load_cache()
 
+def _text(elem):
+    """Full text of an element, including nested markup such as <i> or <sup>."""
+    if elem is None:
+        return ""
+    return "".join(elem.itertext()).strip()
+
+def parse_article(article):
+    """Converts a <PubmedArticle> element into the paper dict used by the app."""
+    citation_elem = article.find('MedlineCitation')
+    paper_info = {}
+
+    paper_info['PMID'] = _text(citation_elem.find('PMID'))
+
+    art = citation_elem.find('Article')
+    if art is None:
+        art = ET.Element('Article')
+
+    paper_info['Title'] = _text(art.find('ArticleTitle')) or "Title not available"
+
+    # Structured abstracts have several labelled <AbstractText> sections
+    sections = []
+    for section in art.findall('Abstract/AbstractText'):
+        text = _text(section)
+        if not text:
+            continue
+        label = section.get('Label')
+        sections.append(f"{label}: {text}" if label else text)
+    paper_info['Abstract'] = " ".join(sections) or "Abstract not available"
+
+    journal_title = _text(art.find('Journal/Title'))
+    if journal_title:
+        pub_date = art.find('Journal/JournalIssue/PubDate')
+        year = _text(pub_date.find('Year')) if pub_date is not None else ""
+        if not year and pub_date is not None:
+            # e.g. <MedlineDate>1998 Dec-1999 Jan</MedlineDate>
+            year = _text(pub_date.find('MedlineDate'))[:4]
+        volume = _text(art.find('Journal/JournalIssue/Volume'))
+        issue = _text(art.find('Journal/JournalIssue/Issue'))
+        pages = _text(art.find('Pagination/MedlinePgn'))
+
+        citation = f"{journal_title}. {year}"
+        if volume:
+            citation += f";{volume}"
+        if issue:
+            citation += f"({issue})"
+        if pages:
+            citation += f":{pages}"
+
+        paper_info['Journal'] = citation
+
+        # Add publication date
+        if year:
+            month = _text(pub_date.find('Month'))
+            day = _text(pub_date.find('Day'))
+            paper_info['PublicationDate'] = f"{year} {month} {day}".strip()
+    else:
+        paper_info['Journal'] = "Journal information not available"
+
+    # Extract author information
+    authors = []
+    for author in art.findall('AuthorList/Author'):
+        last_name = _text(author.find('LastName'))
+        fore_name = _text(author.find('ForeName'))
+        collective_name = _text(author.find('CollectiveName'))
+
+        author_info = {}
+        if last_name:
+            author_info["name"] = f"{last_name} {fore_name}".strip()
+        elif collective_name:
+            author_info["name"] = collective_name
+        else:
+            continue  # Skip if no name found
+
+        author_info["affiliation"] = _text(author.find('AffiliationInfo/Affiliation'))
+        authors.append(author_info)
+
+    paper_info['Authors'] = authors
+
+    # Create author display string
+    if authors:
+        paper_info['AuthorDisplay'] = ", ".join(author.get("name", "") for author in authors)
+    else:
+        paper_info['AuthorDisplay'] = "No author information available"
+
+    # Add category (not available from API, default to "External")
+    paper_info['Category'] = "External"
+    return paper_info
+
+def parse_pubmed_xml(xml_data):
+    """
+    Streams papers out of an efetch <PubmedArticleSet> response.
+
+    Args:
+        xml_data (bytes | str): The efetch XML
+
+    Yields:
+        dict: Paper information, one per <PubmedArticle>
+    """
+    if isinstance(xml_data, str):
+        xml_data = xml_data.encode('utf-8')
+    for _, elem in ET.iterparse(io.BytesIO(xml_data), events=('end',)):
+        if elem.tag == 'PubmedArticle':
+            yield parse_article(elem)
+            elem.clear()
+
+def _efetch_params(pmids):
+    return {'db': 'pubmed', 'retmode': 'xml', 'id': ','.join(pmids)}
+
+def _store_papers(xml_data, cache):
+    """Parse an efetch response and cache its papers; returns PMID -> paper."""
+    papers = {}
+    for paper_info in parse_pubmed_xml(xml_data):
+        pmid = paper_info['PMID']
+        papers[pmid] = paper_info
+        if cache is not None:
+            cache.put(pmid, paper_info)
+    return papers
+
+def _cached_papers(pmids, cache):
+    """Split PMIDs into (cached papers, PMIDs still to fetch)."""
+    papers = {}
+    missing = []
+    for pmid in pmids:
+        cached = cache.get(pmid) if cache is not None else None
+        if cached is not None:
+            papers[pmid] = cached
+        elif pmid not in missing:
+            missing.append(pmid)
+    return papers, missing
+
+def fetch_pubmed_papers(pmids):
+    """
+    Fetches many papers from PubMed with one efetch request per chunk of PMIDs.
+    Cached PMIDs are not requested again.
+
+    Args:
+        pmids (list): PubMed IDs to fetch
+
+    Returns:
+        dict: PMID -> paper information, for every PMID that was found
+    """
+    cache = get_cache()
+    papers, missing = _cached_papers(pmids, cache)
+
+    for i in range(0, len(missing), EFETCH_BATCH_SIZE):
+        chunk = missing[i:i + EFETCH_BATCH_SIZE]
+        try:
+            xml_data = eutils_get('efetch.fcgi', _efetch_params(chunk))
+            papers.update(_store_papers(xml_data, cache))
+        except Exception as e:
+            print(f"Error fetching papers from PubMed: {e}")
+
+    not_found = [p for p in missing if p not in papers]
+    if not_found:
+        print(f"PMIDs not found in PubMed: {', '.join(not_found)}")
+    return papers
+
 def fetch_pubmed_paper(pmid):
     """
     Fetches a paper from PubMed API by PMID.
@@ -70,212 +438,184 @@ def fetch_pubmed_paper(pmid):
     Returns:
         dict: Paper information (PMID, Title, Abstract, Journal) or None if not found
     """
-    # Check cache first if enabled
-    if _use_cache and pmid in _pubmed_cache:
-        print(f"Using cached data for PMID {pmid}")
-        return _pubmed_cache[pmid]
-    # Base URL for NCBI E-utilities
-    base_url = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
-    db = 'db=pubmed'
-    
-    # Use efetch directly since we have the PMID
-    fetch_eutil = 'efetch.fcgi?'
-    fetch_id = '&id=' + pmid
-    fetch_retmode = "&retmode=xml"  # XML provides structured data
-    
-    # Create the complete URL
-    fetch_url = base_url + fetch_eutil + db + fetch_id + fetch_retmode
-
-    try:
-        xml_data = asyncio.run(_async_fetch(fetch_url))
-        
-        # Parse the response
-        paper_info = {}
-        
-        # Extract PMID (already known, but confirm)
-        paper_info['PMID'] = pmid
-        
-        # Extract title
-        title_match = re.search(r'<ArticleTitle>(.*?)</ArticleTitle>', xml_data, re.DOTALL)
-        if title_match:
-            paper_info['Title'] = title_match.group(1).strip()
-        else:
-            paper_info['Title'] = "Title not available"
-        
-        # Extract abstract
-        abstract_match = re.search(r'<AbstractText.*?>(.*?)</AbstractText>', xml_data, re.DOTALL)
-        if abstract_match:
-            paper_info['Abstract'] = abstract_match.group(1).strip()
-        else:
-            paper_info['Abstract'] = "Abstract not available"
-        
-        # Extract journal info
-        journal_match = re.search(r'<Journal>.*?<Title>(.*?)</Title>.*?</Journal>', xml_data, re.DOTALL)
-        if journal_match:
-            journal_title = journal_match.group(1).strip()
-            
-            # Get year, volume, issue if available
-            year_match = re.search(r'<PubDate>.*?<Year>(.*?)</Year>.*?</PubDate>', xml_data)
-            volume_match = re.search(r'<Volume>(.*?)</Volume>', xml_data)
-            issue_match = re.search(r'<Issue>(.*?)</Issue>', xml_data)
-            pages_match = re.search(r'<Pagination>.*?<MedlinePgn>(.*?)</MedlinePgn>.*?</Pagination>', xml_data, re.DOTALL)
-            
-            year = year_match.group(1) if year_match else ""
-            volume = volume_match.group(1) if volume_match else ""
-            issue = issue_match.group(1) if issue_match else ""
-            pages = pages_match.group(1) if pages_match else ""
-            
-            citation = f"{journal_title}. {year}"
-            if volume:
-                citation += f";{volume}"
-            if issue:
-                citation += f"({issue})"
-            if pages:
-                citation += f":{pages}"
-            
-            paper_info['Journal'] = citation
-            
-            # Add publication date
-            if year:
-                pub_date = year
-                month_match = re.search(r'<PubDate>.*?<Month>(.*?)</Month>.*?</PubDate>', xml_data)
-                day_match = re.search(r'<PubDate>.*?<Day>(.*?)</Day>.*?</PubDate>', xml_data)
-                
-                month = month_match.group(1) if month_match else ""
-                day = day_match.group(1) if day_match else ""
-                
-                paper_info['PublicationDate'] = f"{year} {month} {day}".strip()
-        else:
-            paper_info['Journal'] = "Journal information not available"
-        
-        # Extract author information
-        authors = []
-        author_list_match = re.findall(r'<Author.*?>(.*?)</Author>', xml_data, re.DOTALL)
-        
-        for author_xml in author_list_match:
-            last_name_match = re.search(r'<LastName>(.*?)</LastName>', author_xml)
-            fore_name_match = re.search(r'<ForeName>(.*?)</ForeName>', author_xml)
-            collective_name_match = re.search(r'<CollectiveName>(.*?)</CollectiveName>', author_xml)
-            affiliation_match = re.search(r'<Affiliation>(.*?)</Affiliation>', author_xml)
-            
-            author_info = {}
-            
-            if last_name_match and fore_name_match:
-                author_info["name"] = f"{last_name_match.group(1)} {fore_name_match.group(1)}"
-            elif collective_name_match:
-                author_info["name"] = collective_name_match.group(1)
-            else:
-                continue  # Skip if no name found
-            
-            if affiliation_match:
-                author_info["affiliation"] = affiliation_match.group(1).strip()
-            else:
-                author_info["affiliation"] = ""
-            
-            authors.append(author_info)
-        
-        # Add authors to paper info
-        paper_info['Authors'] = authors
-        
-        # Create author display string
-        if authors:
-            author_names = [author.get("name", "") for author in authors]
-            paper_info['AuthorDisplay'] = ", ".join(author_names)
-        else:
-            paper_info['AuthorDisplay'] = "No author information available"
-        
-        # Add category (not available from API, default to "External")
-        paper_info['Category'] = "External"
-        
-        # Add to cache if enabled
-        if _use_cache:
-            _pubmed_cache[pmid] = paper_info
-            # Save cache periodically (every 10 new entries)
-            if len(_pubmed_cache) % 10 == 0:
-                save_cache()
-        
-        return paper_info
-        
-    except urllib.error.HTTPError as e:
-        if e.code == 404:
-            print(f"PMID {pmid} not found in PubMed")
-            return None
-        else:
-            print(f"HTTP Error: {e.code} - {e.reason}")
-            return None
-    except Exception as e:
-        print(f"Error fetching paper from PubMed: {e}")
-        return None
+    return fetch_pubmed_papers([pmid]).get(pmid)
     
-def search_pubmed(query, max_results=10, start_date=None, end_date=None):
-    """
-    Searches PubMed for papers matching a query, optionally filtering by date.
-
-    Args:
-        query (str): The search query
-        max_results (int): Maximum number of results to return
-        
-    Returns:
-        list: List of paper information dictionaries
-    """
-    # common settings between esearch and efetch
-    base_url = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
-    db = 'db=pubmed'
-
-    # esearch settings
-    search_eutil = 'esearch.fcgi?'
-    search_term_param = '&term=' + urllib.parse.quote(query)
-    search_usehistory = '&usehistory=y'
-    search_retmax = f'&retmax={max_results}'
-    search_datetype = '&datetype=pdat' # Search by publication date
-    search_mindate = ''
-    search_maxdate = ''
+def _search_params(query, max_results=10, start_date=None, end_date=None):
+    """esearch parameters for a query, optionally filtered by publication date."""
+    params = {
+        'db': 'pubmed',
+        'term': query,
+        'usehistory': 'y',
+        'retmax': max_results,
+        'datetype': 'pdat', # Search by publication date
+    }
 
     # Format dates for PubMed API (YYYY/MM/DD) and add date parameters if provided
     if start_date:
         try:
             # Validate and format start date
             start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-            search_mindate = f"&mindate={start_dt.strftime('%Y/%m/%d')}"
+            params['mindate'] = start_dt.strftime('%Y/%m/%d')
         except ValueError:
             print(f"Warning: Invalid start date format '{start_date}'. Should be YYYY-MM-DD. Ignoring.")
-            start_date = None # Reset if invalid
 
     if end_date:
         try:
             # Validate and format end date
             end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-            search_maxdate = f"&maxdate={end_dt.strftime('%Y/%m/%d')}"
+            params['maxdate'] = end_dt.strftime('%Y/%m/%d')
         except ValueError:
             print(f"Warning: Invalid end date format '{end_date}'. Should be YYYY-MM-DD. Ignoring.")
-            end_date = None # Reset if invalid
 
-    # Construct the final search URL
-    search_url = (
-        base_url + search_eutil + db + search_term_param +
-        search_usehistory + search_retmax + search_datetype +
-        search_mindate + search_maxdate
-    )
+    print(f"PubMed search: {params}") # Log the query for debugging
+    return params
+
+def search_pubmed(query, max_results=10, start_date=None, end_date=None):
+    """
+    Searches PubMed for papers matching a query, optionally filtering by date.
+
+    Args:
+        query (str): The search query
+        max_results (int): Maximum number of results to return
+        
+    Returns:
+        list: List of paper information dictionaries
+    """
+    pmid_list = search_pubmed_ids(query, max_results, start_date, end_date)
 
-    print(f"PubMed Search URL: {search_url}") # Log the URL for debugging
+    # Fetch all papers in one batched efetch, keeping the search order
+    found = fetch_pubmed_papers(pmid_list)
+    return [found[pmid] for pmid in pmid_list if pmid in found]
 
+def search_pubmed_ids(query, max_results=10, start_date=None, end_date=None):
+    """PMIDs matching a query, in PubMed's order; empty on error."""
+    params = _search_params(query, max_results, start_date, end_date)
     try:
-        f = urllib.request.urlopen(search_url)
-        search_data = f.read().decode('utf-8')
+        search_data = eutils_get('esearch.fcgi', params)
     except Exception as e:
         print(f"Error during PubMed search request: {e}")
         return [] # Return empty list on search error
+    return re.findall(r'<Id>(\d+)</Id>', search_data)
 
-    # extract the PMIDs from the search results
-    pmid_list = re.findall(r'<Id>(\d+)</Id>', search_data)
-    
-    # Fetch each paper by PMID
-    papers = []
-    for pmid in pmid_list:
-        paper = fetch_pubmed_paper(pmid)
-        if paper:
-            papers.append(paper)
-        # Be nice to the API
-        sleep(0.5)
-        
+def iter_pubmed_papers(pmids, stop=None):
+    """
+    Yields papers as soon as they are available: cached papers first, then
+    each paper of an efetch response as soon as its <PubmedArticle> element
+    has been received.
+
+    Args:
+        pmids (list): PubMed IDs to fetch
+        stop (threading.Event): If set, no further efetch request is started
+
+    Yields:
+        dict: Paper information, for every PMID that was found
+    """
+    cache = get_cache()
+    papers, missing = _cached_papers(pmids, cache)
+    yield from papers.values()
+
+    found = set()
+    for i in range(0, len(missing), EFETCH_BATCH_SIZE):
+        if stop is not None and stop.is_set():
+            return
+        parser = ET.XMLPullParser(events=('end',))
+        try:
+            for data in eutils_stream('efetch.fcgi', _efetch_params(missing[i:i + EFETCH_BATCH_SIZE])):
+                parser.feed(data)
+                for _, elem in parser.read_events():
+                    if elem.tag == 'PubmedArticle':
+                        paper_info = parse_article(elem)
+                        elem.clear()
+                        found.add(paper_info['PMID'])
+                        if cache is not None:
+                            cache.put(paper_info['PMID'], paper_info)
+                        yield paper_info
+        except Exception as e:
+            print(f"Error fetching papers from PubMed: {e}")
+
+    not_found = [p for p in missing if p not in found]
+    if not_found:
+        print(f"PMIDs not found in PubMed: {', '.join(not_found)}")
+
+# --- Async API (used by asgi.py) ---
+class _AsyncFetcher:
+    """Coalesces concurrent efetch lookups on one event loop.
+
+    PMIDs requested within `window` seconds of each other are sent in one
+    efetch request, and a PMID that is already being fetched is not
+    requested again. Under the E-utilities rate limit, many concurrent
+    lookups then cost only a few requests.
+    """
+
+    def __init__(self, window=0.01):
+        self.window = window
+        self._inflight = {}  # PMID -> Future of the paper (None if not found)
+        self._pending = []
+        self._flush_handle = None
+        # The event loop keeps only weak references to tasks; these keep running fetches alive
+        self._tasks = set()
+
+    async def fetch(self, pmids):
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for pmid in pmids:
+            future = self._inflight.get(pmid)
+            if future is None:
+                future = self._inflight[pmid] = loop.create_future()
+                self._pending.append(pmid)
+            futures[pmid] = future
+        if self._pending and self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        # shield: one caller giving up must not cancel a lookup other callers share
+        results = await asyncio.gather(*(asyncio.shield(f) for f in futures.values()))
+        return {pmid: paper for pmid, paper in zip(futures, results) if paper is not None}
+
+    def _flush(self):
+        self._flush_handle = None
+        pending, self._pending = self._pending, []
+        for i in range(0, len(pending), EFETCH_BATCH_SIZE):
+            task = asyncio.ensure_future(self._fetch_chunk(pending[i:i + EFETCH_BATCH_SIZE]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch_chunk(self, chunk):
+        papers = {}
+        try:
+            xml_data = await eutils_get_async('efetch.fcgi', _efetch_params(chunk))
+            # Parsing and the cache writes block; run them in a thread
+            papers = await asyncio.to_thread(_store_papers, xml_data, get_cache())
+        except Exception as e:
+            print(f"Error fetching papers from PubMed: {e}")
+        for pmid in chunk:
+            future = self._inflight.pop(pmid)
+            if not future.done():
+                future.set_result(papers.get(pmid))
+        not_found = [p for p in chunk if p not in papers]
+        if not_found:
+            print(f"PMIDs not found in PubMed: {', '.join(not_found)}")
+
+_async_fetchers = weakref.WeakKeyDictionary()
+
+async def fetch_pubmed_papers_async(pmids):
+    """fetch_pubmed_papers() for the event loop; concurrent calls share efetch requests."""
+    papers, missing = await asyncio.to_thread(_cached_papers, pmids, get_cache())
+    if missing:
+        loop = asyncio.get_running_loop()
+        fetcher = _async_fetchers.get(loop)
+        if fetcher is None:
+            fetcher = _async_fetchers[loop] = _AsyncFetcher()
+        papers.update(await fetcher.fetch(missing))
     return papers
+
+async def search_pubmed_async(query, max_results=10, start_date=None, end_date=None):
+    """search_pubmed() for the event loop."""
+    params = _search_params(query, max_results, start_date, end_date)
+    try:
+        search_data = await eutils_get_async('esearch.fcgi', params)
+    except Exception as e:
+        print(f"Error during PubMed search request: {e}")
+        return []
+
+    pmid_list = re.findall(r'<Id>(\d+)</Id>', search_data)
+    found = await fetch_pubmed_papers_async(pmid_list)
+    return [found[pmid] for pmid in pmid_list if pmid in found]
@@ -0,0 +1,363 @@
+"""Inverted index over the local corpus for ranked keyword search.
+
+The index is a set of flat numpy arrays (CSR layout, as in entity_index.py):
+terms point into a postings array of document numbers, and each posting
+points into an array of token positions. It is built once and written to a
+binary file; servers memory-map the file, so startup does not read the
+corpus and worker processes share the index pages:
+
+    python search_index.py build --db papers.db --output search_index.bin
+"""
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r'\w+')
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Layout: header, JSON metadata (array dtypes, offsets and lengths), then the
+# arrays, each aligned to 8 bytes. Offsets are relative to the first array.
+_MAGIC = b"SRCHIDX\0"
+_FORMAT = 1
+_HEADER = struct.Struct("<8sIQ")  # magic, format, metadata length
+_ALIGN = 8
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def parse_query(query: str) -> List[List[str]]:
+    """Split a query into clauses: a quoted phrase or a single term.
+
+    Example: 'body weight "quantitative trait"' ->
+    [['body'], ['weight'], ['quantitative', 'trait']]
+    """
+    clauses = []
+    for phrase, word in _QUERY_RE.findall(query):
+        # An unquoted word like "QTL-4" splits into tokens that still match as a unit
+        tokens = tokenize(phrase or word)
+        if tokens:
+            clauses.append(tokens)
+    return clauses
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Indices of all the ranges [starts[i], ends[i]), concatenated."""
+    lengths = ends - starts
+    first = np.cumsum(lengths) - lengths  # where each range begins in the output
+    return np.repeat(starts - first, lengths) + np.arange(int(lengths.sum()))
+
+
+class _Strings:
+    """Strings packed into one UTF-8 blob and addressed by number."""
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray):
+        self.offsets = offsets
+        self.blob = blob
+
+    @classmethod
+    def pack(cls, strings: List[str]) -> "_Strings":
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _bytes(self, i: int) -> bytes:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def __getitem__(self, i: int) -> str:
+        return self._bytes(i).decode("utf-8")
+
+    def find(self, s: str) -> int:
+        """Number of s in sorted strings, or -1 (UTF-8 byte order is code point order)."""
+        key = s.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self._bytes(lo) == key else -1
+
+
+class SearchIndex:
+    """Positional inverted index with BM25 ranking.
+
+    Each document is the title followed by the abstract. Terms are numbered
+    in sorted order and looked up by binary search. Postings of term t are
+    post_docs[term_offsets[t]:term_offsets[t + 1]] (ascending document
+    numbers), and the positions of posting p are
+    positions[pos_offsets[p]:pos_offsets[p + 1]]. Phrase queries are answered
+    from the index alone, and the cost of a query depends on the postings of
+    its terms, not on the size of the corpus.
+    """
+
+    _ARRAYS = ("vocab_offsets", "vocab_blob", "term_offsets", "post_docs", "pos_offsets",
+               "positions", "doc_lengths", "id_offsets", "id_blob")
+
+    def __init__(self, arrays: Optional[Dict[str, np.ndarray]] = None, total_length: int = 0,
+                 corpus_version: str = ""):
+        if arrays is None:  # an empty index
+            arrays = {name: np.zeros(1, dtype=np.int64) if name.endswith("offsets")
+                      else np.zeros(0, dtype=np.uint8 if name.endswith("blob") else np.uint32)
+                      for name in self._ARRAYS}
+        self._arrays = arrays
+        self._vocab = _Strings(arrays["vocab_offsets"], arrays["vocab_blob"])
+        self._doc_ids = _Strings(arrays["id_offsets"], arrays["id_blob"])
+        self._term_offsets = arrays["term_offsets"]
+        self._post_docs = arrays["post_docs"]
+        self._pos_offsets = arrays["pos_offsets"]
+        self._positions = arrays["positions"]
+        self._doc_lengths = arrays["doc_lengths"]
+        self._total_length = total_length
+        self.corpus_version = corpus_version
+        self._mmap = None
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    @classmethod
+    def build(cls, papers: Iterable[Tuple[str, Dict]], corpus_version: str = "") -> "SearchIndex":
+        """Build an index from (pmid, paper) pairs.
+
+        Tokens are collected as flat (term, document, position) arrays and
+        grouped by term with one stable sort, so the build needs a few bytes
+        per token and no Python object per posting.
+        """
+        vocab: Dict[str, int] = {}
+        term_ids, docs, positions, lengths = array('I'), array('I'), array('I'), array('I')
+        doc_ids = []
+        for pmid, paper in papers:
+            doc = len(doc_ids)
+            doc_ids.append(pmid)
+            title_tokens = tokenize(paper.get('Title', ''))
+            abstract_tokens = tokenize(paper.get('Abstract', ''))
+            term_ids.extend([vocab.setdefault(tok, len(vocab)) for tok in title_tokens + abstract_tokens])
+            length = len(title_tokens) + len(abstract_tokens)
+            docs.extend(array('I', [doc]) * length)
+            # Leave a gap between the fields so phrases cannot span them
+            offset = len(title_tokens) + 1
+            positions.extend(range(len(title_tokens)))
+            positions.extend(range(offset, offset + len(abstract_tokens)))
+            lengths.append(length)
+
+        terms = sorted(vocab)
+        rank = np.empty(len(terms), dtype=np.uint32)
+        rank[np.fromiter((vocab[t] for t in terms), dtype=np.int64, count=len(terms))] = \
+            np.arange(len(terms), dtype=np.uint32)
+        del vocab
+
+        t = rank[np.frombuffer(term_ids, dtype=np.uint32)]
+        # Tokens are in document and position order already; a stable sort keeps it within each term
+        order = np.argsort(t, kind="stable")
+        t = t[order]
+        d = np.frombuffer(docs, dtype=np.uint32)[order]
+        p = np.frombuffer(positions, dtype=np.uint32)[order]
+        del order
+
+        # One posting per (term, document)
+        new = np.ones(len(t), dtype=bool)
+        new[1:] = (t[1:] != t[:-1]) | (d[1:] != d[:-1])
+        starts = np.flatnonzero(new)
+        vocab_strings, id_strings = _Strings.pack(terms), _Strings.pack(doc_ids)
+        arrays = {
+            "vocab_offsets": vocab_strings.offsets,
+            "vocab_blob": vocab_strings.blob,
+            "term_offsets": np.searchsorted(t[starts], np.arange(len(terms) + 1)).astype(np.int64),
+            "post_docs": d[starts],
+            "pos_offsets": np.append(starts, len(t)).astype(np.int64),
+            "positions": p,
+            "doc_lengths": np.frombuffer(lengths, dtype=np.uint32).copy(),
+            "id_offsets": id_strings.offsets,
+            "id_blob": id_strings.blob,
+        }
+        return cls(arrays, int(arrays["doc_lengths"].sum()), corpus_version)
+
+    # --- persistence ---
+    def save(self, path: str) -> None:
+        """Write the index to a binary file (atomically, via a temporary file)."""
+        layout, offset = {}, 0
+        for name in self._ARRAYS:
+            values = self._arrays[name]
+            layout[name] = [values.dtype.str, offset, len(values)]
+            offset += -(-values.nbytes // _ALIGN) * _ALIGN
+        meta = json.dumps({"total_length": self._total_length,
+                           "corpus_version": self.corpus_version, "arrays": layout}).encode("utf-8")
+        meta += b" " * (-(_HEADER.size + len(meta)) % _ALIGN)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".bin")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, _FORMAT, len(meta)))
+                f.write(meta)
+                for name in self._ARRAYS:
+                    data = np.ascontiguousarray(self._arrays[name]).tobytes()
+                    f.write(data)
+                    f.write(b"\0" * (-len(data) % _ALIGN))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "SearchIndex":
+        """Memory-map an index written by save()."""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, meta_length = _HEADER.unpack_from(mm, 0)
+        if magic != _MAGIC or fmt != _FORMAT:
+            raise ValueError(f"{path} is not a search index of format {_FORMAT}; rebuild it")
+        meta = json.loads(mm[_HEADER.size:_HEADER.size + meta_length])
+        base = _HEADER.size + meta_length
+        arrays = {name: np.frombuffer(mm, dtype=np.dtype(dtype), count=count, offset=base + offset)
+                  for name, (dtype, offset, count) in meta["arrays"].items()}
+        index = cls(arrays, meta["total_length"], meta["corpus_version"])
+        index._mmap = mm
+        return index
+
+    # --- queries ---
+    def _phrase_mask(self, phrase: List[str], rows: Dict[str, np.ndarray], n: int) -> np.ndarray:
+        """Which of the n candidates contain a phrase; rows holds their postings per term."""
+        keys = None
+        for k, term in enumerate(phrase):
+            first, last = self._pos_offsets[rows[term]], self._pos_offsets[rows[term] + 1]
+            # Where the phrase would start if this occurrence is its k-th token
+            starts = self._positions[_ranges(first, last)].astype(np.int64) - k
+            candidates = np.repeat(np.arange(n, dtype=np.int64), last - first)
+            valid = starts >= 0
+            # (candidate, phrase start) packed into one integer
+            term_keys = (candidates[valid] << 32) | starts[valid]
+            keys = term_keys if keys is None else np.intersect1d(keys, term_keys)
+            if not len(keys):
+                break
+        mask = np.zeros(n, dtype=bool)
+        mask[keys >> 32] = True
+        return mask
+
+    def search(self, query: str, offset: int = 0, limit: int = 50) -> Tuple[List[Tuple[str, float]], int]:
+        """Return one page of (doc_id, score) ranked by BM25, and the total hit count.
+
+        All clauses must match (AND); quoted clauses must match as phrases.
+        """
+        clauses = parse_query(query)
+        if not clauses or not len(self):
+            return [], 0
+
+        spans = {}
+        for term in dict.fromkeys(t for clause in clauses for t in clause):
+            t = self._vocab.find(term)
+            if t < 0:
+                return [], 0
+            spans[term] = (int(self._term_offsets[t]), int(self._term_offsets[t + 1]))
+
+        # Intersect starting from the rarest term
+        ordered = sorted(spans, key=lambda term: spans[term][1] - spans[term][0])
+        start, end = spans[ordered[0]]
+        candidates = self._post_docs[start:end]
+        for term in ordered[1:]:
+            start, end = spans[term]
+            candidates = np.intersect1d(candidates, self._post_docs[start:end], assume_unique=True)
+            if not len(candidates):
+                return [], 0
+
+        # Posting number of every candidate in each term's postings
+        rows = {term: start + np.searchsorted(self._post_docs[start:end], candidates)
+                for term, (start, end) in spans.items()}
+        for phrase in (clause for clause in clauses if len(clause) > 1):
+            mask = self._phrase_mask(phrase, rows, len(candidates))
+            candidates = candidates[mask]
+            rows = {term: r[mask] for term, r in rows.items()}
+            if not len(candidates):
+                return [], 0
+
+        n = len(self)
+        avgdl = self._total_length / n or 1.0
+        norm = K1 * (1 - B + B * self._doc_lengths[candidates] / avgdl)
+        scores = np.zeros(len(candidates))
+        for term, (start, end) in spans.items():
+            df = end - start
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            tf = (self._pos_offsets[rows[term] + 1] - self._pos_offsets[rows[term]]).astype(np.float64)
+            scores += idf * tf * (K1 + 1) / (tf + norm)
+
+        total_hits = len(candidates)
+        wanted = offset + limit
+        if wanted < total_hits:
+            # Only candidates scoring at least the wanted-th best score can be on the page
+            threshold = np.partition(scores, total_hits - wanted)[total_hits - wanted]
+            selected = np.flatnonzero(scores >= threshold)
+        else:
+            selected = np.arange(total_hits)
+        # Highest score first, ties in document order
+        selected = selected[np.lexsort((candidates[selected], -scores[selected]))]
+        page = [(self._doc_ids[int(candidates[i])], float(scores[i]))
+                for i in selected[offset:offset + limit]]
+        return page, total_hits
+
+    def stats(self) -> Dict:
+        return {
+            "documents": len(self),
+            "terms": len(self._vocab),
+            "postings": len(self._post_docs),
+            "positions": len(self._positions),
+            "corpus_version": self.corpus_version,
+        }
+
+
+def load_index(index_path: Optional[str], paper_store) -> SearchIndex:
+    """Load the search index for the current contents of a paper store.
+
+    With an index path, the index is (re)built when it is missing or was built
+    from a different version of the store, and then memory-mapped. Without
+    one, it is built in memory.
+    """
+    version = paper_store.version()
+    if not index_path:
+        return SearchIndex.build(paper_store.items(), version)
+    if os.path.exists(index_path):
+        index = SearchIndex.load(index_path)
+        if index.corpus_version == version:
+            return index
+    t0 = time.perf_counter()
+    SearchIndex.build(paper_store.items(), version).save(index_path)
+    print(f"Built search index {index_path} in {time.perf_counter() - t0:.1f}s")
+    return SearchIndex.load(index_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local search index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build the index from the paper store")
+    build.add_argument("--db", default="papers.db", help="local paper store")
+    build.add_argument("--output", default="search_index.bin")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from paper_store import PaperStore
+        store = PaperStore(args.db)
+        t0 = time.perf_counter()
+        index = SearchIndex.build(store.items(), store.version())
+        index.save(args.output)
+        stats = index.stats()
+        print(f"Indexed {stats['documents']} papers ({stats['terms']} terms, {stats['positions']} tokens) "
+              f"in {time.perf_counter() - t0:.1f}s -> {args.output}")
@@ -414,7 +414,8 @@ document.addEventListener('DOMContentLoaded', () => {
         errorDiv.textContent = '';
 
         try {
-            const response = await fetch('/parse_sentence', {
+            // One request: the sentence is parsed once for both the graph and displaCy
+            const response = await fetch('/parse', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -436,26 +437,12 @@ document.addEventListener('DOMContentLoaded', () => {
             // Existing visualizer — keep working
             renderDependencyGraph(parseData);
 
-
-            //  NEW — render DisplaCy via backend
-            const displacyRes = await fetch('/displacy', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({ text })
-            });
-
-            if (displacyRes.ok) {
-                const displacyData = await displacyRes.json();
-                const displacyContainer = document.getElementById("displacy-container");
-                if (displacyContainer) {
-                    displacyContainer.innerHTML = displacyData.html;
-                    //updateDisplaCyTheme();         
-                    colorCodeDisplacyTags();
-                }
-            } else {
-                console.warn('DisplaCy rendering failed');
+            // DisplaCy SVG rendered by the backend from the same parse
+            const displacyContainer = document.getElementById("displacy-container");
+            if (displacyContainer && parseData.html) {
+                displacyContainer.innerHTML = parseData.html;
+                //updateDisplaCyTheme();         
+                colorCodeDisplacyTags();
             }
 
         } catch (error) {
@@ -532,13 +519,8 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         try {
-            const formData = new FormData();
-            formData.append('pmid', pmid);
-
-            const response = await fetch('/visualize', {
-                method: 'POST',
-                body: formData
-            });
+            // GET, so the browser can revalidate a repeat view with If-None-Match (304)
+            const response = await fetch(`/visualize/${encodeURIComponent(pmid)}`);
 
             loadingDiv.style.display = 'none'; // Hide loading indicator
 
@@ -590,6 +572,38 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
     
+    // Builds the list item for one search result
+    function createSearchResultItem(paper) {
+        const listItem = document.createElement('li');
+        listItem.className = paper.source === 'pubmed' ? 'pubmed-result' : 'local-result';
+        
+        const pmidLink = document.createElement('a');
+        pmidLink.href = '#';
+        pmidLink.textContent = paper.pmid;
+        pmidLink.className = 'pmid-link';
+        pmidLink.dataset.pmid = paper.pmid;
+        
+        // Add click event to the PMID link
+        pmidLink.addEventListener('click', (e) => {
+            e.preventDefault();
+            pmidInput.value = paper.pmid;
+            pmidForm.dispatchEvent(new Event('submit'));
+        });
+        
+        // Create a source badge
+        const sourceBadge = document.createElement('span');
+        sourceBadge.className = `source-badge ${paper.source}-badge`;
+        sourceBadge.textContent = paper.source === 'pubmed' ? 'PubMed' : 'Local';
+        
+        listItem.appendChild(sourceBadge);
+        listItem.appendChild(document.createTextNode(' PMID: '));
+        listItem.appendChild(pmidLink);
+        listItem.appendChild(document.createTextNode(' - ' + paper.title));
+        listItem.appendChild(document.createElement('br'));
+        listItem.appendChild(document.createTextNode(paper.journal));
+        return listItem;
+    }
+    
     // Handle search form submission
     if (searchForm) {
         searchForm.addEventListener('submit', async (event) => {
@@ -628,73 +642,73 @@ document.addEventListener('DOMContentLoaded', () => {
                     formData.append('end_date', endDate);
                 }
 
-                const response = await fetch('/search', {
+                const response = await fetch('/search/stream', {
                     method: 'POST',
+                    headers: { 'Accept': 'application/x-ndjson' },
                     body: formData
                 });
                 
-                loadingDiv.style.display = 'none';
-                
                 if (!response.ok) {
+                    loadingDiv.style.display = 'none';
                     const errorData = await response.json().catch(() => ({ error: `HTTP error ${response.status}` }));
                     errorDiv.textContent = errorData.error || `An error occurred: ${response.statusText}`;
                     return;
                 }
                 
-                const data = await response.json();
+                // Results are rendered as they arrive: local hits, then each PubMed paper, then a summary
+                const summaryDiv = document.createElement('div');
+                summaryDiv.className = 'search-summary';
+                summaryDiv.textContent = 'Searching...';
+                const resultsList = document.createElement('ul');
+                resultsList.className = 'search-results-list';
+                searchResultsDiv.appendChild(summaryDiv);
+                searchResultsDiv.appendChild(resultsList);
+                let shown = 0;
                 
-                if (data.count === 0) {
-                    searchResultsDiv.innerHTML += '<p>No results found.</p>';
-                } else {
-                    // Add summary of search results
-                    const summaryDiv = document.createElement('div');
-                    summaryDiv.className = 'search-summary';
-                    
-                    let summaryText = `Found ${data.count} results`;
-                    if ('local_count' in data && 'pubmed_count' in data) {
-                        summaryText += ` (${data.local_count} from local database, ${data.pubmed_count} from PubMed)`;
+                const handleFrame = (frame) => {
+                    if (frame.type === 'local') {
+                        frame.results.forEach(paper => resultsList.appendChild(createSearchResultItem(paper)));
+                        shown += frame.results.length;
+                    } else if (frame.type === 'pubmed') {
+                        resultsList.appendChild(createSearchResultItem(frame.result));
+                        shown += 1;
+                    } else if (frame.type === 'summary') {
+                        if (frame.count === 0) {
+                            summaryDiv.textContent = 'No results found.';
+                            return;
+                        }
+                        let summaryText = `Found ${frame.count} results`;
+                        if ('local_count' in frame && 'pubmed_count' in frame) {
+                            summaryText += ` (${frame.local_count} from local database, ${frame.pubmed_count} from PubMed)`;
+                        }
+                        if (frame.partial) {
+                            summaryText += ' - PubMed did not respond in time, results may be incomplete';
+                        }
+                        summaryDiv.textContent = summaryText;
+                        return;
                     }
-                    summaryDiv.textContent = summaryText;
-                    searchResultsDiv.appendChild(summaryDiv);
-                    
-                    const resultsList = document.createElement('ul');
-                    resultsList.className = 'search-results-list';
-                    
-                    data.results.forEach(paper => {
-                        const listItem = document.createElement('li');
-                        listItem.className = paper.source === 'pubmed' ? 'pubmed-result' : 'local-result';
-                        
-                        const pmidLink = document.createElement('a');
-                        pmidLink.href = '#';
-                        pmidLink.textContent = paper.pmid;
-                        pmidLink.className = 'pmid-link';
-                        pmidLink.dataset.pmid = paper.pmid;
-                        
-                        // Add click event to the PMID link
-                        pmidLink.addEventListener('click', (e) => {
-                            e.preventDefault();
-                            pmidInput.value = paper.pmid;
-                            pmidForm.dispatchEvent(new Event('submit'));
-                        });
-                        
-                        // Create a source badge
-                        const sourceBadge = document.createElement('span');
-                        sourceBadge.className = `source-badge ${paper.source}-badge`;
-                        sourceBadge.textContent = paper.source === 'pubmed' ? 'PubMed' : 'Local';
-                        
-                        listItem.appendChild(sourceBadge);
-                        listItem.appendChild(document.createTextNode(' PMID: '));
-                        listItem.appendChild(pmidLink);
-                        listItem.appendChild(document.createTextNode(' - ' + paper.title));
-                        listItem.appendChild(document.createElement('br'));
-                        listItem.appendChild(document.createTextNode(paper.journal));
-                        
-                        resultsList.appendChild(listItem);
-                    });
-                    
-                    searchResultsDiv.appendChild(resultsList);
+                    summaryDiv.textContent = `Found ${shown} results so far...`;
+                    // Show results as soon as the first frame arrives
+                    loadingDiv.style.display = 'none';
+                    searchResultsDiv.style.display = 'block';
+                };
+                
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop(); // keep an incomplete last line for the next chunk
+                    lines.filter(line => line.trim()).forEach(line => handleFrame(JSON.parse(line)));
+                }
+                if (buffer.trim()) {
+                    handleFrame(JSON.parse(buffer));
                 }
                 
+                loadingDiv.style.display = 'none';
                 searchResultsDiv.style.display = 'block';
                 
             } catch (error) {
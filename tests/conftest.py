@@ -0,0 +1,66 @@
+"""Test setup: the modules live at the repository root, the E-utilities stub in benchmarks/."""
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+APP_PAPERS = [
+    {"PMID": "101", "Title": "Body weight QTL in mice",
+     "Abstract": "Body weight and fat were measured in F2 mice.", "Journal": "J. Anim. Sci."},
+    {"PMID": "102", "Title": "Milk yield in dairy cattle",
+     "Abstract": "A QTL for milk yield was found on chromosome 6.", "Journal": "J. Dairy Sci."},
+]
+APP_TRAITS = ["body weight", "fat", "milk yield", "blood pressure"]
+
+
+@pytest.fixture(scope="session")
+def app_dir(tmp_path_factory):
+    """Working directory for app.py: no config.json, a small corpus and dictionary."""
+    directory = tmp_path_factory.mktemp("app")
+    (directory / "QTL_text.json").write_text(json.dumps(APP_PAPERS), encoding="utf-8")
+    (directory / "Trait dictionary.txt").write_text("\n".join(APP_TRAITS) + "\n", encoding="utf-8")
+    return directory
+
+
+@pytest.fixture
+def app_module(app_dir, monkeypatch):
+    """app.py with its data files in app_dir and a blank spaCy model in place of scispaCy.
+
+    app.py loads its data when first imported, so the import happens inside app_dir.
+    """
+    spacy = pytest.importorskip("spacy")
+    pytest.importorskip("flask")
+    monkeypatch.chdir(app_dir)
+    import app
+    import nlp_utils
+    monkeypatch.setitem(nlp_utils._nlp_cache, nlp_utils.get_model_name(), spacy.blank("en"))
+    monkeypatch.setattr(nlp_utils, "_annotation_cache", None)
+    return app
+
+
+@pytest.fixture
+def app_versions(app_module, monkeypatch, tmp_path):
+    """app.py with its dictionary and annotation indexes in tmp_path.
+
+    The app globals it changes are restored afterwards.
+    """
+    dictionary = tmp_path / "traits.txt"
+    dictionary.write_text("obesity\n", encoding="utf-8")
+    monkeypatch.setattr(app_module, "TRAIT_DICT_PATH", str(dictionary))
+    monkeypatch.setattr(app_module, "TRAIT_INDEX_PATH", str(tmp_path / "trait_index.bin"))
+    monkeypatch.setattr(app_module, "COOCCURRENCE_PATH", str(tmp_path / "cooccurrence.npz"))
+    monkeypatch.setattr(app_module, "ENTITY_INDEX_PATH", str(tmp_path / "entity_index.npz"))
+    for name in ("trait_matcher", "cooccurrence_index", "entity_index"):
+        monkeypatch.setattr(app_module, name, getattr(app_module, name))
+    monkeypatch.setattr(app_module.nlp_utils, "_trait_dictionary", app_module.nlp_utils._trait_dictionary)
+    app_module.load_traits(load_indexes=False)
+    return app_module, dictionary
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,144 @@
+"""AnnotationCache copies, sharing and eviction, and the cache keys nlp_utils derives from its pipeline."""
+import pytest
+
+import annotation_cache
+import nlp_utils
+from annotation_cache import AnnotationCache
+
+SPANS = [{"start": 0, "end": 4, "label": "TRAIT", "term": "milk", "source": "dictionary"}]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable time.time() for the cache module."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(annotation_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_values_are_copies(tmp_path):
+    cache = AnnotationCache(str(tmp_path / "cache.db"))
+    cache.put("k", SPANS)
+    first = cache.get("k")
+    first.append("changed")
+    first[0]["term"] = "changed"
+
+    assert cache.get("k") == SPANS
+    assert cache.get("k") is not cache.get("k")
+
+
+def test_processes_share_entries_through_the_file(tmp_path):
+    path = str(tmp_path / "cache.db")
+    AnnotationCache(path).put_many([("a", SPANS), ("b", [])])
+    other = AnnotationCache(path)  # as another worker would open it
+
+    assert other.get_many(["a", "b", "c"]) == {"a": SPANS, "b": []}
+    assert other.stats()["memory_hits"] == 0
+    assert other.get_raw("a") == '[{"start": 0, "end": 4, "label": "TRAIT", "term": "milk", "source": "dictionary"}]'
+
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = AnnotationCache(str(tmp_path / "cache.db"))
+    cache.put("a", SPANS)
+    cache.get_many(["a", "b"])
+    AnnotationCache(cache.path).get("a")  # a disk hit elsewhere does not count here
+
+    assert cache.stats() == {"hits": 1, "memory_hits": 1, "misses": 1, "hit_rate": 0.5, "memory_entries": 1}
+
+
+def test_memory_layer_is_bounded(tmp_path):
+    cache = AnnotationCache(str(tmp_path / "cache.db"), memory_entries=2)
+    cache.put_many([(k, k) for k in "abc"])
+
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.get("a") == "a"  # from disk
+    assert (cache.memory_hits, cache.hits) == (0, 1)
+
+
+def test_least_recently_used_entries_are_evicted_from_disk(tmp_path, clock):
+    cache = AnnotationCache(str(tmp_path / "cache.db"), max_entries=3, memory_entries=1)
+    for key in "abcd":
+        cache.put(key, key)
+        clock[0] += annotation_cache._TOUCH_INTERVAL + 1
+    cache.get("a")  # read from disk, which makes "b" the least recently used
+
+    assert cache.evict() == 1
+    assert sorted(AnnotationCache(cache.path).get_many(list("abcd"))) == ["a", "c", "d"]
+
+
+def test_memory_hits_keep_entries_on_disk(tmp_path, clock):
+    cache = AnnotationCache(str(tmp_path / "cache.db"), max_entries=2, memory_entries=10)
+    cache.put("hot", 1)
+    clock[0] += 1
+    cache.put("cold", 2)
+    clock[0] += annotation_cache._TOUCH_INTERVAL + 1
+    cache.get("hot")  # served from memory, recorded on disk
+    cache.put("new", 3)
+
+    assert cache.evict() == 1
+    assert sorted(AnnotationCache(cache.path).get_many(["hot", "cold", "new"])) == ["hot", "new"]
+
+
+def test_memory_only_cache():
+    cache = AnnotationCache(None, memory_entries=2)
+    cache.put_many([("a", 1), ("b", 2), ("c", 3)])
+
+    assert len(cache) == 2
+    assert cache.get_many(["a", "b", "c"]) == {"b": 2, "c": 3}
+    assert cache.evict() == 0
+
+
+@pytest.fixture
+def cached_nlp(monkeypatch):
+    """nlp_utils with an in-memory annotation cache."""
+    cache = AnnotationCache(None)
+    monkeypatch.setattr(nlp_utils, "_annotation_cache", cache)
+    monkeypatch.setattr(nlp_utils, "_dictionary_in_pipeline", False)
+    return cache
+
+
+def test_cached_batch_computes_only_missing_texts(cached_nlp):
+    calls = []
+
+    def compute(texts):
+        calls.append(list(texts))
+        return [[{"term": t}] for t in texts]
+
+    assert nlp_utils.cached_batch("ner", ["a", "b"], compute) == [[{"term": "a"}], [{"term": "b"}]]
+    results = nlp_utils.cached_batch("ner", ["b", "c", "a"], compute)
+
+    assert results == [[{"term": "b"}], [{"term": "c"}], [{"term": "a"}]]
+    assert calls == [["a", "b"], ["c"]]
+    # Callers may sort or modify results in place, as deduplicate() callers do
+    results[0].append({"term": "z"})
+    assert nlp_utils.cached_batch("ner", ["b"], compute) == [[{"term": "b"}]]
+
+
+def test_failed_parses_are_not_cached(cached_nlp):
+    calls = []
+
+    def compute(texts):
+        calls.append(list(texts))
+        return [{"tokens": [], "arcs": [], "text": t, "error": "Parsing failed"} for t in texts]
+
+    nlp_utils.cached_batch("dependencies", ["x"], compute)
+    nlp_utils.cached_batch("dependencies", ["x"], compute)
+
+    assert calls == [["x"], ["x"]]
+
+
+def test_keys_change_with_model_kind_and_dictionary(monkeypatch):
+    key = nlp_utils.cache_key("spans", "Milk yield", "dict-1")
+
+    assert nlp_utils.cache_key("spans", "Milk yield", "dict-1") == key
+    assert nlp_utils.cache_key("spans", "Milk yield", "dict-2") != key
+    assert nlp_utils.cache_key("ner", "Milk yield", "dict-1") != key
+    assert nlp_utils.cache_key("spans", "Milk yield!", "dict-1") != key
+    monkeypatch.setattr(nlp_utils, "_dictionary_in_pipeline", True)
+    assert nlp_utils.cache_key("spans", "Milk yield", "dict-1") != key
+    monkeypatch.setattr(nlp_utils, "_dictionary_in_pipeline", False)
+    monkeypatch.setenv("SCISPACY_MODEL", "en_ner_craft_md")
+    assert nlp_utils.cache_key("spans", "Milk yield", "dict-1") != key
+    # The parser model is independent of the NER model
+    assert nlp_utils.cache_key("dependencies", "Milk yield") == nlp_utils.cache_key(
+        "dependencies", "Milk yield") != nlp_utils.cache_key("ner", "Milk yield")
@@ -0,0 +1,100 @@
+"""AnnotationStore keys: pipeline version, dictionary version and the paper text."""
+import sqlite3
+
+import pytest
+
+import export
+import nlp_utils
+from annotation_store import AnnotationStore, annotate_corpus, text_hash
+from trait_matcher import TraitMatcher
+
+PAPERS = [
+    {"PMID": "1", "Title": "Milk yield in cattle", "Abstract": "Fat and milk yield were measured."},
+    {"PMID": "2", "Title": "Body weight in mice", "Abstract": ""},
+]
+
+
+@pytest.fixture
+def blank_model(monkeypatch):
+    spacy = pytest.importorskip("spacy")
+    monkeypatch.setitem(nlp_utils._nlp_cache, nlp_utils.get_model_name(), spacy.blank("en"))
+    monkeypatch.setattr(nlp_utils, "_annotation_cache", None)
+    monkeypatch.setattr(nlp_utils, "_dictionary_in_pipeline", False)
+
+
+@pytest.fixture
+def matcher():
+    return TraitMatcher(["milk yield", "fat", "body weight"], version="v1")
+
+
+@pytest.fixture
+def store(tmp_path, blank_model, matcher):
+    store = AnnotationStore(str(tmp_path / "annotations.db"))
+    assert annotate_corpus(store, PAPERS, matcher) == 2
+    yield store
+    store.close()
+
+
+def stored(store, paper, matcher):
+    return store.get(paper["PMID"], nlp_utils.pipeline_version("spans"), matcher.version, text_hash(paper))
+
+
+def test_get_returns_annotations_of_the_current_text(store, matcher):
+    annotations = stored(store, PAPERS[0], matcher)
+
+    assert [s["term"] for s in annotations["title_spans"]] == ["Milk yield"]
+    assert [s["term"] for s in annotations["abstract_spans"]] == ["Fat", "milk yield"]
+    assert annotations["entity_statistics"]["TRAIT"]["count"] == 3
+
+
+def test_edited_paper_is_not_served_and_is_reannotated(store, matcher):
+    edited = dict(PAPERS[0], Abstract="Body weight was measured.")
+
+    assert stored(store, edited, matcher) is None
+    # Only the edited paper is annotated again
+    assert annotate_corpus(store, [edited, PAPERS[1]], matcher) == 1
+    assert [s["term"] for s in stored(store, edited, matcher)["abstract_spans"]] == ["Body weight"]
+    assert stored(store, PAPERS[0], matcher) is None
+    assert len(dict(store.statistics(nlp_utils.pipeline_version("spans"), matcher.version))) == 2
+
+
+def test_other_pipeline_or_dictionary_version_is_not_served(store, matcher, monkeypatch):
+    assert stored(store, PAPERS[0], TraitMatcher(["fat"], version="v2")) is None
+
+    monkeypatch.setattr(nlp_utils, "_dictionary_in_pipeline", True)
+    assert stored(store, PAPERS[0], matcher) is None
+    assert store.text_hashes(nlp_utils.pipeline_version("spans"), matcher.version) == {}
+
+
+def test_delete_stale_keeps_the_current_version(store, matcher):
+    store.put_many("another pipeline", matcher.version, [("1", text_hash(PAPERS[0]), [], [], {})])
+
+    assert store.delete_stale(nlp_utils.pipeline_version("spans"), matcher.version) == 1
+    assert set(store.text_hashes(nlp_utils.pipeline_version("spans"), matcher.version)) == {"1", "2"}
+
+
+def test_old_format_is_dropped(tmp_path):
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE annotations (pmid TEXT, model TEXT, dict_version TEXT, "
+                     "title_spans TEXT, abstract_spans TEXT, entity_statistics TEXT, "
+                     "PRIMARY KEY (pmid, model, dict_version))")
+        conn.execute("INSERT INTO annotations VALUES ('1', 'm', 'v1', '[]', '[]', '{}')")
+
+    store = AnnotationStore(path)
+
+    assert store.text_hashes("m", "v1") == {}
+    assert store.put_many("m", "v1", [("1", "hash", [], [], {})]) == 1
+
+
+def test_export_uses_stored_annotations_only_for_unchanged_papers(store, matcher, monkeypatch):
+    pipeline = nlp_utils.pipeline_version("spans")
+    marker = [{"start": 0, "end": 4, "label": "TRAIT", "term": "Milk", "source": "dictionary"}]
+    store.put_many(pipeline, matcher.version, [("1", text_hash(PAPERS[0]), marker, [], {})])
+    edited = dict(PAPERS[1], Title="Fat in mice")
+    papers = [("1", PAPERS[0], "local"), ("2", edited, "local")]
+
+    records = list(export.annotate_papers(iter(papers), matcher, store))
+
+    assert records[0]["title_spans"] == marker
+    assert [s["term"] for s in records[1]["title_spans"]] == ["Fat"]
@@ -0,0 +1,86 @@
+"""asgi.py: the async /search, and Flask routes served through the WSGI middleware."""
+import asyncio
+import json
+from urllib.parse import urlencode
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("a2wsgi")
+
+
+@pytest.fixture
+def asgi(app_module):
+    import asgi
+    return asgi
+
+
+def request(asgi, method, url, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+    return asyncio.run(send())
+
+
+def request_count(app, route, status):
+    return sum(value for name, labels, value in app.REQUEST_SECONDS.samples()
+               if name.endswith("_count") and labels["route"] == route and labels["status"] == str(status))
+
+
+def test_async_search_matches_flask_and_records_metrics(asgi, app_module, client):
+    before = request_count(app_module, "/search", 200)
+    response = request(asgi, "POST", "/search", data={"term": "milk yield"})
+
+    assert response.status_code == 200
+    expected = client.post("/search", data={"term": "milk yield"}).get_json()
+    assert response.json()["results"] == expected["results"]
+    assert response.json()["local_count"] == 1
+    stages = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    assert stages == ["local_search", "total"]
+    # One from the async route, one from the Flask route
+    assert request_count(app_module, "/search", 200) == before + 2
+
+
+def test_async_search_error_is_recorded(asgi, app_module):
+    before = request_count(app_module, "/search", 400)
+    response = request(asgi, "POST", "/search", data={"term": " "})
+
+    assert response.status_code == 400
+    assert "total;dur=" in response.headers["server-timing"]
+    assert request_count(app_module, "/search", 400) == before + 1
+
+
+def test_flask_routes_run_through_the_middleware(asgi, client):
+    body = {"documents": ["Body weight and fat in mice"]}
+    response = request(asgi, "POST", "/visualize_batch", json=body)
+
+    assert response.status_code == 200
+    assert response.json() == client.post("/visualize_batch", json=body).get_json()
+    assert "annotate_batch;dur=" in response.headers["server-timing"]
+    assert request(asgi, "GET", "/no/such/route").status_code == 404
+
+
+def test_streamed_responses_are_sent_in_parts(asgi):
+    body = urlencode({"term": "body weight"}).encode()
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": "/search/stream", "raw_path": b"/search/stream",
+             "root_path": "", "query_string": b"", "server": ("test", 80), "client": ("127.0.0.1", 1),
+             "headers": [(b"content-type", b"application/x-www-form-urlencoded"),
+                         (b"content-length", str(len(body)).encode())]}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+
+    assert messages[0]["type"] == "http.response.start" and messages[0]["status"] == 200
+    parts = [m["body"] for m in messages[1:] if m["body"]]
+    assert len(parts) >= 2
+    frames = [json.loads(line) for line in b"".join(parts).decode().splitlines()]
+    assert [f["type"] for f in frames] == ["local", "summary"]
+    assert messages[-1].get("more_body", False) is False
@@ -0,0 +1,67 @@
+"""Benchmark suite: fixed-seed inputs, percentiles, and regression checks against a baseline."""
+import json
+import subprocess
+import sys
+
+import bench_suite
+
+TRAITS = ["body weight", "milk yield", "fat", "backfat thickness"]
+
+
+def result(p50_ms, peak_kb):
+    return {"iterations": 10, "ops_per_s": 1.0, "p50_ms": p50_ms, "p95_ms": p50_ms,
+            "p99_ms": p50_ms, "peak_kb": peak_kb}
+
+
+def test_inputs_depend_only_on_the_seed():
+    texts = bench_suite.make_texts(TRAITS, 50, 5, seed=3)
+
+    assert texts == bench_suite.make_texts(TRAITS, 50, 5, seed=3)
+    assert texts != bench_suite.make_texts(TRAITS, 50, 5, seed=4)
+    assert all(len(text.split()) == 50 for text in texts)
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+
+    assert bench_suite.percentile(values, 50) == 51.0
+    assert bench_suite.percentile(values, 99) == 99.0
+    assert bench_suite.percentile(values, 100) == 100.0
+    assert bench_suite.percentile([], 50) == 0.0
+
+
+def test_compare_flags_latency_and_memory_regressions():
+    baseline = {"a": result(1.0, 100.0), "b": result(1.0, 100.0), "c": result(1.0, 100.0)}
+    results = {"a": result(1.1, 100.0), "b": result(1.5, 100.0), "c": result(0.5, 200.0),
+               "new": result(1.0, 1.0)}
+
+    regressions = bench_suite.compare(results, baseline, threshold=0.2)
+
+    assert [line.split(":")[0] for line in regressions] == ["b", "c"]
+    assert "p50" in regressions[0] and "peak" in regressions[1]
+
+
+def run_suite(*args):
+    return subprocess.run(
+        [sys.executable, bench_suite.__file__, "--stub-model", "--stages", "search[docs=1000]",
+         "--min-time", "0.05", "--min-iters", "5", "--repeat", "1", *args],
+        capture_output=True, text=True, timeout=300)
+
+
+def test_suite_saves_and_checks_a_baseline(tmp_path):
+    baseline = str(tmp_path / "baseline.json")
+    run = run_suite("--save-baseline", baseline, "--compare", baseline)
+
+    assert run.returncode == 0, run.stdout + run.stderr
+    with open(baseline, encoding="utf-8") as f:
+        report = json.load(f)
+    assert list(report["results"]) == ["search[docs=1000]"]
+    assert report["environment"]["models"] == "stub"
+
+    # A baseline 1000 times faster than this machine makes --compare fail
+    report["results"]["search[docs=1000]"]["p50_ms"] /= 1000
+    with open(baseline, "w", encoding="utf-8") as f:
+        json.dump(report, f)
+    run = run_suite("--compare", baseline)
+    assert run.returncode == 1
+    assert "REGRESSION" in run.stdout
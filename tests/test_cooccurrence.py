@@ -0,0 +1,142 @@
+"""CooccurrenceIndex counts and PMI/NPMI scores against direct computation."""
+import math
+
+import pytest
+
+from cooccurrence import CooccurrenceIndex
+
+
+def paper(*entities):
+    """entity_statistics for "LABEL:term" strings."""
+    stats = {}
+    for entity in entities:
+        label, term = entity.split(":", 1)
+        stats.setdefault(label, {"terms": []})["terms"].append({"term": term, "count": 1})
+    return stats
+
+
+PAPERS = [
+    ("1", paper("TRAIT:obesity", "GENE_OR_GENE_PRODUCT:lep", "ORGANISM:mice")),
+    ("2", paper("TRAIT:obesity", "GENE_OR_GENE_PRODUCT:lep")),
+    ("3", paper("TRAIT:obesity", "ORGANISM:mice")),
+    ("4", paper("TRAIT:milk yield", "ORGANISM:cattle", "CELL:t cells")),
+    ("5", paper("TRAIT:milk yield", "ORGANISM:cattle", "ORGANISM:mice")),
+    ("6", paper("ORGANISM:mice", "TRAIT:Obesity")),  # same entity, other case
+    ("7", paper()),
+]
+
+
+def documents(papers):
+    return [{f"{label}:{t['term'].lower()}" for label, s in stats.items() for t in s["terms"]}
+            for _, stats in papers]
+
+
+def expected_scores(papers, a, b):
+    docs = documents(papers)
+    n = len(docs)
+    n_a = sum(a in d for d in docs)
+    n_b = sum(b in d for d in docs)
+    n_ab = sum(a in d and b in d for d in docs)
+    pmi = math.log((n_ab / n) / ((n_a / n) * (n_b / n)))
+    npmi = pmi / -math.log(n_ab / n) if n_ab < n else 1.0
+    return n_ab, pmi, npmi
+
+
+@pytest.fixture(scope="module")
+def index():
+    return CooccurrenceIndex.build(PAPERS)
+
+
+def test_counts_and_paper_frequencies(index):
+    assert index.n_papers == len(PAPERS)
+    i = index.lookup("obesity", "TRAIT")
+    assert index.df[i] == 4
+    assert index.counts[i, i] == 4
+    mice = index.lookup("mice", "ORGANISM")
+    assert index.counts[i, mice] == index.counts[mice, i] == 3
+
+
+@pytest.mark.parametrize("score", ["count", "pmi", "npmi"])
+def test_scores_match_direct_computation(index, score):
+    for a in index.entities:
+        label, term = a.split(":", 1)
+        result = index.neighbors(term, label, k=len(index), score=score)
+        for neighbor in result["neighbors"]:
+            b = f"{neighbor['label']}:{neighbor['term']}"
+            n_ab, pmi, npmi = expected_scores(PAPERS, a, b)
+            expected = {"count": n_ab, "pmi": pmi, "npmi": npmi}[score]
+            assert neighbor["count"] == n_ab
+            assert neighbor["score"] == pytest.approx(expected, abs=1e-4)
+
+
+def test_npmi_is_one_for_pairs_in_every_paper():
+    index = CooccurrenceIndex.build([("1", paper("TRAIT:a", "CELL:b")), ("2", paper("TRAIT:a", "CELL:b"))])
+
+    assert index.neighbors("a", "TRAIT", score="npmi")["neighbors"][0]["score"] == 1.0
+
+
+def test_neighbors_are_ranked_and_filtered(index):
+    result = index.neighbors("obesity", k=2, score="pmi")
+
+    assert result["entity"] == {"label": "TRAIT", "term": "obesity", "papers": 4}
+    scores = [n["score"] for n in result["neighbors"]]
+    assert len(scores) == 2 and scores == sorted(scores, reverse=True)
+    assert all(n["count"] >= 3 for n in index.neighbors("obesity", min_count=3)["neighbors"])
+    assert index.neighbors("no such term") is None
+
+
+def test_min_df_drops_rare_entities():
+    index = CooccurrenceIndex.build(PAPERS, min_df=2)
+
+    assert "CELL:t cells" not in index.entities
+    assert "ORGANISM:cattle" in index.entities
+    assert index.lookup("lep", "GENE_OR_GENE_PRODUCT") is not None
+    assert all(index.df >= 2)
+    # Pair counts of the remaining entities are unchanged
+    assert index.neighbors("obesity", "TRAIT", k=10, score="count")["neighbors"] == \
+        CooccurrenceIndex.build(PAPERS).neighbors("obesity", "TRAIT", k=10, score="count")["neighbors"]
+
+
+def test_save_and_load_round_trip(tmp_path, index):
+    path = str(tmp_path / "cooccurrence.npz")
+    index.save(path)
+    loaded = CooccurrenceIndex.load(path)
+
+    assert loaded.entities == index.entities
+    assert loaded.n_papers == index.n_papers
+    for score in ("count", "pmi", "npmi"):
+        assert loaded.neighbors("mice", k=10, score=score) == index.neighbors("mice", k=10, score=score)
+
+
+def test_app_skips_index_of_another_dictionary_version(app_versions, client):
+    import nlp_utils
+    app, dictionary = app_versions
+    pipeline = nlp_utils.pipeline_version("spans")
+    CooccurrenceIndex.build(PAPERS, model=pipeline, dict_version=app.trait_matcher.version).save(
+        app.COOCCURRENCE_PATH)
+
+    app.load_annotation_indexes()
+    assert app.cooccurrence_index is not None
+    assert client.get("/cooccurrence?term=obesity&min_count=1").status_code == 200
+
+    # A dictionary reload makes the index stale
+    dictionary.write_text("obesity\nmilk yield\n", encoding="utf-8")
+    app.load_traits()
+    assert app.cooccurrence_index is None
+    assert client.get("/cooccurrence?term=obesity").status_code == 503
+
+    # Rebuilt for the new version, it is picked up on the next load
+    CooccurrenceIndex.build(PAPERS, model=pipeline, dict_version=app.trait_matcher.version).save(
+        app.COOCCURRENCE_PATH)
+    app.load_annotation_indexes()
+    assert app.cooccurrence_index.dict_version == app.trait_matcher.version
+
+
+def test_app_skips_index_of_another_pipeline(app_versions):
+    app, _ = app_versions
+    CooccurrenceIndex.build(PAPERS, model="en_ner_other_model",
+                            dict_version=app.trait_matcher.version).save(app.COOCCURRENCE_PATH)
+
+    app.load_annotation_indexes()
+
+    assert app.cooccurrence_index is None
@@ -0,0 +1,143 @@
+"""Dictionary matches from the pipeline component against the separate TraitMatcher pass.
+
+A blank English pipeline stands in for the NER model, so only dictionary
+spans are produced and no model download is needed.
+"""
+import concurrent.futures
+import multiprocessing
+import pickle
+import random
+
+import pytest
+
+spacy = pytest.importorskip("spacy")
+
+import nlp_utils
+from trait_matcher import load_matcher
+
+TRAITS = ["body weight", "body weight gain", "milk yield", "fat", "backfat thickness",
+          "blood pressure", "systolic blood pressure", "weight", "litter size"]
+FILLER = "the of mice in QTL was associated with and increased levels rats cattle on chromosome".split()
+SEPARATORS = [" ", " ", " ", ", ", ". ", "; ", " (", ") "]
+
+
+@pytest.fixture
+def matcher(tmp_path):
+    path = tmp_path / "traits.txt"
+    path.write_text("\n".join(TRAITS) + "\n", encoding="utf-8")
+    return load_matcher(str(path)), str(path)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """nlp_utils with a blank model, no annotation cache and the default (separate pass) mode."""
+    nlp = spacy.blank("en")
+    monkeypatch.setitem(nlp_utils._nlp_cache, nlp_utils.get_model_name(), nlp)
+    monkeypatch.setattr(nlp_utils, "_annotation_cache", None)
+    monkeypatch.setattr(nlp_utils, "_dictionary_in_pipeline", False)
+    monkeypatch.setattr(nlp_utils, "_trait_dictionary", (None, ""))
+    return nlp
+
+
+def use_pipeline_component(monkeypatch, nlp, path, version):
+    """Switch to in-pipeline matching, as a model loaded with dictionary_in_pipeline would be."""
+    monkeypatch.setattr(nlp_utils, "_dictionary_in_pipeline", True)
+    nlp_utils.set_trait_dictionary(path, version)
+    nlp_utils.add_trait_component(nlp)
+
+
+def random_texts(count=300, seed=11):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        words = []
+        for _ in range(rng.randint(1, 15)):
+            word = rng.choice(TRAITS) if rng.random() < 0.4 else rng.choice(FILLER)
+            if rng.random() < 0.2:
+                word = word.upper() if rng.random() < 0.5 else word.title()
+            words.append(word + rng.choice(SEPARATORS))
+        texts.append("".join(words).strip())
+    return texts + ["", "   "]
+
+
+def test_pipeline_matches_equal_separate_pass(monkeypatch, pipeline, matcher):
+    trait_matcher, path = matcher
+    texts = random_texts()
+    separate = nlp_utils.annotate_batch(texts, matcher=trait_matcher, batch_size=32)
+
+    use_pipeline_component(monkeypatch, pipeline, path, trait_matcher.version)
+    in_pipeline = nlp_utils.annotate_batch(texts, matcher=trait_matcher, batch_size=32)
+
+    assert pipeline.get_pipe(nlp_utils.TRAIT_COMPONENT).version == trait_matcher.version
+    assert sum(len(spans) for spans in separate) > len(texts)
+    assert in_pipeline == separate
+
+
+def test_longest_match_wins_in_both_modes(monkeypatch, pipeline, matcher):
+    trait_matcher, path = matcher
+    text = "Systolic blood pressure and body weight gain, not fat."
+    expected = [
+        {"start": 0, "end": 23, "label": "TRAIT", "term": "Systolic blood pressure", "source": "dictionary"},
+        {"start": 28, "end": 44, "label": "TRAIT", "term": "body weight gain", "source": "dictionary"},
+        {"start": 50, "end": 53, "label": "TRAIT", "term": "fat", "source": "dictionary"},
+    ]
+    assert nlp_utils.annotate_batch([text], matcher=trait_matcher) == [expected]
+
+    use_pipeline_component(monkeypatch, pipeline, path, trait_matcher.version)
+    assert nlp_utils.annotate_batch([text], matcher=trait_matcher) == [expected]
+
+
+def test_other_dictionary_version_falls_back_to_separate_pass(monkeypatch, pipeline, matcher, tmp_path):
+    trait_matcher, path = matcher
+    # The component holds a different dictionary (and version) than the matcher in use
+    other = tmp_path / "other.txt"
+    other.write_text("cattle\n", encoding="utf-8")
+    use_pipeline_component(monkeypatch, pipeline, str(other), "another version")
+    spans = nlp_utils.annotate_batch(["Milk yield in cattle"], matcher=trait_matcher)
+
+    assert [s["term"] for s in spans[0]] == ["Milk yield"]
+
+
+def test_reload_swaps_the_matcher_without_changing_the_pipeline(monkeypatch, pipeline, matcher, tmp_path):
+    trait_matcher, path = matcher
+    use_pipeline_component(monkeypatch, pipeline, path, trait_matcher.version)
+    component = pipeline.get_pipe(nlp_utils.TRAIT_COMPONENT)
+    pipe_names, old_phrases = list(pipeline.pipe_names), component.phrases
+    # A doc that went through the pipeline before the reload keeps its matches and version
+    before = pipeline("Milk yield and litter size")
+
+    reloaded = tmp_path / "reloaded.txt"
+    reloaded.write_text("litter size\n", encoding="utf-8")
+    reloaded_matcher = load_matcher(str(reloaded))
+    nlp_utils.set_trait_dictionary(str(reloaded), reloaded_matcher.version)
+
+    assert pipeline.pipe_names == pipe_names
+    assert pipeline.get_pipe(nlp_utils.TRAIT_COMPONENT) is component
+    assert component.phrases is not old_phrases and component.version == reloaded_matcher.version
+    assert [s.text for s in before.spans[nlp_utils.TRAIT_SPAN_KEY]] == ["Milk yield", "litter size"]
+    assert before.user_data[nlp_utils.TRAIT_VERSION_KEY] == trait_matcher.version
+    # Results for the old dictionary version fall back to the separate pass
+    old = nlp_utils.annotate_batch(["Milk yield and litter size"], matcher=trait_matcher)
+    new = nlp_utils.annotate_batch(["Milk yield and litter size"], matcher=reloaded_matcher)
+    assert [s["term"] for s in old[0]] == ["Milk yield", "litter size"]
+    assert [s["term"] for s in new[0]] == ["litter size"]
+
+
+def match_in_fresh_process(pickled_nlp, text):
+    """Runs in a spawned process, which has not imported trait_component yet."""
+    nlp = pickle.loads(pickled_nlp)
+    doc = nlp(text)
+    return [s.text for s in doc.spans[nlp_utils.TRAIT_SPAN_KEY]], doc.user_data[nlp_utils.TRAIT_VERSION_KEY]
+
+
+def test_pipeline_with_component_works_in_spawned_processes(monkeypatch, pipeline, matcher):
+    trait_matcher, path = matcher
+    use_pipeline_component(monkeypatch, pipeline, path, trait_matcher.version)
+
+    with concurrent.futures.ProcessPoolExecutor(
+            1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        terms, version = pool.submit(match_in_fresh_process, pickle.dumps(pipeline),
+                                     "Backfat thickness and milk yield").result(timeout=120)
+
+    assert terms == ["Backfat thickness", "milk yield"]
+    assert version == trait_matcher.version
@@ -0,0 +1,148 @@
+"""EntityIndex queries against a brute-force scan of the same papers."""
+import random
+
+import numpy as np
+import pytest
+
+from entity_index import EntityIndex, entity_key
+
+LABELS = ["TRAIT", "GENE_OR_GENE_PRODUCT", "ORGANISM", "CELL"]
+TERMS = [f"term{i}" for i in range(30)]
+
+
+def random_papers(n=300, seed=7):
+    """(pmid, entity_statistics) pairs; terms are shared between labels, PMIDs are shuffled."""
+    rng = random.Random(seed)
+    pmids = [str(p) for p in rng.sample(range(1, 10 * n), n)]
+    papers = []
+    for pmid in pmids:
+        stats = {}
+        for _ in range(rng.randint(0, 8)):
+            label = rng.choice(LABELS)
+            # Skewed term frequencies, mixed case as entity_statistics may report it
+            term = TERMS[min(int(rng.expovariate(0.15)), len(TERMS) - 1)]
+            term = term.upper() if rng.random() < 0.2 else term
+            stats.setdefault(label, {"terms": []})["terms"].append({"term": term, "count": 1})
+        papers.append((pmid, stats))
+    return papers
+
+
+def brute_force(papers, entities=(), op="and", labels=()):
+    """PMIDs matching the query, newest (largest) PMID first."""
+    result = []
+    for pmid, stats in papers:
+        keys = {entity_key(label, t["term"]) for label, s in stats.items() for t in s["terms"]}
+        terms = {key.split(":", 1)[1] for key in keys}
+
+        def has(entity):
+            label, sep, term = entity.partition(":")
+            if sep and label in LABELS:
+                return entity_key(label, term) in keys
+            return entity.lower() in terms
+
+        hits = [has(e) for e in entities]
+        if entities and not (all(hits) if op == "and" else any(hits)):
+            continue
+        if not all(any(key.startswith(label + ":") for key in keys) for label in labels):
+            continue
+        result.append(pmid)
+    return sorted(result, key=int, reverse=True)
+
+
+@pytest.fixture(scope="module")
+def papers():
+    return random_papers()
+
+
+@pytest.fixture(scope="module")
+def index(papers):
+    return EntityIndex.build(papers)
+
+
+QUERIES = [
+    (["TRAIT:term0"], "and", []),
+    (["TRAIT:term0", "ORGANISM:term1"], "and", []),
+    (["term0", "term2"], "and", []),
+    (["TERM3"], "and", ["CELL"]),
+    (["TRAIT:term0", "term1"], "and", ["ORGANISM", "CELL"]),
+    (["TRAIT:term4", "CELL:term5"], "or", []),
+    (["term6", "GENE_OR_GENE_PRODUCT:term0"], "or", ["TRAIT"]),
+    ([], "and", ["TRAIT", "ORGANISM"]),
+    (["TRAIT:no such term"], "and", []),
+    (["TRAIT:term0", "TRAIT:no such term"], "or", []),
+]
+
+
+@pytest.mark.parametrize("entities,op,labels", QUERIES)
+def test_match_equals_brute_force(papers, index, entities, op, labels):
+    docs = index.match(entities, op, labels)
+
+    assert [index.pmids[d] for d in docs] == brute_force(papers, entities, op, labels)
+
+
+def test_match_without_constraints_is_every_paper(index):
+    assert index.match() is None
+    assert index.search(limit=5)["total"] == len(index)
+
+
+def test_search_pages_newest_first(papers, index):
+    expected = brute_force(papers, ["term0"], "or", ["TRAIT"])
+    pages = [index.search(["term0"], "or", ["TRAIT"], offset=o, limit=7, facet_terms=0)
+             for o in range(0, len(expected) + 7, 7)]
+
+    assert all(page["total"] == len(expected) for page in pages)
+    assert [pmid for page in pages for pmid in page["pmids"]] == expected
+
+
+def test_facets_count_papers_of_the_result(papers, index):
+    entities, labels = ["term1"], ["TRAIT"]
+    matched = set(brute_force(papers, entities, "and", labels))
+    facets = index.search(entities, labels=labels, facet_terms=len(TERMS))["facets"]
+
+    for label in LABELS:
+        counts = {}
+        for pmid, stats in papers:
+            if pmid in matched and label in stats:
+                for term in {t["term"].lower() for t in stats[label]["terms"]}:
+                    counts[term] = counts.get(term, 0) + 1
+        papers_with_label = sum(1 for pmid, stats in papers if pmid in matched and label in stats)
+        if not papers_with_label:
+            assert label not in facets
+            continue
+        assert facets[label]["papers"] == papers_with_label
+        assert {t["term"]: t["count"] for t in facets[label]["terms"]} == counts
+
+
+def test_save_and_load_round_trip(tmp_path, papers, index):
+    path = str(tmp_path / "entity_index.npz")
+    index.save(path)
+    loaded = EntityIndex.load(path)
+
+    assert loaded.pmids == index.pmids
+    assert loaded.entities == index.entities
+    assert np.array_equal(loaded.post_docs, index.post_docs)
+    for entities, op, labels in QUERIES:
+        assert list(loaded.match(entities, op, labels)) == list(index.match(entities, op, labels))
+
+
+def test_app_uses_index_only_for_current_versions(app_versions, client):
+    import nlp_utils
+    app, dictionary = app_versions
+    papers = random_papers(20)
+    pipeline = nlp_utils.pipeline_version("spans")
+    EntityIndex.build(papers, model=pipeline, dict_version=app.trait_matcher.version).save(
+        app.ENTITY_INDEX_PATH)
+
+    app.load_annotation_indexes()
+    assert len(app.entity_index) == len(papers)
+    assert client.get("/entity_search?entity=term0").status_code == 200
+
+    dictionary.write_text("obesity\nmilk yield\n", encoding="utf-8")
+    app.load_traits()
+    assert app.entity_index is None
+    assert client.get("/entity_search?entity=term0").status_code == 503
+
+    EntityIndex.build(papers, model="en_ner_other_model", dict_version=app.trait_matcher.version).save(
+        app.ENTITY_INDEX_PATH)
+    app.load_annotation_indexes()
+    assert app.entity_index is None
@@ -0,0 +1,157 @@
+"""Export formats read back: JSONL records, BioC and BRAT offsets, gzip streams."""
+import gzip
+import io
+import json
+import tarfile
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import export
+import nlp_utils
+from trait_matcher import TraitMatcher
+
+
+def span(text, term, label, source="model", occurrence=0):
+    start = -1
+    for _ in range(occurrence + 1):
+        start = text.index(term, start + 1)
+    return {"start": start, "end": start + len(term), "label": label, "term": term, "source": source}
+
+
+def record(pmid, title, abstract, title_terms, abstract_terms):
+    title_spans = [span(title, *t) for t in title_terms]
+    abstract_spans = [span(abstract, *t) for t in abstract_terms]
+    return {
+        "pmid": pmid, "source": "local", "title": title, "abstract": abstract,
+        "journal": "J. Anim. Sci.", "publication_date": "2020-Jan",
+        "title_spans": title_spans, "abstract_spans": abstract_spans,
+        "entity_statistics": nlp_utils.entity_statistics(title_spans + abstract_spans),
+    }
+
+
+RECORDS = [
+    record("101", "Body weight QTL in mice",
+           "Body weight & fat <mass> were measured in F2 mice; IGF1 affected body weight.",
+           [("Body weight", "TRAIT", "dictionary"), ("mice", "ORGANISM")],
+           [("Body weight", "TRAIT", "dictionary"), ("fat", "TRAIT", "dictionary"),
+            ("mice", "ORGANISM"), ("IGF1", "GENE_OR_GENE_PRODUCT"),
+            ("body weight", "TRAIT", "dictionary")]),
+    # Non-ASCII text before the spans: offsets count characters, not bytes
+    record("102", "Rôle of β-lactoglobulin in milk yield",
+           "Crèche-reared cattle: milk yield and β-lactoglobulin levels.",
+           [("β-lactoglobulin", "GENE_OR_GENE_PRODUCT"), ("milk yield", "TRAIT", "dictionary")],
+           [("cattle", "ORGANISM"), ("milk yield", "TRAIT", "dictionary"),
+            ("β-lactoglobulin", "GENE_OR_GENE_PRODUCT")]),
+    record("103", "No entities here", "", [], []),
+]
+
+
+def exported(fmt, compress=False, records=RECORDS):
+    data = b"".join(export.encode(iter(records), fmt, compress))
+    return gzip.decompress(data) if compress else data
+
+
+def all_spans(rec):
+    """(start, end, label, term) of a record, with offsets into "title\\nabstract"."""
+    offset = len(rec["title"]) + 1
+    return ([(s["start"], s["end"], s["label"], s["term"]) for s in rec["title_spans"]] +
+            [(s["start"] + offset, s["end"] + offset, s["label"], s["term"]) for s in rec["abstract_spans"]])
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_jsonl_round_trip(compress):
+    lines = exported("jsonl", compress).decode("utf-8").splitlines()
+
+    assert [json.loads(line) for line in lines] == RECORDS
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_bioc_offsets_point_at_the_entities(compress):
+    collection = ET.fromstring(exported("bioc", compress))
+    documents = collection.findall("document")
+
+    assert [d.findtext("id") for d in documents] == [r["pmid"] for r in RECORDS]
+    for document, rec in zip(documents, RECORDS):
+        full_text = f"{rec['title']}\n{rec['abstract']}"
+        found = []
+        for passage, kind in zip(document.findall("passage"), ("title", "abstract")):
+            passage_offset = int(passage.findtext("offset"))
+            assert passage.findtext("infon[@key='type']") == kind
+            assert full_text[passage_offset:passage_offset + len(rec[kind])] == rec[kind]
+            assert (passage.findtext("text") or "") == rec[kind]
+            for annotation in passage.findall("annotation"):
+                location = annotation.find("location")
+                start = int(location.get("offset"))
+                end = start + int(location.get("length"))
+                text = annotation.findtext("text")
+                assert full_text[start:end] == text
+                assert (passage.findtext("text") or "")[start - passage_offset:end - passage_offset] == text
+                found.append((start, end, annotation.findtext("infon[@key='type']"), text))
+        assert found == all_spans(rec)
+
+
+def read_tar(data):
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as tar:
+        return {member.name: tar.extractfile(member).read().decode("utf-8") for member in tar}
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_brat_offsets_point_at_the_entities(compress):
+    files = read_tar(exported("brat", compress))
+
+    assert sorted(files) == sorted(["annotation.conf"] + [f"{r['pmid']}.{ext}" for r in RECORDS
+                                                          for ext in ("txt", "ann")])
+    for rec in RECORDS:
+        text = files[f"{rec['pmid']}.txt"]
+        assert text == f"{rec['title']}\n{rec['abstract']}"
+        entities, notes = [], []
+        for line in files[f"{rec['pmid']}.ann"].splitlines():
+            fields = line.split("\t")
+            if line.startswith("T"):
+                label, start, end = fields[1].split(" ")
+                start, end = int(start), int(end)
+                assert text[start:end] == fields[2]
+                entities.append((start, end, label, fields[2]))
+            else:
+                notes.append(fields[2])
+        assert entities == all_spans(rec)
+        assert notes == [s["source"] for s in rec["title_spans"] + rec["abstract_spans"]]
+
+    conf = files["annotation.conf"]
+    entity_section = conf.split("[entities]\n")[1].split("\n\n")[0].split()
+    assert entity_section == ["GENE_OR_GENE_PRODUCT", "ORGANISM", "TRAIT"]
+
+
+def test_gzip_stream_is_one_member_and_chunked():
+    chunks = list(export.encode(iter(RECORDS * 50), "jsonl", compress=True))
+
+    assert len(chunks) > 1
+    assert chunks[0][:2] == b"\x1f\x8b"
+    assert gzip.decompress(b"".join(chunks)) == exported("jsonl", records=RECORDS * 50)
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        list(export.encode(iter(RECORDS), "csv"))
+
+
+def test_annotated_papers_export_with_correct_offsets(monkeypatch):
+    spacy = pytest.importorskip("spacy")
+    monkeypatch.setitem(nlp_utils._nlp_cache, nlp_utils.get_model_name(), spacy.blank("en"))
+    monkeypatch.setattr(nlp_utils, "_annotation_cache", None)
+    monkeypatch.setattr(nlp_utils, "_dictionary_in_pipeline", False)
+    matcher = TraitMatcher(["body weight", "milk yield", "fat"], version="test")
+    papers = [(r["pmid"], {"Title": r["title"], "Abstract": r["abstract"]}, "pubmed") for r in RECORDS]
+
+    records = list(export.annotate_papers(iter(papers), matcher, chunk_size=2))
+    files = read_tar(exported("brat", records=records))
+
+    assert [r["pmid"] for r in records] == ["101", "102", "103"]
+    terms = []
+    for rec in records:
+        text = files[f"{rec['pmid']}.txt"]
+        for start, end, label, term in all_spans(rec):
+            assert text[start:end] == term
+            terms.append(term.lower())
+    assert terms == ["body weight", "body weight", "fat", "body weight", "milk yield", "milk yield"]
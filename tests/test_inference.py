@@ -0,0 +1,68 @@
+"""InferenceService batching, its fallback when the workers cannot start, and gunicorn."""
+import concurrent.futures
+import multiprocessing
+
+import pytest
+
+spacy = pytest.importorskip("spacy")
+
+import nlp_utils
+from inference import InferenceService
+
+TEXTS = [f"Body weight of mice {i} and IGF1 in cattle" for i in range(40)] + ["", "No entities"]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """A blank pipeline with an entity ruler in place of the scispaCy model."""
+    nlp = spacy.blank("en")
+    nlp.add_pipe("entity_ruler").add_patterns([
+        {"label": "ORGANISM", "pattern": "mice"}, {"label": "ORGANISM", "pattern": "cattle"},
+        {"label": "GENE_OR_GENE_PRODUCT", "pattern": "IGF1"}])
+    monkeypatch.setitem(nlp_utils._nlp_cache, nlp_utils.get_model_name(), nlp)
+    monkeypatch.setattr(nlp_utils, "_annotation_cache", None)
+    return nlp
+
+
+def service_with_pool(pool, **kwargs):
+    service = InferenceService(workers=1, **kwargs)
+    # No process has started yet; the pool starts its workers on the first submit
+    service._pool.shutdown()
+    service._pool = pool
+    return service
+
+
+def test_concurrent_requests_share_batches(model):
+    # Threads stand in for the worker processes, which would load the real model
+    service = service_with_pool(concurrent.futures.ThreadPoolExecutor(1), max_batch=16, max_wait_ms=50)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(len(TEXTS)) as callers:
+            results = list(callers.map(service.ner, TEXTS))
+    finally:
+        service.shutdown()
+
+    assert results == nlp_utils.ner_batch(TEXTS)
+    assert [e["term"] for e in results[0]] == ["mice", "IGF1", "cattle"]
+    stats = service.stats()
+    assert stats["requests"] == len(TEXTS) and stats["batches"] < len(TEXTS)
+
+
+def test_broken_pool_falls_back_to_the_calling_thread(model):
+    # The initializer fails in the spawned worker, as a missing model would
+    pool = concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"),
+                                                  initializer=int, initargs=("not a number",))
+    service = service_with_pool(pool, timeout=60)
+    try:
+        assert service.map("ner", TEXTS[:3]) == nlp_utils.ner_batch(TEXTS[:3])
+        assert service.broken
+        assert service.stats()["workers"] == 0
+        assert service.ner(TEXTS[3]) == nlp_utils.ner_batch(TEXTS[3:4])[0]
+    finally:
+        service.shutdown()
+
+
+def test_no_inference_pool_under_gunicorn(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.INFERENCE_CONFIG, "enabled", True)
+    monkeypatch.setattr(app_module, "GUNICORN", True)
+
+    assert app_module.get_inference_service() is None
@@ -0,0 +1,113 @@
+"""ingest.py: gzipped baseline/update files into the paper store, filters, deletions and resuming."""
+import gzip
+
+import pytest
+
+import ingest
+from paper_store import PaperStore
+from search_index import SearchIndex
+
+ARTICLE = """<PubmedArticle><MedlineCitation><PMID Version="1">{pmid}</PMID><Article>
+<ArticleTitle>{title}</ArticleTitle>
+<Abstract><AbstractText>Measured in cohort {pmid}.</AbstractText></Abstract>
+</Article></MedlineCitation></PubmedArticle>"""
+
+TITLES = ["Milk yield in dairy cattle", "Body weight QTL in mice", "Litter size of pigs",
+          "Yield of milk proteins", "Backfat thickness in pigs"]  # by PMID modulo 5
+
+
+def write_xml(path, pmids, deleted=()):
+    articles = "".join(ARTICLE.format(pmid=p, title=TITLES[int(p) % len(TITLES)]) for p in pmids)
+    deletions = "".join(f"<PMID Version=\"1\">{p}</PMID>" for p in deleted)
+    body = f'<?xml version="1.0" ?><PubmedArticleSet>{articles}'
+    if deleted:
+        body += f"<DeleteCitation>{deletions}</DeleteCitation>"
+    body += "</PubmedArticleSet>"
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        f.write(body)
+    return str(path)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PaperStore(str(tmp_path / "papers.db"))
+    yield store
+    store.close()
+
+
+def test_ingest_gzip_file(store, tmp_path):
+    path = write_xml(tmp_path / "pubmed24n0001.xml.gz", [str(i) for i in range(1, 26)])
+
+    assert ingest.ingest_file(store, path, chunk_size=7) == (25, 0)
+    assert len(store) == 25
+    assert store.get("5")["Title"] == "Milk yield in dairy cattle"
+    assert store.get("5")["Abstract"] == "Measured in cohort 5."
+    assert store.queued() == []
+
+
+def test_pmid_and_query_filters(store, tmp_path):
+    path = write_xml(tmp_path / "pubmed.xml", [str(i) for i in range(1, 11)])
+
+    # "milk yield" as a phrase matches PMIDs 5 and 10, not "Yield of milk proteins"
+    assert ingest.ingest_file(store, path, query='"milk yield"') == (2, 0)
+    assert sorted(pmid for pmid, _ in store.items()) == ["10", "5"]
+
+    other = PaperStore(str(tmp_path / "other.db"))
+    assert ingest.ingest_file(other, path, pmids={"1", "3", "6", "99"}, query="mice") == (2, 0)
+    assert sorted(pmid for pmid, _ in other.items()) == ["1", "6"]
+    other.close()
+
+
+def test_update_file_deletes_and_queues(store, tmp_path):
+    ingest.ingest_file(store, write_xml(tmp_path / "base.xml.gz", ["1", "2", "3"]))
+    update = write_xml(tmp_path / "update.xml.gz", ["4", "5"], deleted=["2", "5"])
+
+    assert ingest.ingest_file(store, update, queue_annotation=True) == (2, 2)
+    assert sorted(pmid for pmid, _ in store.items()) == ["1", "3", "4"]
+    # A deleted paper is not left in the annotation queue
+    assert [paper["PMID"] for paper in store.queued()] == ["4"]
+
+
+def test_interrupted_ingest_resumes_after_the_last_checkpoint(store, tmp_path, monkeypatch):
+    path = write_xml(tmp_path / "pubmed.xml.gz", [str(i) for i in range(1, 21)])
+    parsed = []
+    parse_article = ingest.parse_article
+
+    def interrupt_after(count):
+        def parse(elem):
+            if len(parsed) == count:
+                raise KeyboardInterrupt
+            paper = parse_article(elem)
+            parsed.append(paper["PMID"])
+            return paper
+        return parse
+
+    monkeypatch.setattr(ingest, "parse_article", interrupt_after(12))
+    with pytest.raises(KeyboardInterrupt):
+        ingest.ingest_file(store, path, chunk_size=5)
+    # Two full chunks were checkpointed; the two records after them were not
+    assert len(store) == 10
+    assert store.file_progress(path, (tmp_path / "pubmed.xml.gz").stat().st_size) == (10, False)
+
+    parsed.clear()
+    monkeypatch.setattr(ingest, "parse_article", interrupt_after(-1))
+    assert ingest.ingest_file(store, path, chunk_size=5) == (10, 0)
+    assert parsed == [str(i) for i in range(11, 21)]
+    assert len(store) == 20
+
+    # A completed file is skipped on the next run
+    assert ingest.ingest_file(store, path, chunk_size=5) == (0, 0)
+    assert parsed == [str(i) for i in range(11, 21)]
+
+
+def test_main_rebuilds_the_search_index(tmp_path):
+    db, index = str(tmp_path / "papers.db"), str(tmp_path / "search_index.bin")
+    first = write_xml(tmp_path / "a.xml.gz", ["1", "2"])
+    second = write_xml(tmp_path / "b.xml.gz", ["3", "4"])
+
+    assert ingest.main([first, second, "--db", db, "--search-index", index]) == 0
+
+    loaded = SearchIndex.load(index)
+    assert loaded.corpus_version == PaperStore(db).version()
+    assert sorted(pmid for pmid, _ in loaded.search("pigs")[0]) == ["2", "4"]
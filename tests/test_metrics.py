@@ -0,0 +1,102 @@
+"""Prometheus exposition of metrics.py, per-stage timings on /metrics and Server-Timing headers."""
+import re
+
+import pytest
+
+import metrics
+import nlp_utils
+from pubmed_cache import PubMedCache
+
+
+def test_histogram_buckets_are_cumulative():
+    latency = metrics.Histogram("latency_seconds", "Latency", ["route"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, route="/a")
+    latency.observe(0.2, route="/b")
+
+    samples = {(name, tuple(sorted(labels.items()))): value for name, labels, value in latency.samples()}
+    assert samples[("latency_seconds_bucket", (("le", "0.1"), ("route", "/a")))] == 2
+    assert samples[("latency_seconds_bucket", (("le", "1.0"), ("route", "/a")))] == 3
+    assert samples[("latency_seconds_bucket", (("le", "+Inf"), ("route", "/a")))] == 4
+    assert samples[("latency_seconds_count", (("route", "/a"),))] == 4
+    assert samples[("latency_seconds_sum", (("route", "/a"),))] == pytest.approx(3.65)
+    assert samples[("latency_seconds_count", (("route", "/b"),))] == 1
+
+
+def test_render_text_format(monkeypatch):
+    monkeypatch.setattr(metrics, "_metrics", [])
+    monkeypatch.setattr(metrics, "_collectors", [])
+    requests = metrics.counter("requests_total", "Requests", ["path"])
+    requests.inc(path='/say "hi"\\')
+    requests.inc(2, path="/")
+
+    def broken():
+        raise RuntimeError("collector failed")
+        yield
+
+    metrics.register_collector(broken)
+    metrics.register_collector(lambda: [("cache_entries", "gauge", "Entries", [({}, 7)])])
+
+    assert metrics.render() == (
+        "# HELP requests_total Requests\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{path="/say \\"hi\\"\\\\"} 1\n'
+        'requests_total{path="/"} 2\n'
+        "# HELP cache_entries Entries\n"
+        "# TYPE cache_entries gauge\n"
+        "cache_entries 7\n"
+    )
+
+
+def sample(text, name, **labels):
+    """Value of one sample in a /metrics body, or 0 if it is absent."""
+    wanted = {f'{k}="{v}"' for k, v in labels.items()}
+    for line in text.splitlines():
+        match = re.match(r"(\w+)(?:\{(.*)\})? (\S+)$", line)
+        if match and match.group(1) == name and wanted <= set(filter(None, (match.group(2) or "").split(","))):
+            return float(match.group(3))
+    return 0.0
+
+
+def test_visualize_reports_each_stage(client):
+    before = client.get("/metrics").get_data(as_text=True)
+    response = client.get("/visualize/101")
+    after = client.get("/metrics").get_data(as_text=True)
+
+    stages = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+    assert stages == ["paper_store", "response_cache", "ner", "find_traits", "deduplicate",
+                      "statistics", "span_html", "serialize", "total"]
+    for entry in response.headers["Server-Timing"].split(", "):
+        assert re.fullmatch(r"\w+;dur=\d+\.\d\d", entry)
+    for stage in stages[:-1]:
+        labels = {"route": "/visualize/<pmid>", "stage": stage}
+        assert sample(after, "traitviz_stage_seconds_count", **labels) == \
+            sample(before, "traitviz_stage_seconds_count", **labels) + 1
+    # Requests are labelled by URL rule, not by path
+    labels = {"route": "/visualize/<pmid>", "method": "GET", "status": "200"}
+    assert sample(after, "traitviz_request_seconds_count", **labels) == \
+        sample(before, "traitviz_request_seconds_count", **labels) + 1
+    assert 'route="/visualize/101"' not in after
+
+
+def test_cache_counters_and_model_stats(app_module, client, monkeypatch, tmp_path):
+    cache = PubMedCache(str(tmp_path / "pubmed_cache.db"))
+    cache.put("1", {"PMID": "1"})
+    cache.get("1")
+    cache.get("2")
+    monkeypatch.setattr(app_module, "get_pubmed_cache", lambda: cache)
+    monkeypatch.setitem(nlp_utils._model_stats, "en_core_web_sm", {"load_seconds": 1.5, "rss_mb": 40.0})
+    text = client.get("/metrics").get_data(as_text=True)
+
+    assert sample(text, "traitviz_pubmed_cache_hits_total") == 1
+    assert sample(text, "traitviz_pubmed_cache_misses_total") == 1
+    assert sample(text, "traitviz_model_load_seconds", model="en_core_web_sm") == 1.5
+    assert sample(text, "traitviz_model_rss_megabytes", model="en_core_web_sm") == 40.0
+    assert sample(text, "traitviz_trait_dictionary_traits") == len(app_module.trait_matcher)
+
+
+def test_server_timing_and_metrics_can_be_disabled(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, "METRICS_CONFIG", {"enabled": False, "server_timing": False})
+
+    assert "Server-Timing" not in client.get("/visualize/102").headers
+    assert client.get("/metrics").status_code == 404
@@ -0,0 +1,95 @@
+"""The spaCy model registry: lazy import, one load per model shared by all callers, warmup and stats."""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import nlp_utils
+
+spacy = pytest.importorskip("spacy")
+
+
+@spacy.Language.component("test_registry_parser")
+def attach_to_first_token(doc):
+    """Stands in for a parser: every token depends on the first one."""
+    for token in doc[1:]:
+        token.head = doc[0]
+        token.dep_ = "dep"
+    if len(doc):
+        doc[0].dep_ = "ROOT"
+    return doc
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """An empty registry whose spacy.load() returns blank pipelines and records each call."""
+    calls = []
+
+    def load(name, **options):
+        calls.append((name, options))
+        time.sleep(0.05)  # long enough for concurrent callers to overlap
+        nlp = spacy.blank("en")
+        nlp.add_pipe("test_registry_parser", name="parser")
+        return nlp
+
+    monkeypatch.setattr(nlp_utils, "_nlp_cache", {})
+    monkeypatch.setattr(nlp_utils, "_model_stats", {})
+    monkeypatch.setattr(nlp_utils, "_annotation_cache", None)
+    monkeypatch.setattr(nlp_utils, "_dictionary_in_pipeline", False)
+    monkeypatch.setattr(spacy, "load", load)
+    return calls
+
+
+def test_importing_nlp_utils_does_not_import_spacy():
+    code = "import sys, nlp_utils; print('spacy' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(nlp_utils.__file__))
+
+    assert result.stdout.strip() == "False"
+
+
+def test_each_model_loads_once_under_concurrent_use(loads):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(nlp_utils.get_model(nlp_utils.PARSER_MODEL)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert loads == [(nlp_utils.PARSER_MODEL, {})]
+    assert all(nlp is results[0] for nlp in results)
+
+
+def test_parser_is_shared_by_dependencies_and_displacy(loads):
+    nlp_utils.get_dependencies("Body weight was measured in mice.")
+    nlp_utils.dependencies_batch(["Milk yield was recorded.", "Fat was scored."])
+    svg = nlp_utils.render_displacy("Litter size was counted.")
+
+    assert "<svg" in svg and "Litter" in svg
+    assert [name for name, _ in loads] == [nlp_utils.PARSER_MODEL]
+
+
+def test_ner_model_loads_without_unused_components(loads):
+    nlp_utils.ner_batch(["Body weight in mice", "Milk yield in cattle"])
+    nlp_utils.ner_batch(["Fat"])
+
+    assert loads == [(nlp_utils.get_model_name(), {"disable": ["tagger", "lemmatizer"]})]
+
+
+def test_warmup_loads_both_models_and_reports_stats(loads):
+    stats = nlp_utils.warmup()
+
+    assert sorted(name for name, _ in loads) == sorted([nlp_utils.get_model_name(), nlp_utils.PARSER_MODEL])
+    assert sorted(stats) == sorted([nlp_utils.get_model_name(), nlp_utils.PARSER_MODEL])
+    for model in stats.values():
+        assert model["load_seconds"] >= 0.05
+        assert "rss_mb" in model
+    # Later calls reuse the loaded models
+    nlp_utils.warmup()
+    assert len(loads) == 2
+    stats[nlp_utils.PARSER_MODEL]["load_seconds"] = -1
+    assert nlp_utils.model_stats()[nlp_utils.PARSER_MODEL]["load_seconds"] >= 0.05
@@ -0,0 +1,76 @@
+"""PaperStore contents and versioning, and search index rebuilds when the store changes."""
+import json
+import os
+
+import pytest
+
+from paper_store import PaperStore
+from search_index import load_index
+
+
+def paper(pmid, title, abstract="An abstract about body weight."):
+    return {"PMID": pmid, "Title": title, "Abstract": abstract}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PaperStore(str(tmp_path / "papers.db"))
+    store.put_many([paper("1", "Milk yield in cattle"), paper("2", "Backfat thickness in pigs")])
+    yield store
+    store.close()
+
+
+def test_get_contains_and_items(store):
+    assert store.get("1")["Title"] == "Milk yield in cattle"
+    assert store.get("3") is None
+    assert "2" in store and "3" not in store
+    assert len(store) == 2
+    assert [pmid for pmid, _ in store.items(batch_size=1)] == ["1", "2"]
+
+
+def test_version_changes_on_insert_update_and_delete(store):
+    versions = [store.version()]
+    store.put_many([paper("3", "Litter size in sheep")])
+    versions.append(store.version())
+    # Same PMID, new title: an upsert that keeps the row count and the largest id
+    store.put_many([paper("1", "Milk protein yield in cattle")])
+    versions.append(store.version())
+    store.save_progress("update.xml", 10, 1, True, deleted=["2"])
+    versions.append(store.version())
+
+    assert len(set(versions)) == len(versions)
+    assert store.get("1")["Title"] == "Milk protein yield in cattle"
+
+
+def test_version_unchanged_by_identical_reimport(store, tmp_path):
+    path = tmp_path / "QTL_text.json"
+    path.write_text(json.dumps([store.get("1"), store.get("2")]), encoding="utf-8")
+    before = store.version()
+
+    assert store.import_json(str(path)) == 2
+    assert store.version() == before
+
+
+def test_version_survives_reopening(store):
+    store.put_many([paper("1", "Edited title")])
+    version = store.version()
+
+    assert PaperStore(store.path).version() == version
+
+
+def test_load_index_rebuilds_after_an_update(store, tmp_path):
+    path = str(tmp_path / "search_index.bin")
+    index = load_index(path, store)
+    assert [pmid for pmid, _ in index.search("milk")[0]] == ["1"]
+    mtime = os.stat(path).st_mtime_ns
+
+    # Unchanged store: the saved index is reused
+    assert load_index(path, store).corpus_version == index.corpus_version
+    assert os.stat(path).st_mtime_ns == mtime
+
+    store.put_many([paper("1", "Litter size in sheep")])
+    rebuilt = load_index(path, store)
+
+    assert rebuilt.corpus_version == store.version() != index.corpus_version
+    assert rebuilt.search("milk")[0] == []
+    assert [pmid for pmid, _ in rebuilt.search("litter size")[0]] == ["1"]
@@ -0,0 +1,54 @@
+"""Prefork serving: gunicorn.conf.py settings and the app's fork hooks."""
+import gc
+import os
+import runpy
+import sqlite3
+
+import pytest
+
+CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+
+@pytest.fixture
+def conf_env(monkeypatch, tmp_path):
+    """Run gunicorn.conf.py from a directory without config.json, restoring env and gc afterwards."""
+    monkeypatch.chdir(tmp_path)
+    for name in ("TRAITVIZ_PREFORK", "TRAITVIZ_GUNICORN", "TRAITVIZ_PRELOAD", "WEB_CONCURRENCY"):
+        monkeypatch.delenv(name, raising=False)
+    yield monkeypatch
+    gc.enable()
+    for name in ("TRAITVIZ_PREFORK", "TRAITVIZ_GUNICORN"):
+        os.environ.pop(name, None)
+
+
+def test_preload_loads_in_the_master_without_gc(conf_env):
+    conf_env.setenv("WEB_CONCURRENCY", "3")
+    settings = runpy.run_path(CONF)
+
+    assert settings["preload_app"] is True
+    assert settings["workers"] == 3 and settings["worker_class"] == "gthread"
+    assert os.environ["TRAITVIZ_PREFORK"] == "1"
+    assert os.environ["TRAITVIZ_GUNICORN"] == "1"
+    assert not gc.isenabled()
+
+
+def test_without_preload_workers_load_the_app(conf_env):
+    conf_env.setenv("TRAITVIZ_PRELOAD", "0")
+    settings = runpy.run_path(CONF)
+
+    assert settings["preload_app"] is False
+    assert "TRAITVIZ_PREFORK" not in os.environ
+    # Still no inference pool per worker
+    assert os.environ["TRAITVIZ_GUNICORN"] == "1"
+    assert gc.isenabled()
+
+
+def test_before_fork_closes_connections_that_reopen_on_use(app_module):
+    store = app_module.paper_store
+    conn = store._conn()
+
+    app_module.before_fork()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    assert store.get("101")["Title"] == "Body weight QTL in mice"
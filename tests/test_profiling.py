@@ -0,0 +1,107 @@
+"""Per-request profiling: the profilers, the bounded profile directory and the admin-only flag."""
+import marshal
+import pstats
+import time
+
+import pytest
+
+import profiling
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+    return "done"
+
+
+def test_sampling_profile_is_folded_stacks():
+    result, data, extension = profiling.profile_call(lambda: busy_wait(0.1), "sample", interval_ms=1)
+
+    assert (result, extension) == ("done", "folded")
+    lines = data.decode("utf-8").splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+        # Only the profiled thread is sampled, not the sampler itself
+        assert "_run (profiling.py:" not in stack
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines if "busy_wait (test_profiling.py:" in line) >= 10
+
+
+def test_cprofile_profile_loads_with_pstats(tmp_path):
+    result, data, extension = profiling.profile_call(lambda: busy_wait(0.01), "cprofile")
+    path = tmp_path / "request.prof"
+    path.write_bytes(data)
+
+    assert (result, extension) == ("done", "prof")
+    stats = pstats.Stats(str(path))
+    assert any(func[2] == "busy_wait" for func in stats.stats)
+    assert marshal.loads(data) == stats.stats
+
+
+def test_failing_call_raises_and_stops_the_sampler():
+    with pytest.raises(ZeroDivisionError):
+        profiling.profile_call(lambda: 1 / 0, "sample")
+
+
+def test_profile_store_is_bounded(tmp_path):
+    store = profiling.ProfileStore(str(tmp_path / "profiles"), max_files=3)
+    names = [store.save(f"visualize-{i}/../x", b"data", "folded") for i in range(5)]
+
+    assert len(store.list()) == 3
+    assert all(name.endswith("-visualize-%d_x.folded" % i) for i, name in enumerate(names))
+    kept = store.list()[0]["name"]
+    assert store.path(kept) == str(tmp_path / "profiles" / kept)
+    assert store.path("../" + kept) is None
+    assert store.path("missing.folded") is None
+
+
+@pytest.fixture
+def profiled_app(app_module, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(app_module, "PROFILING_CONFIG", {
+        "enabled": True, "directory": str(tmp_path / "profiles"), "max_files": 10, "interval_ms": 1})
+    monkeypatch.setattr(app_module, "_profile_store", None)
+    return app_module
+
+
+ADMIN = {"X-Admin-Token": "secret"}
+
+
+@pytest.mark.parametrize("mode, extension", [("sample", "folded"), ("cprofile", "prof")])
+def test_admin_request_is_profiled(profiled_app, client, mode, extension):
+    plain = client.get("/visualize/101")
+    response = client.get(f"/visualize/101?profile={mode}", headers=ADMIN)
+
+    assert response.status_code == 200
+    assert response.get_json() == plain.get_json()
+    assert "X-Profile" not in plain.headers
+    name = response.headers["X-Profile"]
+    assert name.endswith(f"-visualize_get-101.{extension}")
+
+    listed = client.get("/admin/profiles", headers=ADMIN).get_json()["profiles"]
+    assert [p["name"] for p in listed] == [name]
+    download = client.get(f"/admin/profiles/{name}", headers=ADMIN)
+    assert download.status_code == 200
+    # A request shorter than the sampling interval leaves an empty folded profile
+    with open(profiled_app.get_profile_store().path(name), "rb") as f:
+        assert download.data == f.read()
+    assert client.get("/admin/profiles/missing.prof", headers=ADMIN).status_code == 404
+
+
+def test_profile_header_on_post(profiled_app, client):
+    response = client.post("/visualize", data={"pmid": "102"}, headers=dict(ADMIN, **{"X-Profile": "1"}))
+
+    assert response.status_code == 200
+    assert response.headers["X-Profile"].endswith("-visualize.folded")
+
+
+def test_profiling_requires_admin_and_config(profiled_app, client, monkeypatch):
+    assert client.get("/visualize/101?profile=sample").status_code == 403
+    assert client.get("/visualize/101?profile=sample", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.get("/visualize/101?profile=perf", headers=ADMIN).status_code == 400
+    monkeypatch.setitem(profiled_app.PROFILING_CONFIG, "enabled", False)
+    assert client.get("/visualize/101?profile=sample", headers=ADMIN).status_code == 403
+    assert client.get("/admin/profiles", headers=ADMIN).get_json() == {"profiles": []}
@@ -0,0 +1,133 @@
+"""PubMedCache expiry, LRU eviction, legacy import and concurrent writers."""
+import concurrent.futures
+import json
+import multiprocessing
+import threading
+
+import pytest
+
+import pubmed_cache
+from pubmed_cache import PubMedCache
+
+
+def paper(pmid):
+    return {"PMID": pmid, "Title": f"Paper {pmid}", "Abstract": "Milk yield in cattle."}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable time.time() for the cache module."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(pubmed_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = PubMedCache(str(tmp_path / "cache.db"))
+    cache.put("1", paper("1"))
+
+    assert cache.get("1") == paper("1")
+    assert cache.get("2") is None
+    assert "1" in cache and "2" not in cache
+    assert len(cache) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = PubMedCache(str(tmp_path / "cache.db"), ttl=100)
+    cache.put("1", paper("1"))
+    clock[0] += 50
+    cache.put("2", paper("2"))
+
+    clock[0] += 60
+    assert cache.get("1") is None and "1" not in cache
+    assert cache.get("2") == paper("2")
+    assert cache.evict() == 1
+    assert len(cache) == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = PubMedCache(str(tmp_path / "cache.db"), max_entries=3)
+    for pmid in "1234":
+        cache.put(pmid, paper(pmid))
+        clock[0] += pubmed_cache._TOUCH_INTERVAL + 1
+    # Reading "1" makes "2" the least recently used entry
+    cache.get("1")
+
+    assert cache.evict() == 1
+    assert sorted(pmid for pmid in "1234" if pmid in cache) == ["1", "3", "4"]
+
+
+def test_eviction_runs_during_writes(tmp_path, clock):
+    cache = PubMedCache(str(tmp_path / "cache.db"), max_entries=10)
+    for i in range(pubmed_cache._EVICT_EVERY):
+        cache.put(str(i), paper(str(i)))
+        clock[0] += 1
+
+    assert len(cache) == 10
+    assert all(str(i) in cache for i in range(pubmed_cache._EVICT_EVERY - 10, pubmed_cache._EVICT_EVERY))
+
+
+def test_reopening_reads_nothing_up_front(tmp_path):
+    path = str(tmp_path / "cache.db")
+    PubMedCache(path).put("1", paper("1"))
+    reopened = PubMedCache(path)
+
+    assert (reopened.hits, reopened.misses) == (0, 0)
+    assert reopened.get("1") == paper("1")
+
+
+def test_import_legacy_json_keeps_newer_entries(tmp_path):
+    legacy = tmp_path / "pubmed_cache.json"
+    legacy.write_text(json.dumps({"1": paper("1"), "2": {"PMID": "2", "Title": "Old"}}), encoding="utf-8")
+    cache = PubMedCache(str(tmp_path / "cache.db"))
+    cache.put("2", paper("2"))
+
+    assert cache.import_json(str(legacy)) == 2
+    assert cache.get("1") == paper("1")
+    assert cache.get("2") == paper("2")
+    assert cache.import_json(str(tmp_path / "missing.json")) == 0
+
+
+def test_threads_write_and_read_concurrently(tmp_path):
+    cache = PubMedCache(str(tmp_path / "cache.db"))
+    errors = []
+
+    def work(thread):
+        try:
+            for i in range(50):
+                pmid = f"{thread}-{i}"
+                cache.put(pmid, paper(pmid))
+                assert cache.get(pmid) == paper(pmid)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            cache.close()
+
+    threads = [threading.Thread(target=work, args=(t,)) for t in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(cache) == 8 * 50
+
+
+def write_papers(path, prefix, count):
+    cache = PubMedCache(path)
+    for i in range(count):
+        cache.put(f"{prefix}-{i}", paper(f"{prefix}-{i}"))
+    cache.close()
+    return count
+
+
+def test_processes_share_one_cache_file(tmp_path):
+    path = str(tmp_path / "cache.db")
+    with concurrent.futures.ProcessPoolExecutor(
+            4, mp_context=multiprocessing.get_context("spawn")) as pool:
+        counts = list(pool.map(write_papers, [path] * 4, "abcd", [50] * 4, timeout=120))
+
+    cache = PubMedCache(path)
+    assert len(cache) == sum(counts)
+    assert cache.get("c-49") == paper("c-49")
@@ -0,0 +1,215 @@
+"""PubMed client against the local E-utilities stub (benchmarks/stub_eutils.py)."""
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import pubmed_utils
+import stub_eutils
+
+
+def start_stub(monkeypatch, fail_every=0, retry_backoff=0.05, cache_path=None):
+    """Serve the stub on a free port and point pubmed_utils at it, without a cache unless given one."""
+    monkeypatch.delenv("NCBI_API_KEY", raising=False)
+    server = stub_eutils.serve(0, fail_every=fail_every)
+    port = server.server_address[1]
+    pubmed_utils.configure({"pubmed_api": {
+        "base_url": f"http://127.0.0.1:{port}/",
+        "cache_results": cache_path is not None,
+        "cache_path": cache_path or "pubmed_cache.db",
+        "max_retries": 3,
+        "retry_backoff": retry_backoff,
+        "timeout": 5,
+    }})
+    return server
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = start_stub(monkeypatch)
+    yield stub_eutils.StubHandler
+    pubmed_utils.close_client()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cached_stub(monkeypatch, tmp_path):
+    server = start_stub(monkeypatch, cache_path=str(tmp_path / "pubmed_cache.db"))
+    yield stub_eutils.StubHandler
+    pubmed_utils.get_cache().close()
+    pubmed_utils.close_client()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def flaky_stub(monkeypatch):
+    """Every second request fails: 429 with Retry-After: 0.1, then 503, alternately."""
+    server = start_stub(monkeypatch, fail_every=2)
+    yield stub_eutils.StubHandler
+    pubmed_utils.close_client()
+    server.shutdown()
+    server.server_close()
+
+
+def efetch_ids(requests):
+    return [parse_qs(urlparse(path).query)["id"][0].split(",")
+            for _, path in requests if "efetch.fcgi" in path]
+
+
+def test_fetch_pubmed_papers_batches_efetch(stub):
+    pmids = [str(i) for i in range(1, 2 * pubmed_utils.EFETCH_BATCH_SIZE + 51)]
+
+    papers = pubmed_utils.fetch_pubmed_papers(pmids)
+
+    assert sorted(papers, key=int) == pmids
+    assert papers["7"]["Title"] == "Body weight QTL mapping in stub cohort 7"
+    batches = efetch_ids(stub.requests)
+    assert [len(b) for b in batches] == [pubmed_utils.EFETCH_BATCH_SIZE] * 2 + [50]
+    assert [p for b in batches for p in b] == pmids
+
+
+def test_fetch_pubmed_papers_requests_each_pmid_once(stub):
+    papers = pubmed_utils.fetch_pubmed_papers(["5", "6", "5"])
+
+    assert sorted(papers) == ["5", "6"]
+    assert efetch_ids(stub.requests) == [["5", "6"]]
+
+
+ARTICLE_SET = """<?xml version="1.0" ?>
+<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2024//EN" "pubmed_240101.dtd">
+<PubmedArticleSet>
+<PubmedArticle><MedlineCitation><PMID Version="1">11</PMID><Article>
+<Journal><JournalIssue><Volume>98</Volume><Issue>4</Issue>
+<PubDate><Year>2020</Year><Month>Apr</Month><Day>7</Day></PubDate></JournalIssue>
+<Title>Journal of Animal Science</Title></Journal>
+<ArticleTitle>Milk yield &amp; fat in <i>Bos taurus</i> &lt;cattle&gt;</ArticleTitle>
+<Pagination><MedlinePgn>1-9</MedlinePgn></Pagination>
+<Abstract><AbstractText Label="BACKGROUND">Milk yield was recorded.</AbstractText>
+<AbstractText Label="RESULTS">A QTL on BTA14 (P&lt;0.01) explained 5% of CO<sub>2</sub> output.</AbstractText>
+<AbstractText></AbstractText></Abstract>
+<AuthorList><Author><LastName>Müller</LastName><ForeName>Anna</ForeName>
+<AffiliationInfo><Affiliation>University of Kiel</Affiliation></AffiliationInfo></Author>
+<Author><CollectiveName>Dairy Genomics Consortium</CollectiveName></Author>
+<Author></Author></AuthorList>
+</Article></MedlineCitation></PubmedArticle>
+<PubmedArticle><MedlineCitation><PMID Version="1">12</PMID><Article>
+<Journal><JournalIssue><PubDate><MedlineDate>1998 Dec-1999 Jan</MedlineDate></PubDate></JournalIssue>
+<Title>Genetics</Title></Journal>
+<ArticleTitle>Litter size in pigs</ArticleTitle>
+<Abstract><AbstractText>An unstructured abstract.</AbstractText></Abstract>
+</Article></MedlineCitation></PubmedArticle>
+<PubmedArticle><MedlineCitation><PMID Version="1">13</PMID><Article>
+</Article></MedlineCitation></PubmedArticle>
+</PubmedArticleSet>"""
+
+
+def test_parse_pubmed_xml_reads_every_article():
+    papers = list(pubmed_utils.parse_pubmed_xml(ARTICLE_SET))
+
+    assert [p["PMID"] for p in papers] == ["11", "12", "13"]
+    first, second, third = papers
+    assert first == {
+        "PMID": "11",
+        "Title": "Milk yield & fat in Bos taurus <cattle>",
+        "Abstract": "BACKGROUND: Milk yield was recorded. "
+                    "RESULTS: A QTL on BTA14 (P<0.01) explained 5% of CO2 output.",
+        "Journal": "Journal of Animal Science. 2020;98(4):1-9",
+        "PublicationDate": "2020 Apr 7",
+        "Authors": [{"name": "Müller Anna", "affiliation": "University of Kiel"},
+                    {"name": "Dairy Genomics Consortium", "affiliation": ""}],
+        "AuthorDisplay": "Müller Anna, Dairy Genomics Consortium",
+        "Category": "External",
+    }
+    assert second["Abstract"] == "An unstructured abstract."
+    assert second["Journal"] == "Genetics. 1998"
+    assert second["PublicationDate"] == "1998"
+    assert (third["Title"], third["Abstract"], third["Journal"], third["AuthorDisplay"]) == (
+        "Title not available", "Abstract not available",
+        "Journal information not available", "No author information available")
+
+
+def test_parse_pubmed_xml_accepts_bytes_and_empty_sets():
+    assert [p["PMID"] for p in pubmed_utils.parse_pubmed_xml(ARTICLE_SET.encode("utf-8"))] == ["11", "12", "13"]
+    assert list(pubmed_utils.parse_pubmed_xml("<PubmedArticleSet></PubmedArticleSet>")) == []
+
+
+def test_search_pubmed_fetches_results_in_one_request(stub):
+    papers = pubmed_utils.search_pubmed("body weight", max_results=10)
+
+    assert [p["PMID"] for p in papers] == [str(i) for i in range(1, 11)]
+    assert papers[0]["Abstract"] == ("BACKGROUND: Body weight and fat mass were measured in F2 mice & rats. "
+                                     "RESULTS: A QTL for blood pressure was found on chromosome 1.")
+    assert efetch_ids(stub.requests) == [[str(i) for i in range(1, 11)]]
+
+
+def test_fetch_pubmed_papers_skips_cached_pmids(cached_stub):
+    first = pubmed_utils.fetch_pubmed_papers(["1", "2"])
+    second = pubmed_utils.fetch_pubmed_papers(["2", "3", "1"])
+
+    assert second["1"] == first["1"] and second["2"] == first["2"]
+    assert sorted(second) == ["1", "2", "3"]
+    assert efetch_ids(cached_stub.requests) == [["1", "2"], ["3"]]
+    assert pubmed_utils.fetch_pubmed_paper("3") == second["3"]
+    assert len(efetch_ids(cached_stub.requests)) == 2
+
+
+def test_eutils_get_retries_429_after_retry_after(flaky_stub):
+    assert "<Id>1</Id>" in pubmed_utils.eutils_get("esearch.fcgi", {"retmax": 1})
+    # Request 2 is answered with 429 and Retry-After: 0.1, request 3 succeeds
+    body = pubmed_utils.eutils_get("efetch.fcgi", {"id": "42"})
+
+    assert "<PMID Version=\"1\">42</PMID>" in body
+    (t2, _), (t3, _) = flaky_stub.requests[1:3]
+    assert len(flaky_stub.requests) == 3
+    assert t3 - t2 >= 0.1
+
+
+def test_eutils_get_retries_503_with_backoff(flaky_stub):
+    for _ in range(2):  # requests 1-3; request 2 (429) is retried as request 3
+        pubmed_utils.eutils_get("esearch.fcgi", {"retmax": 1})
+    # Request 4 is answered with 503 (no Retry-After), request 5 succeeds
+    body = pubmed_utils.eutils_get("efetch.fcgi", {"id": "43"})
+
+    assert "<PMID Version=\"1\">43</PMID>" in body
+    assert len(flaky_stub.requests) == 5
+    (t4, _), (t5, _) = flaky_stub.requests[3:5]
+    assert t5 - t4 >= 0.05  # retry_backoff * 2 ** 0
+
+
+def test_eutils_get_raises_after_max_retries(monkeypatch):
+    server = start_stub(monkeypatch, fail_every=1, retry_backoff=0.01)
+    try:
+        with pytest.raises(pubmed_utils.httpx.HTTPStatusError):
+            pubmed_utils.eutils_get("esearch.fcgi", {"retmax": 1})
+        assert len(stub_eutils.StubHandler.requests) == 4  # first try + max_retries
+    finally:
+        pubmed_utils.close_client()
+        server.shutdown()
+        server.server_close()
+
+
+def test_requests_stay_under_three_per_second(stub):
+    count = 9
+    start = time.monotonic()
+    for i in range(count):
+        pubmed_utils.eutils_get("efetch.fcgi", {"id": str(i)})
+    elapsed = time.monotonic() - start
+
+    # A burst of 3, then one request every 1/3 s
+    assert elapsed >= (count - 3) / 3 - 0.05
+    times = [t for t, _ in stub.requests]
+    for i in range(len(times)):
+        in_window = sum(1 for t in times[i:] if t - times[i] < 1.0)
+        assert in_window <= 6  # 3 from the full bucket plus 3 refilled within the second
+    assert min(b - a for a, b in zip(times[2:], times[3:])) >= 0.3
+
+
+def test_token_bucket_rate():
+    bucket = pubmed_utils.TokenBucket(3)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+
+    assert time.monotonic() - start == pytest.approx(1.0, abs=0.1)
@@ -0,0 +1,63 @@
+"""render_dependencies() from a stored parse against displaCy rendering the parsed Doc."""
+import random
+import re
+
+import pytest
+
+spacy = pytest.importorskip("spacy")
+from spacy import displacy
+from spacy.tokens import Doc
+
+import nlp_utils
+
+WORDS = ["Mice", "body", "weight", "QTL", "was", "mapped", "on", "chromosome", "4", "IGF1"]
+PUNCT = [".", ",", ";", "(", ")", "-", "%", "..."]
+
+
+def random_doc(vocab, rng):
+    n = rng.randint(1, 14)
+    words = [rng.choice(PUNCT) if rng.random() < 0.35 else rng.choice(WORDS) for _ in range(n)]
+    # A random tree: each token attaches to one already in the tree
+    order = list(range(n))
+    rng.shuffle(order)
+    heads = [0] * n
+    heads[order[0]] = order[0]
+    for k, i in enumerate(order[1:], 1):
+        heads[i] = order[rng.randrange(k)]
+    deps = ["ROOT" if heads[i] == i else rng.choice(["nsubj", "punct", "prep", "pobj", "compound"])
+            for i in range(n)]
+    pos = ["PUNCT" if w in PUNCT else rng.choice(["NOUN", "VERB", "NUM", "ADP"]) for w in words]
+    return Doc(vocab, words=words, spaces=[rng.random() < 0.5 for _ in range(n)],
+               heads=heads, deps=deps, pos=pos, tags=pos)
+
+
+def without_ids(svg):
+    ids = set(re.findall(r'id="(?:arrow-)?([0-9a-f]{32})', svg))
+    for render_id in ids:
+        svg = svg.replace(render_id, "ID")
+    return svg
+
+
+def test_render_matches_displacy_on_the_parsed_doc():
+    vocab = spacy.blank("en").vocab
+    rng = random.Random(5)
+    for _ in range(200):
+        doc = random_doc(vocab, rng)
+        parse = nlp_utils._dependencies_from_doc(doc)
+
+        assert displacy.parse_deps(nlp_utils._doc_from_parse(parse)) == displacy.parse_deps(doc)
+        assert without_ids(nlp_utils.render_dependencies(parse)) == \
+            without_ids(displacy.render(doc, style="dep", page=False))
+
+
+def test_punctuation_is_merged_into_the_preceding_word():
+    vocab = spacy.blank("en").vocab
+    doc = Doc(vocab, words=["Mice", "gained", "weight", "."], spaces=[True, True, False, False],
+              heads=[1, 1, 1, 1], deps=["nsubj", "ROOT", "dobj", "punct"],
+              pos=["NOUN", "VERB", "NOUN", "PUNCT"])
+    parse = nlp_utils._dependencies_from_doc(doc)
+
+    words = displacy.parse_deps(nlp_utils._doc_from_parse(parse))["words"]
+    assert [w["text"] for w in words] == ["Mice", "gained", "weight."]
+    svg = nlp_utils.render_dependencies(parse)
+    assert "weight." in svg and svg.count("displacy-token") == 3
@@ -0,0 +1,120 @@
+"""SearchIndex queries (AND, phrases, BM25 order, pages) against a brute-force scan, and the index file."""
+import math
+import random
+
+import pytest
+
+from search_index import B, K1, SearchIndex, parse_query, tokenize
+
+WORDS = "body weight milk yield fat mice cattle pigs qtl chromosome gene litter size blood pressure".split()
+
+
+def random_papers(count=200, seed=5):
+    rng = random.Random(seed)
+    return [(str(1000 + i), {"Title": " ".join(rng.choices(WORDS, k=rng.randint(0, 6))),
+                             "Abstract": " ".join(rng.choices(WORDS, k=rng.randint(0, 30)))})
+            for i in range(count)]
+
+
+PAPERS = random_papers()
+QUERIES = ["milk", "body weight", '"body weight"', '"blood pressure" mice', "qtl gene cattle",
+           '"litter size" "milk yield"', "unknownword", "fat unknownword", '"weight body"']
+
+
+def fields(paper):
+    return tokenize(paper["Title"]), tokenize(paper["Abstract"])
+
+
+def contains(tokens, phrase):
+    return any(tokens[i:i + len(phrase)] == phrase for i in range(len(tokens) - len(phrase) + 1))
+
+
+def brute_force(papers, query):
+    """All matches of a query, ranked by BM25 computed directly from the texts."""
+    clauses = parse_query(query)
+    docs = [(pmid, fields(paper)) for pmid, paper in papers]
+    n = len(docs)
+    avgdl = sum(len(t) + len(a) for _, (t, a) in docs) / n
+    terms = {term for clause in clauses for term in clause}
+    df = {term: sum(term in t + a for _, (t, a) in docs) for term in terms}
+    hits = []
+    for pmid, (title, abstract) in docs:
+        # A phrase may not run from the title into the abstract
+        if not all(contains(title, c) or contains(abstract, c) for c in clauses):
+            continue
+        tokens = title + abstract
+        norm = K1 * (1 - B + B * len(tokens) / avgdl)
+        score = 0.0
+        for term in terms:
+            tf = tokens.count(term)
+            score += math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5)) * tf * (K1 + 1) / (tf + norm)
+        hits.append((pmid, score))
+    return hits
+
+
+@pytest.fixture(scope="module")
+def index():
+    return SearchIndex.build(PAPERS, "v1")
+
+
+def test_parse_query_splits_terms_and_phrases():
+    assert parse_query('Body weight "quantitative trait" QTL-4 ""') == \
+        [["body"], ["weight"], ["quantitative", "trait"], ["qtl", "4"]]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_matches_and_scores_equal_brute_force(index, query):
+    expected = dict(brute_force(PAPERS, query))
+    hits, total = index.search(query, limit=len(PAPERS))
+
+    assert total == len(expected) == len(hits)
+    assert {pmid: pytest.approx(expected[pmid], rel=1e-9) for pmid, _ in hits} == dict(hits)
+    # Highest score first, ties in document order
+    keys = [(-score, pmid) for pmid, score in hits]
+    assert keys == sorted(keys)
+
+
+def test_phrases_do_not_span_title_and_abstract():
+    index = SearchIndex.build([("1", {"Title": "Body", "Abstract": "weight of mice"}),
+                               ("2", {"Title": "Body weight", "Abstract": "of mice"})])
+
+    assert [pmid for pmid, _ in index.search('"body weight"')[0]] == ["2"]
+    assert [pmid for pmid, _ in index.search("body weight")[0]] == ["1", "2"]
+
+
+@pytest.mark.parametrize("limit", [1, 7, 50])
+def test_pages_concatenate_to_the_full_ranking(index, limit):
+    full, total = index.search("body", limit=len(PAPERS))
+    pages = []
+    for offset in range(0, total + limit, limit):
+        page, page_total = index.search("body", offset=offset, limit=limit)
+        assert page_total == total
+        pages.extend(page)
+
+    assert pages == full
+
+
+def test_empty_query_and_empty_index():
+    assert SearchIndex.build(PAPERS).search("  \"\" ") == ([], 0)
+    assert SearchIndex().search("milk") == ([], 0)
+    assert SearchIndex.build([]).search("milk") == ([], 0)
+
+
+def test_saved_index_is_memory_mapped_and_answers_the_same(tmp_path, index):
+    path = str(tmp_path / "search_index.bin")
+    index.save(path)
+    loaded = SearchIndex.load(path)
+
+    assert loaded._mmap is not None
+    assert loaded.corpus_version == "v1"
+    assert loaded.stats() == index.stats()
+    for query in QUERIES:
+        assert loaded.search(query, limit=20) == index.search(query, limit=20)
+
+
+def test_load_rejects_files_of_another_format(tmp_path):
+    path = tmp_path / "search_index.bin"
+    path.write_bytes(b"not an index" + b"\0" * 64)
+
+    with pytest.raises(ValueError):
+        SearchIndex.load(str(path))
@@ -0,0 +1,119 @@
+"""/search/stream: local hits first, PubMed papers as they arrive, then the /search totals."""
+import json
+import time
+
+import pytest
+
+import pubmed_utils
+import stub_eutils
+
+
+def start_stub(latency=0.0, cache_path=None):
+    server = stub_eutils.serve(0, latency=latency)
+    pubmed_utils.configure({"pubmed_api": {
+        "base_url": f"http://127.0.0.1:{server.server_address[1]}/",
+        "cache_results": cache_path is not None,
+        "cache_path": cache_path or "pubmed_cache.db",
+        "timeout": 5,
+    }})
+    return server
+
+
+@pytest.fixture
+def stub(app_module, monkeypatch):
+    monkeypatch.delenv("NCBI_API_KEY", raising=False)
+    servers = []
+
+    def serve(**kwargs):
+        servers.append(start_stub(**kwargs))
+        return stub_eutils.StubHandler
+
+    yield serve
+    pubmed_utils.close_client()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_frames_in_order_with_search_totals(client, stub):
+    stub()
+    form = {"term": "milk yield", "scope": "both", "limit": "5"}
+    frames = ndjson(client.post("/search/stream", data=form))
+
+    assert [f["type"] for f in frames] == ["local"] + ["pubmed"] * 4 + ["summary"]
+    assert [r["pmid"] for r in frames[0]["results"]] == ["102"]
+    assert frames[0]["total_local"] == 1
+    assert [f["result"]["pmid"] for f in frames[1:-1]] == ["1", "2", "3", "4"]
+    assert all(f["result"]["source"] == "pubmed" for f in frames[1:-1])
+
+    expected = client.post("/search", data=form).get_json()
+    streamed = [frames[0]["results"][0]] + [f["result"] for f in frames[1:-1]]
+    assert streamed == expected.pop("results")
+    assert frames[-1] == dict(type="summary", **expected)
+
+
+def test_server_sent_events(client, stub):
+    stub()
+    response = client.post("/search/stream", data={"term": "fat", "scope": "both"},
+                           headers={"Accept": "text/event-stream"})
+    events = response.get_data(as_text=True).split("\n\n")
+
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert events[-1] == ""
+    names = [event.split("\n")[0] for event in events[:-1]]
+    assert names == ["event: local"] + ["event: pubmed"] * 10 + ["event: summary"]
+    summary = json.loads(events[-2].split("\n")[1][len("data: "):])
+    assert (summary["local_count"], summary["pubmed_count"]) == (1, 10)
+
+
+def test_local_frame_does_not_wait_for_pubmed(client, stub):
+    stub(latency=0.5)
+    start = time.perf_counter()
+    response = client.post("/search/stream", data={"term": "body weight", "scope": "both"}, buffered=False)
+    chunks = response.iter_encoded()
+    first = json.loads(next(chunks))
+    first_at = time.perf_counter() - start
+    rest = [json.loads(chunk) for chunk in chunks]
+
+    assert first["type"] == "local" and first["total_local"] == 1
+    assert first_at < 0.4
+    assert rest[-1]["type"] == "summary" and rest[-1]["pubmed_count"] == 10
+    assert time.perf_counter() - start >= 1.0  # esearch and efetch each took 0.5 s
+
+
+def test_deadline_ends_the_stream_with_a_partial_summary(client, stub, app_module, monkeypatch):
+    handler = stub(latency=0.5)
+    monkeypatch.setattr(app_module, "SEARCH_DEADLINE", 0.1)
+    frames = ndjson(client.post("/search/stream", data={"term": "fat", "scope": "both"}))
+
+    assert [f["type"] for f in frames] == ["local", "summary"]
+    assert frames[-1]["partial"] is True
+    assert frames[-1]["timed_out"] == ["pubmed"]
+    assert frames[-1]["local_count"] == 1
+    # Once the stream has ended, the background search sends no efetch request
+    time.sleep(1.0)
+    assert [path.split("?")[0] for _, path in handler.requests] == ["/esearch.fcgi"]
+
+
+def test_cached_papers_need_no_efetch(client, stub, tmp_path):
+    handler = stub(cache_path=str(tmp_path / "pubmed_cache.db"))
+    form = {"term": "obesity", "scope": "pubmed"}
+    first = ndjson(client.post("/search/stream", data=form))
+    second = ndjson(client.post("/search/stream", data=form))
+
+    assert second == first
+    assert [path.split("?")[0] for _, path in handler.requests] == \
+        ["/esearch.fcgi", "/efetch.fcgi", "/esearch.fcgi"]
+    pubmed_utils.get_cache().close()
+
+
+def test_invalid_form_is_rejected(client):
+    response = client.post("/search/stream", data={"term": "  "})
+
+    assert response.status_code == 400
+    assert "error" in response.get_json()
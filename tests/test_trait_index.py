@@ -0,0 +1,77 @@
+"""Memory-mapped trait index: same matches as the in-memory trie, rebuilt on a new version."""
+import os
+import random
+
+import pytest
+
+from trait_matcher import (MappedTraitMatcher, TraitMatcher, build_index, dictionary_version,
+                           index_version, load_matcher)
+from test_trait_matcher import TRAITS, random_text
+
+
+@pytest.fixture
+def dictionary(tmp_path):
+    path = tmp_path / "traits.txt"
+    path.write_text("\n".join(TRAITS) + "\n", encoding="utf-8")
+    return path
+
+
+def test_mapped_matcher_matches_the_in_memory_trie(dictionary, tmp_path):
+    index_path = str(tmp_path / "trait_index.bin")
+    version = build_index(str(dictionary), index_path)
+    mapped = MappedTraitMatcher(index_path)
+    trie = TraitMatcher(TRAITS)
+
+    assert mapped.version == version == dictionary_version(str(dictionary))
+    assert len(mapped) == len(trie)
+    rng = random.Random(9)
+    for _ in range(500):
+        text = random_text(rng)
+        assert mapped.find(text) == trie.find(text), text
+    with pytest.raises(TypeError):
+        mapped.add("new trait")
+
+
+def test_index_is_reused_until_the_dictionary_changes(dictionary, tmp_path):
+    index_path = str(tmp_path / "trait_index.bin")
+    first = load_matcher(str(dictionary), index_path)
+    mtime = os.stat(index_path).st_mtime_ns
+
+    assert load_matcher(str(dictionary), index_path).version == first.version
+    assert os.stat(index_path).st_mtime_ns == mtime
+
+    dictionary.write_text("litter size\nteat number\n", encoding="utf-8")
+    second = load_matcher(str(dictionary), index_path)
+
+    assert second.version != first.version
+    assert index_version(index_path) == second.version
+    assert [m["term"] for m in second.find("Teat number and litter size")] == ["Teat number", "litter size"]
+    # A matcher that still maps the replaced file keeps working
+    assert [m["term"] for m in first.find("Teat number and milk yield")] == ["milk yield"]
+
+
+def test_unreadable_index_is_rebuilt(dictionary, tmp_path):
+    index_path = tmp_path / "trait_index.bin"
+    index_path.write_bytes(b"not an index")
+
+    assert index_version(str(index_path)) is None
+    matcher = load_matcher(str(dictionary), str(index_path))
+    assert matcher.version == dictionary_version(str(dictionary))
+
+
+def test_admin_reload_swaps_in_the_new_version(app_versions, client, monkeypatch):
+    app, dictionary = app_versions
+    monkeypatch.setattr(app, "ADMIN_TOKEN", "secret")
+    old = app.trait_matcher
+
+    assert client.post("/admin/reload_dictionary").status_code == 403
+    unchanged = client.post("/admin/reload_dictionary", headers={"X-Admin-Token": "secret"}).get_json()
+    assert unchanged["reloaded"] is False
+
+    dictionary.write_text("obesity\nteat number\n", encoding="utf-8")
+    reloaded = client.post("/admin/reload_dictionary", headers={"X-Admin-Token": "secret"}).get_json()
+
+    assert reloaded == {"previous_version": old.version, "version": app.trait_matcher.version,
+                        "num_traits": 2, "reloaded": True}
+    assert [m["term"] for m in app.find_traits("Teat number in sows")] == ["Teat number"]
+    assert old.find("Teat number in sows") == []
@@ -0,0 +1,60 @@
+"""TraitMatcher against the per-trait regex loop it replaced, on random texts."""
+import random
+
+import pytest
+
+from bench_trait_matching import legacy_find_traits
+from trait_matcher import TraitMatcher
+
+TRAITS = ["body weight", "body weight gain", "weight", "milk yield", "milk fat yield", "fat",
+          "fat %", "IgG", "β-casein", "blood pressure", "systolic blood pressure", "litter size",
+          "12th rib fat", "hip height", "height", "average daily gain", "daily gain", "Gain",
+          "carcass (hot) weight", "pH", "pH 24h", "CD4+ T cells", "T cells", "back-fat thickness"]
+FILLER = ["the", "of", "mice", "QTL", "cattle", "was", "on", "chromosome", "6", "increased",
+          "weights", "fatty", "heighten", "b", "body", "milk", "blood", "pH7", "cells"]
+SEPARATORS = [" ", " ", " ", "  ", ", ", ". ", "; ", " (", ") ", "-", "/", "\n", "_", "'"]
+
+
+def random_text(rng):
+    parts = []
+    for _ in range(rng.randint(0, 25)):
+        word = rng.choice(TRAITS) if rng.random() < 0.4 else rng.choice(FILLER)
+        roll = rng.random()
+        if roll < 0.15:
+            word = word.upper()
+        elif roll < 0.3:
+            word = word.title()
+        parts.append(word + rng.choice(SEPARATORS))
+    return "".join(parts)
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return TraitMatcher(TRAITS)
+
+
+def test_matches_legacy_regex_loop_on_random_texts(matcher):
+    rng = random.Random(3)
+    texts = [random_text(rng) for _ in range(2000)]
+    found = 0
+    for text in texts:
+        expected = legacy_find_traits(text, TRAITS)
+        assert matcher.find(text) == expected, text
+        found += len(expected)
+    assert found > len(texts)
+
+
+@pytest.mark.parametrize("text, terms", [
+    ("Systolic blood pressure and body weight gain", ["Systolic blood pressure", "body weight gain"]),
+    ("bodyweight, weights and fatty acids", []),
+    ("fat % and FAT", ["fat %", "FAT"]),
+    ("CD4+ T cells; β-CASEIN", ["CD4+ T cells", "β-CASEIN"]),
+    ("", []),
+])
+def test_word_boundaries_and_longest_match(matcher, text, terms):
+    assert [m["term"] for m in matcher.find(text)] == terms
+
+
+def test_span_fields(matcher):
+    assert matcher.find("Milk yield") == [
+        {"start": 0, "end": 10, "label": "TRAIT", "term": "Milk yield", "source": "dictionary"}]
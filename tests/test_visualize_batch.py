@@ -0,0 +1,72 @@
+"""/visualize_batch: local and PubMed papers in one pass, one efetch for the missing PMIDs."""
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import nlp_utils
+import pubmed_utils
+import stub_eutils
+
+
+@pytest.fixture
+def stub(app_module, monkeypatch):
+    monkeypatch.delenv("NCBI_API_KEY", raising=False)
+    server = stub_eutils.serve(0)
+    pubmed_utils.configure({"pubmed_api": {
+        "base_url": f"http://127.0.0.1:{server.server_address[1]}/",
+        "cache_results": False,
+        "timeout": 5,
+    }})
+    yield stub_eutils.StubHandler
+    pubmed_utils.close_client()
+    server.shutdown()
+    server.server_close()
+
+
+def test_missing_pmids_are_fetched_in_one_request(client, stub):
+    response = client.post("/visualize_batch", json={
+        "pmids": ["101", "9001", "102", "9002"],
+        "documents": ["Blood pressure in rats", {"id": "mine", "title": "Fat", "abstract": ""}],
+    })
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert [r["pmid"] for r in data["results"]] == ["101", "9001", "102", "9002", "doc-0", "mine"]
+    assert [r["source"] for r in data["results"]] == ["local", "pubmed", "local", "pubmed", "text", "text"]
+    assert data["errors"] == []
+    efetches = [parse_qs(urlparse(path).query)["id"][0] for _, path in stub.requests
+                if "efetch.fcgi" in path]
+    assert efetches == ["9001,9002"]
+
+
+def test_no_pubmed_request_when_all_pmids_are_local(client, stub):
+    response = client.post("/visualize_batch", json={"pmids": ["101", "102"]})
+
+    assert response.status_code == 200
+    assert stub.requests == []
+
+
+def test_n_process_comes_from_the_config_only(client, app_module, monkeypatch):
+    calls = []
+    annotate_batch = nlp_utils.annotate_batch
+
+    def spy(texts, **kwargs):
+        calls.append(kwargs)
+        return annotate_batch(texts, **kwargs)
+
+    monkeypatch.setattr(nlp_utils, "annotate_batch", spy)
+    monkeypatch.setitem(app_module.NLP_CONFIG, "n_process", 1)
+    response = client.post("/visualize_batch", json={"documents": ["Milk yield"], "n_process": 64,
+                                                     "batch_size": 8})
+
+    assert response.status_code == 200
+    assert calls[0]["n_process"] == 1
+    assert calls[0]["batch_size"] == 8
+
+
+def test_invalid_requests_are_rejected(client, app_module, monkeypatch):
+    monkeypatch.setitem(app_module.NLP_CONFIG, "max_batch_documents", 2)
+
+    assert client.post("/visualize_batch", json={}).status_code == 400
+    assert client.post("/visualize_batch", json={"documents": ["a", "b", "c"]}).status_code == 400
+    assert client.post("/visualize_batch", json={"documents": ["a"], "batch_size": "x"}).status_code == 400
@@ -0,0 +1,84 @@
+"""/visualize ETags: 304 on If-None-Match, the response cache, and new tags for new dictionaries or models."""
+import pytest
+
+import nlp_utils
+from annotation_cache import AnnotationCache
+
+
+@pytest.fixture
+def annotations(app_module, monkeypatch):
+    """Count the papers /visualize annotates."""
+    calls = []
+    visualize_paper = app_module.visualize_paper
+
+    def spy(pmid, *args):
+        calls.append(pmid)
+        return visualize_paper(pmid, *args)
+
+    monkeypatch.setattr(app_module, "visualize_paper", spy)
+    return calls
+
+
+def test_get_and_post_share_a_strong_etag(client, annotations):
+    get = client.get("/visualize/101")
+    post = client.post("/visualize", data={"pmid": "101"})
+
+    assert get.status_code == post.status_code == 200
+    etag, weak = get.get_etag()
+    assert etag and not weak
+    assert post.get_etag() == (etag, False)
+    assert get.get_json() == post.get_json()
+    assert get.get_json()["pmid"] == "101"
+    assert get.headers["Cache-Control"] == "no-cache"
+
+
+def test_if_none_match_answers_304_without_annotating(client, annotations):
+    etag = client.get("/visualize/102").get_etag()[0]
+    response = client.get("/visualize/102", headers={"If-None-Match": f'"{etag}"'})
+
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.get_etag() == (etag, False)
+    assert annotations == ["102"]
+    # Another paper's tag does not match
+    assert client.get("/visualize/101", headers={"If-None-Match": f'"{etag}"'}).status_code == 200
+
+
+def test_response_cache_serves_repeat_views(client, annotations, monkeypatch):
+    monkeypatch.setattr(nlp_utils, "_annotation_cache", AnnotationCache(None))
+    first = client.get("/visualize/101")
+    second = client.post("/visualize", data={"pmid": "101"})
+
+    assert annotations == ["101"]
+    assert second.data == first.data
+    assert second.get_etag() == first.get_etag()
+
+
+def test_dictionary_reload_changes_the_etag(app_versions, client, annotations, monkeypatch):
+    app, dictionary = app_versions
+    monkeypatch.setattr(nlp_utils, "_annotation_cache", AnnotationCache(None))
+    dictionary.write_text("body weight\n", encoding="utf-8")
+    app.load_traits(load_indexes=False)
+    before = client.get("/visualize/101")
+
+    dictionary.write_text("body weight\nfat\n", encoding="utf-8")
+    app.load_traits(load_indexes=False)
+    after = client.get("/visualize/101", headers={"If-None-Match": f'"{before.get_etag()[0]}"'})
+
+    assert after.status_code == 200
+    assert after.get_etag() != before.get_etag()
+    assert annotations == ["101", "101"]
+    terms = [[t["term"] for t in r.get_json()["entity_statistics"]["TRAIT"]["terms"]] for r in (before, after)]
+    assert terms == [["body weight"], ["body weight", "fat"]]
+
+
+def test_etag_covers_paper_content_and_model(app_module, monkeypatch):
+    paper = {"PMID": "101", "Title": "Body weight QTL in mice", "Abstract": "Fat."}
+    matcher = app_module.trait_matcher
+    etag = app_module.visualize_etag("101", paper, "local", matcher)
+
+    assert app_module.visualize_etag("101", dict(paper), "local", matcher) == etag
+    assert app_module.visualize_etag("101", dict(paper, Abstract="Fat mass."), "local", matcher) != etag
+    assert app_module.visualize_etag("101", paper, "pubmed", matcher) != etag
+    monkeypatch.setenv("SCISPACY_MODEL", "en_ner_craft_md")
+    assert app_module.visualize_etag("101", paper, "local", matcher) != etag
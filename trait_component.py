@@ -0,0 +1,55 @@
+"""spaCy pipeline component that matches the trait dictionary during NER.
+
+The factory is registered when this module is imported, so any process
+that unpickles or rebuilds the pipeline (nlp.pipe with n_process > 1, or a
+spawned inference worker) can construct the component again. nlp_utils
+imports this module only when it loads a model, so processes that never
+run spaCy do not import it.
+"""
+from typing import List
+
+from spacy.language import Language
+from spacy.matcher import PhraseMatcher
+
+from nlp_utils import TRAIT_COMPONENT, TRAIT_SPAN_KEY, TRAIT_VERSION_KEY
+
+
+class TraitPhraseMatcher:
+    """Puts trait dictionary matches into doc.spans["traits"].
+
+    Matching is case-insensitive on spaCy tokens (PhraseMatcher on LOWER),
+    so the dictionary is matched during the nlp.pipe pass that finds the
+    model entities, without a second scan of the text. Each doc records
+    the dictionary version it was matched with in doc.user_data.
+    """
+
+    def __init__(self, nlp, name: str = TRAIT_COMPONENT):
+        self.tokenizer = nlp.tokenizer
+        self.vocab = nlp.vocab
+        # (PhraseMatcher or None, dictionary version), replaced as a whole by set_traits()
+        self.phrases = (None, "")
+
+    @property
+    def version(self) -> str:
+        return self.phrases[1]
+
+    def set_traits(self, traits: List[str], version: str) -> None:
+        """Build a matcher for a dictionary and swap it in with one assignment.
+
+        Docs already in the pipeline finish with the matcher they started with.
+        """
+        matcher = PhraseMatcher(self.vocab, attr="LOWER")
+        # Tokenized like the texts, so multi-token traits line up with text tokens
+        matcher.add("TRAIT", list(self.tokenizer.pipe(traits, batch_size=1000)))
+        self.phrases = (matcher, version)
+
+    def __call__(self, doc):
+        matcher, version = self.phrases
+        doc.spans[TRAIT_SPAN_KEY] = matcher(doc, as_spans=True) if matcher is not None else []
+        doc.user_data[TRAIT_VERSION_KEY] = version
+        return doc
+
+
+@Language.factory(TRAIT_COMPONENT)
+def make_trait_phrase_matcher(nlp, name: str) -> TraitPhraseMatcher:
+    return TraitPhraseMatcher(nlp, name)
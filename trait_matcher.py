@@ -0,0 +1,262 @@
+"""Dictionary matcher for trait terms, built once when the dictionary is loaded.
+
+The matcher can also be written to a versioned binary index file
+(``python trait_matcher.py build``). Worker processes memory-map that file
+instead of rebuilding the trie, so the pages are shared between them.
+"""
+import argparse
+import hashlib
+import mmap
+import os
+import re
+import struct
+import tempfile
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+# Maximal runs of word characters, or a single non-word character.
+# Traits and texts are split the same way, so a trait can only ever match
+# on a run of whole tokens of the text.
+_TOKEN_RE = re.compile(r'\w+|\W')
+_WORD_RE = re.compile(r'\w')
+
+
+def _fold(text: str) -> str:
+    """Lowercase text without changing its length, so offsets stay valid."""
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded
+    # A few characters (e.g. 'İ') expand when lowercased; keep those as-is.
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def _is_word(ch: str) -> bool:
+    return _WORD_RE.match(ch) is not None
+
+
+class TraitMatcher:
+    """Finds dictionary traits in text with a single token-trie walk.
+
+    The trie is stored flat: every token-aligned prefix of every (case-folded)
+    trait maps to True if it is a complete trait and False if it is only a
+    prefix of a longer one. Matching starts a walk at each token of the text
+    and stops as soon as the accumulated prefix is unknown, so the cost is
+    roughly linear in the text length and independent of the dictionary size.
+
+    Matches follow the same rules as the old per-trait regex
+    (``(?<!\\w)trait(?!\\w)``, case-insensitive) and the same overlap
+    filtering: the longest match wins at a start offset, then earlier
+    matches win over later overlapping ones.
+    """
+
+    def __init__(self, traits: Iterable[str], version: str = ""):
+        self._prefixes: Dict[str, bool] = {}
+        self.size = 0
+        self.version = version
+        for trait in traits:
+            trait = trait.strip()
+            if not trait:
+                continue
+            self.size += 1
+            self.add(trait)
+
+    def add(self, trait: str) -> None:
+        """Add a single trait to the matcher."""
+        folded = _fold(trait)
+        prefixes = self._prefixes
+        for tok in _TOKEN_RE.finditer(folded):
+            key = folded[:tok.end()]
+            if key not in prefixes:
+                prefixes[key] = False
+        prefixes[folded] = True
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _lookup(self, key: str):
+        """Return True (trait), False (prefix only) or None (unknown)."""
+        return self._prefixes.get(key)
+
+    def find_all(self, text: str) -> List[tuple]:
+        """Return (start, end) of the longest trait match at each start offset."""
+        if not text or not self.size:
+            return []
+
+        folded = _fold(text)
+        n = len(folded)
+        tokens = [(m.start(), m.end()) for m in _TOKEN_RE.finditer(folded)]
+        lookup = self._lookup
+        hits = []
+
+        n_tokens = len(tokens)
+        for i, (start, _) in enumerate(tokens):
+            # (?<!\w): a trait cannot start right after a word character
+            if start > 0 and _is_word(folded[start - 1]):
+                continue
+            best = -1
+            # Indexing, not slicing: a slice would copy the rest of the tokens at every start
+            for j in range(i, n_tokens):
+                end = tokens[j][1]
+                found = lookup(folded[start:end])
+                if found is None:
+                    break
+                # (?!\w): nor end right before one
+                if found and (end == n or not _is_word(folded[end])):
+                    best = end
+            if best > 0:
+                hits.append((start, best))
+        return hits
+
+    def find(self, text: str) -> List[Dict]:
+        """Return non-overlapping trait matches as span dicts."""
+        filtered_matches = []
+        last_match_end = -1
+        # hits are ordered by start and already hold the longest match per start
+        for start, end in self.find_all(text):
+            if start >= last_match_end:
+                filtered_matches.append({
+                    'start': start,
+                    'end': end,
+                    'label': 'TRAIT',
+                    'term': text[start:end],
+                    'source': 'dictionary'
+                })
+                last_match_end = end
+        return filtered_matches
+
+
+# --- Binary index ---
+# Layout: header, then an open-addressing hash table of fixed-size slots
+# keyed by crc32 of the UTF-8 prefix, then the UTF-8 bytes of all prefixes.
+_MAGIC = b"TRAITIDX"
+_FORMAT = 1
+_HEADER = struct.Struct("<8sI16sIIQ")  # magic, format, version, traits, slots, blob offset
+_SLOT = struct.Struct("<IHH")           # blob offset, key length, flag
+_EMPTY, _PREFIX, _TRAIT = 0, 1, 2
+
+
+def dictionary_version(dict_path: str) -> str:
+    """Return a short content hash identifying a version of the dictionary file."""
+    with open(dict_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def read_traits(dict_path: str) -> List[str]:
+    with open(dict_path, "r", encoding="utf-8") as f:
+        return [ln.strip() for ln in f if ln.strip()]
+
+
+def build_index(dict_path: str, index_path: str) -> str:
+    """Build the binary index for a dictionary file and return its version.
+
+    The file is written to a temporary name and renamed into place, so readers
+    never see a partial index and processes that still map the previous
+    version keep working.
+    """
+    version = dictionary_version(dict_path)
+    matcher = TraitMatcher(read_traits(dict_path), version=version)
+
+    entries = [(key.encode("utf-8"), _TRAIT if is_trait else _PREFIX)
+               for key, is_trait in matcher._prefixes.items()]
+    n_slots = 1
+    while n_slots < len(entries) * 2:
+        n_slots <<= 1
+    mask = n_slots - 1
+
+    slots = bytearray(_SLOT.size * n_slots)
+    blob = bytearray()
+    for key, flag in entries:
+        pos = zlib.crc32(key) & mask
+        while _SLOT.unpack_from(slots, pos * _SLOT.size)[2] != _EMPTY:
+            pos = (pos + 1) & mask
+        _SLOT.pack_into(slots, pos * _SLOT.size, len(blob), len(key), flag)
+        blob += key
+
+    blob_offset = _HEADER.size + len(slots)
+    header = _HEADER.pack(_MAGIC, _FORMAT, version.encode("ascii"),
+                          matcher.size, n_slots, blob_offset)
+
+    out_dir = os.path.dirname(os.path.abspath(index_path))
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix=".trait_index.")
+    try:
+        os.chmod(tmp_path, 0o644)
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(slots)
+            f.write(blob)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return version
+
+
+def index_version(index_path: str) -> Optional[str]:
+    """Return the dictionary version stored in an index file, or None."""
+    try:
+        with open(index_path, "rb") as f:
+            raw = f.read(_HEADER.size)
+        magic, fmt, version, _, _, _ = _HEADER.unpack(raw)
+    except (OSError, struct.error):
+        return None
+    if magic != _MAGIC or fmt != _FORMAT:
+        return None
+    return version.decode("ascii")
+
+
+class MappedTraitMatcher(TraitMatcher):
+    """TraitMatcher backed by a memory-mapped index file built by build_index()."""
+
+    def __init__(self, index_path: str):
+        with open(index_path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, version, size, n_slots, blob_offset = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or fmt != _FORMAT:
+            raise ValueError(f"{index_path} is not a trait index (format {_FORMAT})")
+        self.path = index_path
+        self.version = version.decode("ascii")
+        self.size = size
+        self._mask = n_slots - 1
+        self._blob_offset = blob_offset
+
+    def add(self, trait: str) -> None:
+        raise TypeError("MappedTraitMatcher is read-only; rebuild the index instead")
+
+    def _lookup(self, key: str):
+        raw = key.encode("utf-8")
+        mm, mask, blob_offset = self._mm, self._mask, self._blob_offset
+        pos = zlib.crc32(raw) & mask
+        while True:
+            off, length, flag = _SLOT.unpack_from(mm, _HEADER.size + pos * _SLOT.size)
+            if flag == _EMPTY:
+                return None
+            if length == len(raw) and mm[blob_offset + off:blob_offset + off + length] == raw:
+                return flag == _TRAIT
+            pos = (pos + 1) & mask
+
+
+def load_matcher(dict_path: str, index_path: Optional[str] = None) -> TraitMatcher:
+    """Load the matcher for the current version of a dictionary file.
+
+    With an index path, the index is (re)built when it is missing or was built
+    from a different dictionary version, and then memory-mapped. Without one,
+    the trie is built in memory.
+    """
+    if not index_path:
+        return TraitMatcher(read_traits(dict_path), version=dictionary_version(dict_path))
+    if index_version(index_path) != dictionary_version(dict_path):
+        build_index(dict_path, index_path)
+    return MappedTraitMatcher(index_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trait dictionary index tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build the binary trait index")
+    build.add_argument("--dictionary", default="Trait dictionary.txt")
+    build.add_argument("--out", default="trait_index.bin")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        v = build_index(args.dictionary, args.out)
+        print(f"Wrote {args.out} (dictionary version {v})")